@@ -0,0 +1,670 @@
+"""Latency benchmarks of the control loops, on mock pins and local sockets.
+
+Each benchmark measures one path from an input to the reaction of the robot:
+    remote_to_motors    Frame sent to the RemoteReceiver -> motor write.
+    fleet_to_motors     Frame multicast to a fleet of RemoteReceivers ->
+                        motor write by all the robots addressed.
+    line_to_steering    Line sensor pin change -> motor write, through the
+                        LineNavigator in event-driven mode.
+    line_to_steering_polling
+                        Same, with the LineNavigator polling the sensors,
+                        to compare the two modes.
+    echo_to_stop        Falling edge of the ECHO pin -> forward safety stop
+                        set by the ObstacleBreak, across processes.
+    motion_to_ping      Forward command after the motors were stopped ->
+                        first ping of the front sensor, with adaptive
+                        sampling. The pings per second of both sensors
+                        while still and while moving are reported as well.
+    set_command         Duration and throughput of Driver.set_command().
+    bring_up            Time to build all the devices of the manual mode.
+    interrupt_to_stop   Start of the teardown, as on Ctrl-C -> motors
+                        stopped, with the devices of the manual mode
+                        running.
+    import_remote       Time to import run_remote.py in a fresh interpreter.
+    import_robot        Time to import run_robot.py in a fresh interpreter.
+
+The line sensor latency includes the smoothing of gpiozero's LineSensor,
+which is there on the robot as well. The import benchmarks also check that
+importing the entry points does not load any hardware library: the devices
+load them when they are built (see robot.hardware).
+
+For each benchmark the percentiles of the latency and the CPU time spent are
+reported. Results can be stored as a baseline, which later runs are compared
+against: see run_benchmarks.py.
+"""
+import ctypes
+import json
+import multiprocessing as mp
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+from gpiozero import Device
+from gpiozero.pins.mock import MockFactory, MockPWMPin
+
+import robot.hardware as hardware
+import robot.mock_gpio as mock_gpio
+import robot.recording as recording
+
+# Maximum time to wait for a reaction, in seconds.
+_REACTION_TIMEOUT_s = 2.
+
+# Libraries which importing the entry points must not load.
+_HARDWARE_MODULES = ('RPi', 'gpiozero', 'pynput')
+
+_IMPORT_SCRIPT = '''
+import json, sys, time
+start_s = time.perf_counter()
+import {module}
+elapsed_s = time.perf_counter() - start_s
+print(json.dumps([elapsed_s, [name for name in {hardware_modules}
+                              if name in sys.modules]]))
+'''
+
+
+class _MotorWriteProbe:
+    """Recorder for a Driver, signalling every motor write.
+    """
+
+    def __init__(self):
+        self.write_ns = None
+        self.written = threading.Event()
+
+    def record(self, kind, source=0, value=0, x=0., y=0., timestamp_ns=None):
+        if kind == recording.KIND_MOTORS:
+            self.write_ns = time.perf_counter_ns()
+            self.written.set()
+
+
+def _install_mocks():
+    # The devices get mock pins, fresh ones for every benchmark.
+    hardware.use_backend('mock')
+    Device.pin_factory = MockFactory(pin_class=MockPWMPin)
+
+
+def _cpu_s():
+    return sum(resource.getrusage(who).ru_utime
+               + resource.getrusage(who).ru_stime
+               for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+
+def _percentile(sorted_values, fraction):
+    idx = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[idx]
+
+
+def summarize(latencies_s, cpu_s):
+    """Computes the statistics of a benchmark.
+
+    Args:
+        latencies_s (list): The measured latencies, in seconds.
+        cpu_s (float): CPU time spent, in seconds.
+
+    Returns:
+        dict: Number of samples, p50, p99 and maximum latency and CPU time,
+            in seconds.
+    """
+    latencies_s = sorted(latencies_s)
+    return {
+        'n': len(latencies_s),
+        'p50_s': _percentile(latencies_s, 0.50),
+        'p99_s': _percentile(latencies_s, 0.99),
+        'max_s': latencies_s[-1],
+        'cpu_s': cpu_s,
+    }
+
+
+def remote_to_motors(num_samples=2000):
+    """Sends frames to a RemoteReceiver alternating the forward command, and
+    measures the time until the motors are written.
+    """
+    _install_mocks()
+
+    import robot.devices.led_status as ls
+    import robot.devices.remote.protocol as protocol
+    import robot.devices.remote.remote_receiver as rr
+    import robot.motion.driver as dvr
+    import robot.network as network
+
+    probe = _MotorWriteProbe()
+    driver = dvr.Driver(recorder=probe)
+    status_led = ls.StatusLed()
+    receiver = rr.RemoteReceiver(driver=driver,
+                                 status_led=status_led,
+                                 ip='127.0.0.1')
+    receiver_thread = threading.Thread(target=receiver.run,
+                                       name='RemoteReceiver')
+    client = network.UDPClient(ip='127.0.0.1', port=network.PORT)
+    session = protocol.new_session()
+
+    def _send(sequence, commands, flags=0):
+        client.send(protocol.encode(protocol.Frame(flags=flags,
+                                                   session=session,
+                                                   sequence=sequence,
+                                                   commands=commands)))
+
+    latencies_s = []
+    receiver_thread.start()
+    cpu_start_s = _cpu_s()
+    try:
+        for sequence in range(1, num_samples + 1):
+            probe.written.clear()
+            start_ns = time.perf_counter_ns()
+            _send(sequence, protocol.FORWARD if sequence % 2 else 0)
+            if probe.written.wait(_REACTION_TIMEOUT_s):
+                latencies_s.append((probe.write_ns - start_ns) * 1e-9)
+        cpu_s = _cpu_s() - cpu_start_s
+
+    finally:
+        _send(num_samples + 1, 0, flags=protocol.FLAG_SHUTDOWN)
+        receiver_thread.join()
+        client.close()
+        status_led.close()
+        driver.close()
+
+    return summarize(latencies_s, cpu_s)
+
+
+def fleet_to_motors(num_robots=16, num_samples=400):
+    """Multicasts frames to a fleet of RemoteReceivers served by a single
+    event loop, alternating between addressing all the robots and a single
+    one, and measures the time until the motors of the last robot addressed
+    are written.
+
+    The latencies are the ones of the frames to all the robots. Writes by
+    robots which were not addressed are counted as foreign writes.
+    """
+    _install_mocks()
+
+    import asyncio
+
+    import robot.devices.led_status as ls
+    import robot.devices.remote.protocol as protocol
+    import robot.devices.remote.remote_receiver as rr
+    import robot.motion.driver as dvr
+    import robot.network as network
+
+    probes = {}
+    drivers = []
+    status_leds = []
+    receivers = []
+    for robot_id in range(1, num_robots + 1):
+        # Every robot has its own pins.
+        Device.pin_factory = MockFactory(pin_class=MockPWMPin)
+        probes[robot_id] = _MotorWriteProbe()
+        drivers.append(dvr.Driver(recorder=probes[robot_id]))
+        status_leds.append(ls.StatusLed())
+        receivers.append(rr.RemoteReceiver(driver=drivers[-1],
+                                           status_led=status_leds[-1],
+                                           ip='127.0.0.1',
+                                           robot_id=robot_id,
+                                           groups=1 << (robot_id % 8)))
+
+    async def _serve_all():
+        await asyncio.gather(*(receiver.serve() for receiver in receivers))
+
+    receivers_thread = threading.Thread(target=asyncio.run,
+                                        args=(_serve_all(),),
+                                        name='RemoteReceivers')
+    client = network.MulticastClient(ip=network.FLEET_GROUP,
+                                     port=network.PORT,
+                                     interface_ip='127.0.0.1')
+    session = protocol.new_session()
+    sequence = [0]
+
+    def _send(commands, target, flags=0):
+        sequence[0] += 1
+        client.send(protocol.encode(protocol.Frame(flags=flags,
+                                                   session=session,
+                                                   sequence=sequence[0],
+                                                   commands=commands,
+                                                   target=target)))
+
+    latencies_s = []
+    unicast_latencies_s = []
+    num_foreign_writes = 0
+    receivers_thread.start()
+    cpu_start_s = _cpu_s()
+    try:
+        for idx in range(num_samples):
+            if idx % 2:
+                # A state which differs from the ones of all the robots.
+                target = 1 + idx // 2 % num_robots
+                commands = protocol.FORWARD | protocol.LEFT
+                addressed = [target]
+            else:
+                target = protocol.ALL_ROBOTS
+                commands = 0 if idx % 4 else protocol.FORWARD
+                addressed = list(probes)
+
+            for probe in probes.values():
+                probe.written.clear()
+            start_ns = time.perf_counter_ns()
+            _send(commands, target)
+            if all(probes[robot_id].written.wait(_REACTION_TIMEOUT_s)
+                   for robot_id in addressed):
+                latency_s = 1e-9 * (max(probes[robot_id].write_ns
+                                        for robot_id in addressed)
+                                    - start_ns)
+                if target == protocol.ALL_ROBOTS:
+                    latencies_s.append(latency_s)
+                else:
+                    unicast_latencies_s.append(latency_s)
+            num_foreign_writes += sum(probe.written.is_set()
+                                      for robot_id, probe in probes.items()
+                                      if robot_id not in addressed)
+        cpu_s = _cpu_s() - cpu_start_s
+
+    finally:
+        _send(0, protocol.ALL_ROBOTS, flags=protocol.FLAG_SHUTDOWN)
+        receivers_thread.join()
+        client.close()
+        for status_led in status_leds:
+            status_led.close()
+        for driver in drivers:
+            driver.close()
+
+    stats = summarize(latencies_s, cpu_s)
+    stats['unicast_p50_s'] = summarize(unicast_latencies_s, 0.)['p50_s']
+    stats['foreign_writes'] = num_foreign_writes
+    return stats
+
+
+def line_to_steering(num_samples=50, event_driven=True):
+    """Moves the left line sensor on and off the track and measures the time
+    until the LineNavigator steers, in event-driven or polling mode.
+    """
+    _install_mocks()
+
+    import robot.devices.led_status as ls
+    import robot.devices.line_navigator as ln
+    import robot.motion.driver as dvr
+
+    probe = _MotorWriteProbe()
+    driver = dvr.Driver(recorder=probe)
+    status_led = ls.StatusLed()
+
+    line_navigator = ln.LineNavigator(driver=driver,
+                                      status_led=status_led,
+                                      black_track=True,
+                                      event_driven=event_driven)
+
+    # The sensors are pulled up, and active, that is low, off the black
+    # track. Start with the robot centered, both sensors off the track.
+    left_pin = Device.pin_factory.pin(ln.PIN_LEFT_LINE_SENSOR)
+    Device.pin_factory.pin(ln.PIN_RIGHT_LINE_SENSOR).drive_low()
+    left_pin.drive_low()
+    navigator_thread = threading.Thread(target=line_navigator.run,
+                                        name='LineNavigator')
+
+    latencies_s = []
+    probe.written.clear()
+    navigator_thread.start()
+    probe.written.wait(_REACTION_TIMEOUT_s)
+    cpu_start_s = _cpu_s()
+    try:
+        for idx in range(num_samples):
+            probe.written.clear()
+            start_ns = time.perf_counter_ns()
+            if idx % 2:
+                left_pin.drive_low()
+            else:
+                left_pin.drive_high()
+            if probe.written.wait(_REACTION_TIMEOUT_s):
+                latencies_s.append((probe.write_ns - start_ns) * 1e-9)
+        cpu_s = _cpu_s() - cpu_start_s
+
+    finally:
+        line_navigator.close()
+        navigator_thread.join()
+        status_led.close()
+        driver.close()
+
+    return summarize(latencies_s, cpu_s)
+
+
+def line_to_steering_polling(num_samples=50):
+    return line_to_steering(num_samples=num_samples, event_driven=False)
+
+
+class _EchoResponder:
+    """Answers the pings of the ultrasonic sensors with echoes of the given
+    distances, recording the time of the falling edges and the pings of each
+    sensor in shared memory.
+    """
+
+    def __init__(self, sonars):
+        """
+        Args:
+            sonars (dict): Maps the TRIG pin of each sensor to its ECHO pin.
+        """
+        self._sonars = sonars
+        self.distances_cm = {trig_pin: mp.RawValue(ctypes.c_double, 100.)
+                             for trig_pin in sonars}
+        self.falling_edge_ns = mp.RawValue(ctypes.c_int64, 0)
+        self.pings = {trig_pin: mp.RawValue(ctypes.c_int64, 0)
+                      for trig_pin in sonars}
+        mock_gpio.add_output_callback(self._on_output)
+
+    def _on_output(self, pin, level):
+        echo_pin = self._sonars.get(pin)
+        if echo_pin is None or level:
+            return
+
+        self.pings[pin].value += 1
+        duration_s = 2 * self.distances_cm[pin].value / 100 / 343.26
+        threading.Thread(target=self._echo,
+                         args=(echo_pin, duration_s),
+                         daemon=True).start()
+
+    def _echo(self, echo_pin, duration_s):
+        time.sleep(2e-3)
+        mock_gpio.set_input(echo_pin, True)
+        time.sleep(duration_s)
+        self.falling_edge_ns.value = time.perf_counter_ns()
+        mock_gpio.set_input(echo_pin, False)
+
+
+def echo_to_stop(num_samples=30, distance_m=0.1):
+    """Alternates the distance in front of the ObstacleBreak between close
+    and far, and measures the time from the falling edge of the echo of a
+    close obstacle to the forward safety stop.
+    """
+    _install_mocks()
+
+    import robot.devices.obstacle_break as ob
+    import robot.motion.driver as dvr
+
+    front_trig_pin = ob._ULTRASONIC_SENSOR_FRONT_TRIG_PIN
+    responder = _EchoResponder({
+        front_trig_pin: ob._ULTRASONIC_SENSOR_FRONT_ECHO_PIN,
+        ob._ULTRASONIC_SENSOR_REAR_TRIG_PIN:
+            ob._ULTRASONIC_SENSOR_REAR_ECHO_PIN,
+    })
+    front_distance_cm = responder.distances_cm[front_trig_pin]
+
+    driver = dvr.Driver()
+    obstacle_break = ob.ObstacleBreak(driver=driver, distance_m=distance_m)
+    stop_forward_event = driver.safety_stop_forward_event
+
+    def _wait_until(is_set):
+        deadline_s = time.monotonic() + _REACTION_TIMEOUT_s
+        while stop_forward_event.is_set() != is_set:
+            if time.monotonic() > deadline_s:
+                return None
+            time.sleep(50e-6)
+        return time.perf_counter_ns()
+
+    latencies_s = []
+    obstacle_break.run()
+    cpu_start_s = _cpu_s()
+    try:
+        for _ in range(num_samples):
+            front_distance_cm.value = 50 * distance_m
+            stop_ns = _wait_until(True)
+            if stop_ns is not None:
+                latencies_s.append(
+                    (stop_ns - responder.falling_edge_ns.value) * 1e-9)
+
+            front_distance_cm.value = 1000 * distance_m
+            _wait_until(False)
+        cpu_s = _cpu_s() - cpu_start_s
+
+    finally:
+        obstacle_break.close()
+        driver.close()
+
+    return summarize(latencies_s, cpu_s)
+
+
+def motion_to_ping(num_samples=20, window_s=2.):
+    """Stops and starts the motors under an ObstacleBreak with adaptive
+    sampling, and measures the time from the forward command to the next
+    ping of the front sensor. Also counts the pings of both sensors over a
+    window while still and while moving forward.
+    """
+    _install_mocks()
+
+    import robot.devices.obstacle_break as ob
+    import robot.motion.driver as dvr
+
+    front_trig_pin = ob._ULTRASONIC_SENSOR_FRONT_TRIG_PIN
+    rear_trig_pin = ob._ULTRASONIC_SENSOR_REAR_TRIG_PIN
+    responder = _EchoResponder({
+        front_trig_pin: ob._ULTRASONIC_SENSOR_FRONT_ECHO_PIN,
+        rear_trig_pin: ob._ULTRASONIC_SENSOR_REAR_ECHO_PIN,
+    })
+    front_pings = responder.pings[front_trig_pin]
+
+    driver = dvr.Driver()
+    obstacle_break = ob.ObstacleBreak(driver=driver,
+                                      distance_m=0.1,
+                                      adaptive_sampling=True)
+
+    def _pings_per_s():
+        num_pings = sum(pings.value for pings in responder.pings.values())
+        time.sleep(window_s)
+        return (sum(pings.value for pings in responder.pings.values())
+                - num_pings) / window_s
+
+    latencies_s = []
+    obstacle_break.run()
+    cpu_start_s = _cpu_s()
+    try:
+        pings_per_s = {'still': _pings_per_s()}
+        for idx in range(num_samples):
+            driver.stop()
+            # Start at different phases of the slow sampling.
+            time.sleep(0.3 + 0.05 * (idx % 10))
+
+            num_pings = front_pings.value
+            start_ns = time.perf_counter_ns()
+            driver.set_command(dvr.COMMAND_FORWARD, 1)
+            deadline_s = time.monotonic() + _REACTION_TIMEOUT_s
+            while front_pings.value == num_pings:
+                if time.monotonic() > deadline_s:
+                    break
+                time.sleep(50e-6)
+            else:
+                latencies_s.append(
+                    (time.perf_counter_ns() - start_ns) * 1e-9)
+        pings_per_s['forward'] = _pings_per_s()
+        cpu_s = _cpu_s() - cpu_start_s
+
+    finally:
+        obstacle_break.close()
+        driver.close()
+
+    stats = summarize(latencies_s, cpu_s)
+    stats['pings_per_s'] = pings_per_s
+    return stats
+
+
+def set_command(num_samples=100000):
+    """Measures the duration of Driver.set_command() alternating the forward
+    command, so that every call writes the motors.
+    """
+    _install_mocks()
+
+    import robot.motion.driver as dvr
+
+    driver = dvr.Driver()
+    latencies_s = []
+    cpu_start_s = _cpu_s()
+    try:
+        loop_start_ns = time.perf_counter_ns()
+        for idx in range(num_samples):
+            start_ns = time.perf_counter_ns()
+            driver.set_command(dvr.COMMAND_FORWARD, idx % 2)
+            latencies_s.append((time.perf_counter_ns() - start_ns) * 1e-9)
+        elapsed_s = (time.perf_counter_ns() - loop_start_ns) * 1e-9
+        cpu_s = _cpu_s() - cpu_start_s
+
+    finally:
+        driver.close()
+
+    stats = summarize(latencies_s, cpu_s)
+    stats['calls_per_s'] = num_samples / elapsed_s
+    return stats
+
+
+def bring_up(num_samples=10):
+    """Measures the time to build the devices of the manual mode, from
+    their lifecycle. Each sample gets fresh mock pins.
+    """
+    _install_mocks()
+
+    import robot.robot as rbt
+
+    latencies_s = []
+    cpu_start_s = _cpu_s()
+    for _ in range(num_samples):
+        Device.pin_factory = MockFactory(pin_class=MockPWMPin)
+        lifecycle = rbt._manual_lifecycle(listen_ip='127.0.0.1',
+                                          listen_port=0)
+        start_ns = time.perf_counter_ns()
+        lifecycle.start()
+        latencies_s.append((time.perf_counter_ns() - start_ns) * 1e-9)
+        lifecycle.close()
+    cpu_s = _cpu_s() - cpu_start_s
+
+    return summarize(latencies_s, cpu_s)
+
+
+def interrupt_to_stop(num_samples=5):
+    """Runs the devices of the manual mode with the robot moving forward,
+    and measures the time from the start of their teardown to the motors
+    stopping. The total time of the teardown is reported as well.
+    """
+    _install_mocks()
+
+    import robot.motion.driver as dvr
+    import robot.robot as rbt
+
+    latencies_s = []
+    close_durations_s = []
+    cpu_start_s = _cpu_s()
+    for _ in range(num_samples):
+        Device.pin_factory = MockFactory(pin_class=MockPWMPin)
+        probe = _MotorWriteProbe()
+        lifecycle = rbt._manual_lifecycle(recorder=probe,
+                                          listen_ip='127.0.0.1',
+                                          listen_port=0)
+        devices = lifecycle.start()
+        devices['obstacle_break'].run()
+        devices['driver'].set_command(dvr.COMMAND_FORWARD, 1)
+
+        probe.written.clear()
+        start_ns = time.perf_counter_ns()
+        lifecycle.close()
+        close_durations_s.append((time.perf_counter_ns() - start_ns) * 1e-9)
+        if probe.written.is_set():
+            latencies_s.append((probe.write_ns - start_ns) * 1e-9)
+    cpu_s = _cpu_s() - cpu_start_s
+
+    stats = summarize(latencies_s, cpu_s)
+    stats['close_p50_s'] = summarize(close_durations_s, 0.)['p50_s']
+    return stats
+
+
+def _import_time(module, num_samples):
+    """Imports a module of the root of the repository in fresh interpreters
+    and measures how long it takes.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = _IMPORT_SCRIPT.format(module=module,
+                                   hardware_modules=_HARDWARE_MODULES)
+
+    latencies_s = []
+    hardware_modules = set()
+    cpu_start_s = _cpu_s()
+    for _ in range(num_samples):
+        output = subprocess.run([sys.executable, '-c', script],
+                                cwd=root,
+                                check=True,
+                                stdout=subprocess.PIPE,
+                                universal_newlines=True).stdout
+        elapsed_s, loaded = json.loads(output.splitlines()[-1])
+        latencies_s.append(elapsed_s)
+        hardware_modules.update(loaded)
+    cpu_s = _cpu_s() - cpu_start_s
+
+    stats = summarize(latencies_s, cpu_s)
+    stats['hardware_modules'] = sorted(hardware_modules)
+    return stats
+
+
+def import_remote(num_samples=20):
+    """Measures the time to import the entry point of the remote.
+    """
+    return _import_time('run_remote', num_samples)
+
+
+def import_robot(num_samples=20):
+    """Measures the time to import the entry point of the robot.
+    """
+    return _import_time('run_robot', num_samples)
+
+
+BENCHMARKS = {
+    'remote_to_motors': remote_to_motors,
+    'fleet_to_motors': fleet_to_motors,
+    'line_to_steering': line_to_steering,
+    'line_to_steering_polling': line_to_steering_polling,
+    'echo_to_stop': echo_to_stop,
+    'motion_to_ping': motion_to_ping,
+    'set_command': set_command,
+    'bring_up': bring_up,
+    'interrupt_to_stop': interrupt_to_stop,
+    'import_remote': import_remote,
+    'import_robot': import_robot,
+}
+
+
+def compare(results, baseline, tolerance):
+    """Compares results with a baseline.
+
+    A benchmark regresses if its p50 or p99 latency grows, or its throughput
+    drops, by more than `tolerance` times the baseline. A benchmark missing
+    from the baseline counts as a regression, so that it cannot go
+    unchecked. An import benchmark also regresses if the import loads a
+    hardware library, whatever the baseline.
+
+    Args:
+        results (dict): Maps benchmark names to their statistics.
+        baseline (dict): Same as results, from a previous run.
+        tolerance (float): Allowed relative increase, e.g. 0.5 for 50%.
+
+    Returns:
+        list: Descriptions of the regressions.
+    """
+    regressions = []
+    for name, stats in results.items():
+        if stats.get('hardware_modules'):
+            regressions.append('{} loads {}'.format(
+                name, ', '.join(stats['hardware_modules'])))
+
+        baseline_stats = baseline.get(name)
+        if baseline_stats is None:
+            regressions.append('{} has no baseline'.format(name))
+            continue
+
+        for key in ('p50_s', 'p99_s'):
+            limit_s = baseline_stats[key] * (1 + tolerance)
+            if stats[key] > limit_s:
+                regressions.append(
+                    '{} {}: {:.1f} us, baseline {:.1f} us'.format(
+                        name, key[:-2], 1e6 * stats[key],
+                        1e6 * baseline_stats[key]))
+
+        if 'calls_per_s' in stats and 'calls_per_s' in baseline_stats:
+            limit = baseline_stats['calls_per_s'] / (1 + tolerance)
+            if stats['calls_per_s'] < limit:
+                regressions.append(
+                    '{} throughput: {:.0f} calls/s, baseline {:.0f} '
+                    'calls/s'.format(name, stats['calls_per_s'],
+                                     baseline_stats['calls_per_s']))
+    return regressions
@@ -1,6 +1,6 @@
 import logging
 
-from gpiozero import LED
+import robot.hardware as hardware
 
 _logger = logging.getLogger(__name__)
 
@@ -23,7 +23,7 @@ _blinking_time_s = {
 class StatusLed:
 
     def __init__(self):
-        self._led = LED(PIN)
+        self._led = hardware.gpiozero().LED(PIN)
         self._led.off()
         _logger.debug('{} initialized'.format(self.__class__.__name__))
 
@@ -1,12 +1,17 @@
+import asyncio
 import enum
 import logging
+import threading
 import time
 
-from gpiozero import LineSensor
-
 import robot.components.line_tracking.robotdyn as lts
 import robot.devices.led_status as ls
+import robot.hardware as hardware
+import robot.instrumentation as instrumentation
 import robot.motion.driver as dvr
+import robot.motion.pid as pid
+import robot.recording as recording
+import robot.scheduling as scheduling
 
 PIN_LEFT_LINE_SENSOR = 10
 PIN_RIGHT_LINE_SENSOR = 9
@@ -15,25 +20,107 @@ _logger = logging.getLogger(__name__)
 
 
 class LineNavigator:
+    """Follows a line on the ground using two line sensors.
+
+    By default the navigator polls the sensors at a fixed rate, paced on the
+    monotonic clock (see robot.scheduling). If `event_driven` is set, it
+    reacts to the activation and deactivation events of the sensors instead,
+    and stays idle while the line does not change.
+
+    The event-driven mode can also run as a task of an asyncio event loop,
+    shared with other tasks, through serve().
+
+    In both modes, commands are sent to the driver only when the state
+    changes. If `reassert_interval_s` is provided, the commands of the
+    current state are also sent again at that interval.
+
+    If `proportional` is set, the navigator polls the sensors at a lower
+    rate and steers continuously rather than stopping to turn: the angular
+    velocity comes from a PID controller fed with the side of the line, so
+    the longer the line stays under one sensor, the sharper the turn. The
+    robot still stops when both sensors detect the line.
+
+    If a recorder (see robot.recording) is provided, every state transition
+    is recorded. If instrumentation (see robot.instrumentation) is enabled,
+    the period of the polling loop and its jitter are measured.
+    """
 
     # Time interval between subsequent sensor readings.
     _FRAME_RATE_s = 100e-6      # 100 us
 
+    # Core and SCHED_FIFO priority of the polling loops, if real-time
+    # scheduling is enabled (see robot.scheduling).
+    _CPU = 3
+    _REALTIME_PRIORITY = 50
+
     class _State(enum.Enum):
         LEFT_ON_TRACK = 0
         RIGHT_ON_TRACK = 1
         BOTH_ON_TRACK = 2
         NONE_ON_TRACK = 3
 
-    def __init__(self, driver, status_led, black_track=True):
+    # Maps whether the (left, right) sensors are on the track to the state.
+    _TRACK_TO_STATE = {
+        (True, True): _State.BOTH_ON_TRACK,
+        (True, False): _State.LEFT_ON_TRACK,
+        (False, True): _State.RIGHT_ON_TRACK,
+        (False, False): _State.NONE_ON_TRACK,
+    }
+
+    # Proportional mode: time interval between subsequent steering updates,
+    # forward velocity, and gains of the steering controller.
+    _STEERING_PERIOD_s = 5e-3
+    _STEERING_LINEAR_SPEED = 0.5
+    _STEERING_KP = 0.15
+    _STEERING_KI = 0.2
+    _STEERING_KD = 0.
+
+    # Proportional mode: error fed to the steering controller for each state.
+    # Positive errors turn left. With no sensor on the line the robot is
+    # centered on it: the accumulated error is dropped too, so that the robot
+    # goes straight rather than keep turning.
+    _STATE_TO_ERROR = {
+        _State.LEFT_ON_TRACK: 1.,
+        _State.RIGHT_ON_TRACK: -1.,
+        _State.NONE_ON_TRACK: 0.,
+    }
+
+    def __init__(self, driver, status_led, black_track=True,
+                 event_driven=False, reassert_interval_s=None,
+                 recorder=None, proportional=False):
+        if event_driven and proportional:
+            raise ValueError('The proportional mode cannot be event-driven')
+
         self._driver = driver
+        self._recorder = recorder
         self._status_led = status_led
         self._black_track = black_track
+        self._event_driven = event_driven
+        self._reassert_interval_s = reassert_interval_s
+        self._proportional = proportional
 
-        self._sensor_left = LineSensor(pin=PIN_LEFT_LINE_SENSOR,
-                                       pull_up=lts.IS_PULL_UP)
-        self._sensor_right = LineSensor(pin=PIN_RIGHT_LINE_SENSOR,
-                                        pull_up=lts.IS_PULL_UP)
+        gpiozero = hardware.gpiozero()
+        self._sensor_left = gpiozero.LineSensor(pin=PIN_LEFT_LINE_SENSOR,
+                                                pull_up=lts.IS_PULL_UP)
+        self._sensor_right = gpiozero.LineSensor(pin=PIN_RIGHT_LINE_SENSOR,
+                                                 pull_up=lts.IS_PULL_UP)
+
+        # Maps the (left, right) active sensors to the state. An active
+        # sensor means that the track was detected, unless the track is
+        # black.
+        self._state_table = {
+            (left_active, right_active):
+                self._TRACK_TO_STATE[(left_active != black_track,
+                                      right_active != black_track)]
+            for left_active in (False, True)
+            for right_active in (False, True)
+        }
+
+        # Event-driven mode: latest known sensor values, updated by the
+        # sensor events.
+        self._active = {'left': False, 'right': False}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
 
         # These callback functions are called the first time that one of the
         # relative events occurs.
@@ -43,79 +130,260 @@ class LineNavigator:
             self._State.RIGHT_ON_TRACK: self._right_on_track_callback,
             self._State.NONE_ON_TRACK: self._none_on_track_callback,
         }
+        if proportional:
+            # The steering controller drives the motors, apart from stopping.
+            self._callbacks = {
+                state: (callback
+                        if state == self._State.BOTH_ON_TRACK else None)
+                for state, callback in self._callbacks.items()
+            }
 
         # Assume the robot is well-centered on the track.
         self._state = self._State.NONE_ON_TRACK
 
+        # Last state whose commands were sent to the driver, and when.
+        self._dispatched_state = None
+        self._last_dispatch_time_s = 0.
+
+        # Number of state updates which caused commands to the driver because
+        # of a state change or a periodic re-assert, and which did not.
+        self._num_transitions = 0
+        self._num_reasserts = 0
+        self._num_skipped = 0
+
+        # Pace of the polling loop, once running.
+        self._rate = None
+
         self._status_led.set(ls.Status.AUTOPILOT)
 
         _logger.info('{} initialized'.format(self.__class__.__name__))
 
     def _none_on_track_callback(self):
         # Reset forward direction.
-        self._driver.set_command(command_code=dvr.COMMAND_RIGHT,
-                                 command_value=False)
-        self._driver.set_command(command_code=dvr.COMMAND_LEFT,
-                                 command_value=False)
-        self._driver.set_command(command_code=dvr.COMMAND_FORWARD,
-                                 command_value=True)
+        self._driver.set_commands({dvr.COMMAND_RIGHT: False,
+                                   dvr.COMMAND_LEFT: False,
+                                   dvr.COMMAND_FORWARD: True})
         _logger.debug('No line detected: go straight ahead')
 
     def _left_on_track_callback(self):
         # Sharp turn to left.
-        self._driver.set_command(command_code=dvr.COMMAND_FORWARD,
-                                 command_value=False)
-        self._driver.set_command(command_code=dvr.COMMAND_LEFT,
-                                 command_value=True)
+        self._driver.set_commands({dvr.COMMAND_FORWARD: False,
+                                   dvr.COMMAND_RIGHT: False,
+                                   dvr.COMMAND_LEFT: True})
         _logger.debug('Adjust left')
 
     def _right_on_track_callback(self):
         # Sharp turn to right.
-        self._driver.set_command(command_code=dvr.COMMAND_FORWARD,
-                                 command_value=False)
-        self._driver.set_command(command_code=dvr.COMMAND_RIGHT,
-                                 command_value=True)
+        self._driver.set_commands({dvr.COMMAND_FORWARD: False,
+                                   dvr.COMMAND_LEFT: False,
+                                   dvr.COMMAND_RIGHT: True})
         _logger.debug('Adjust right')
 
     def _both_on_track_callback(self):
         self._driver.stop()
         _logger.warning('Both line sensors detected a line: stop the motors')
 
-    def run(self):
-        # Start the robot.
+    def _dispatch(self, state):
+        """Calls the callback of the given state, if the state changed since
+        the last call or if its commands are due to be re-asserted.
+
+        Args:
+            state (:obj:`_State`): The current state.
+        """
+        self._state = state
+        now_s = time.monotonic()
+        if state != self._dispatched_state:
+            self._num_transitions += 1
+            if self._recorder is not None:
+                self._recorder.record(recording.KIND_LINE, value=state.value)
+        elif self._reassert_interval_s is not None and \
+                now_s - self._last_dispatch_time_s >= self._reassert_interval_s:
+            self._num_reasserts += 1
+        else:
+            # The driver already received the commands for this state.
+            self._num_skipped += 1
+            return
+
+        self._dispatched_state = state
+        self._last_dispatch_time_s = now_s
+
+        callback = self._callbacks[state]
+        if callback is not None:
+            callback()
+
+    @property
+    def dispatch_stats(self):
+        """dict: Number of state updates which caused commands to the driver
+        ("transitions" and "reasserts") and which were skipped because the
+        driver already had the right commands ("skipped").
+        """
+        return {
+            'transitions': self._num_transitions,
+            'reasserts': self._num_reasserts,
+            'skipped': self._num_skipped,
+        }
+
+    @property
+    def state(self):
+        """:obj:`_State`: Latest state of the robot with respect to the track.
+        """
+        return self._state
+
+    def step(self, left_active, right_active):
+        """Processes a reading of the line sensors.
+
+        Args:
+            left_active (bool): Whether the left sensor is active.
+            right_active (bool): Whether the right sensor is active.
+        """
+        with self._lock:
+            self._dispatch(self._state_table[(left_active, right_active)])
+
+    def _sensor_event_callback(self, side, active):
+        def _f():
+            with self._lock:
+                self._active[side] = active
+                self._dispatch(self._state_table[(self._active['left'],
+                                                  self._active['right'])])
+
+        return _f
+
+    def _start_event_driven(self, schedule=None):
+        """Dispatches the current state and registers the sensor callbacks.
+
+        Args:
+            schedule (callable, optional): Function through which to run the
+                sensor callbacks, for example to move them to an event loop.
+                If None, they run in the thread of the sensor events.
+        """
+        with self._lock:
+            self._active['left'] = self._sensor_left.is_active
+            self._active['right'] = self._sensor_right.is_active
+            self._dispatch(self._state_table[(self._active['left'],
+                                              self._active['right'])])
+
+        def _scheduled(callback):
+            if schedule is None:
+                return callback
+
+            def _f():
+                schedule(callback)
+
+            return _f
+
+        for side, sensor in (('left', self._sensor_left),
+                             ('right', self._sensor_right)):
+            sensor.when_activated = _scheduled(
+                self._sensor_event_callback(side, True))
+            sensor.when_deactivated = _scheduled(
+                self._sensor_event_callback(side, False))
+
+    def _run_event_driven(self):
+        self._start_event_driven()
+
+        # Nothing to do until the sensors change or the navigator is closed,
+        # apart from re-asserting the commands if requested.
+        while not self._stop_event.wait(self._reassert_interval_s):
+            with self._lock:
+                self._dispatch(self._state)
+
+    def _steer(self, controller, state, timestamp_s):
+        """Proportional mode: updates the velocity for the current state.
+
+        Args:
+            controller (:obj:`PidController`): The steering controller.
+            state (:obj:`_State`): The current state.
+            timestamp_s (float): Monotonic time of the state, in seconds.
+        """
+        self._dispatch(state)
+        if state == self._State.BOTH_ON_TRACK:
+            # Stopped: start steering from scratch when the line is found.
+            controller.reset()
+            return
+
+        if state == self._State.NONE_ON_TRACK:
+            controller.reset_integral()
+
+        angular = controller.update(self._STATE_TO_ERROR[state], timestamp_s)
+        self._driver.set_velocity(linear=self._STEERING_LINEAR_SPEED,
+                                  angular=angular)
+
+    def _run_proportional(self):
+        controller = pid.PidController(kp=self._STEERING_KP,
+                                       ki=self._STEERING_KI,
+                                       kd=self._STEERING_KD,
+                                       output_limit=1.)
+        loop_period = instrumentation.period('line_navigator.loop')
+        self._rate = self._make_rate(self._STEERING_PERIOD_s)
+        self._rate.start()
+        while not self._rate.wait():
+            if loop_period is not None:
+                loop_period.tick()
+            state = self._state_table[(self._sensor_left.is_active,
+                                       self._sensor_right.is_active)]
+            self._steer(controller, state, time.monotonic())
+
+    def _make_rate(self, period_s):
+        return scheduling.FixedRate(period_s=period_s,
+                                    name='line_navigator',
+                                    stop_event=self._stop_event,
+                                    cpu=self._CPU,
+                                    priority=self._REALTIME_PRIORITY)
+
+    async def serve(self):
+        """Same as run() in event-driven mode, but as a task of the running
+        asyncio event loop, which also handles the sensor events. Runs until
+        cancelled.
+        """
         self._driver.set_command(command_code=dvr.COMMAND_FORWARD,
                                  command_value=True)
 
-        while True:
-
-            # Active sensor means that the track was detected.
-            if self._black_track:
-                left = not self._sensor_left.is_active
-                right = not self._sensor_right.is_active
-            else:
-                left = self._sensor_left.is_active
-                right = self._sensor_right.is_active
+        loop = asyncio.get_running_loop()
+        self._start_event_driven(schedule=loop.call_soon_threadsafe)
 
-            if left and right:
-                self._state = self._State.BOTH_ON_TRACK
+        if self._reassert_interval_s is None:
+            await loop.create_future()
 
-            elif left and not right:
-                self._state = self._State.LEFT_ON_TRACK
+        while True:
+            await asyncio.sleep(self._reassert_interval_s)
+            with self._lock:
+                self._dispatch(self._state)
 
-            elif not left and right:
-                self._state = self._State.RIGHT_ON_TRACK
+    def run(self):
+        # Start the robot.
+        self._driver.set_command(command_code=dvr.COMMAND_FORWARD,
+                                 command_value=True)
 
-            else:
-                self._state = self._State.NONE_ON_TRACK
+        if self._event_driven:
+            self._run_event_driven()
+            return
 
-            callback = self._callbacks[self._state]
-            if callback is not None:
-                callback()
+        if self._proportional:
+            self._run_proportional()
+            return
 
-            time.sleep(self._FRAME_RATE_s)
+        loop_period = instrumentation.period('line_navigator.loop')
+        self._rate = self._make_rate(self._FRAME_RATE_s)
+        self._rate.start()
+        while True:
+            if loop_period is not None:
+                loop_period.tick()
+            self._dispatch(self._state_table[(self._sensor_left.is_active,
+                                              self._sensor_right.is_active)])
+            if self._rate.wait():
+                return
 
     def close(self):
+        self._stop_event.set()
+        self._sensor_left.when_activated = None
+        self._sensor_left.when_deactivated = None
+        self._sensor_right.when_activated = None
+        self._sensor_right.when_deactivated = None
         self._driver.stop()
         self._sensor_left.close()
         self._sensor_right.close()
-        _logger.info('{} stopped'.format(self.__class__.__name__))
+        _logger.info('{} stopped, dispatch stats: {}'.format(
+            self.__class__.__name__, self.dispatch_stats))
+        if self._rate is not None:
+            _logger.info('{} loop stats: {}'.format(self.__class__.__name__,
+                                                    self._rate.stats))
@@ -1,8 +1,16 @@
+import concurrent.futures
+import ctypes
 import logging
+import math
 import multiprocessing as mp
+import threading
+import time
 
 import robot.components.ultrasonic_sensors.hc_sr04 as hc_sr04
 import robot.components.ultrasonic_sensors.playknowlogy as playknowlogy
+import robot.motion.safety as safety
+import robot.recording as recording
+import robot.sensor.filters as filters
 import robot.sensor.ultrasonic as ultrasonic
 
 _logger = logging.getLogger(__name__)
@@ -12,102 +20,393 @@ _ULTRASONIC_SENSOR_FRONT_ECHO_PIN = 7
 _ULTRASONIC_SENSOR_REAR_TRIG_PIN = 25
 _ULTRASONIC_SENSOR_REAR_ECHO_PIN = 8
 
+# With adaptive sampling, measure intervals between two measurements of a
+# sensor facing the direction of travel, facing away from it, and while the
+# motors are stopped.
+_PACE_TOWARDS = 1
+_PACE_AWAY = 3
+_PACE_STILL = 10
 
-def _trigger_sensor_reading(distance_sensor):
+
+def _trigger_sensor_reading(distance_sensor, stop_event):
     """Cyclically reads from the distance sensor to trigger its callbacks.
 
-    Function to be run in a dedicated process: leave the parent process
-    terminate this process.
+    Function to be run in a dedicated process or thread: the parent sets the
+    stop event to make it return.
 
     Args:
-        distance_sensor (:obj:`UltrasonicSensor`): Ultrasonic distance sensor
-            to read.
+        distance_sensor (:obj:`UltrasonicSensor` or :obj:`UltrasonicArray`):
+            Ultrasonic distance sensor, or array of sensors, to read.
+        stop_event (:obj:`Event`): Event to stop the reading.
     """
     try:
-        for _ in distance_sensor.read():
+        for _ in distance_sensor.read(stop_event=stop_event):
             pass
     except KeyboardInterrupt:
         pass
 
 
-def _obstacle_detected_callback(event):
+def _trigger_sensors_reading(distance_sensors, stop_event, timeout_s):
+    """Cyclically reads from several distance sensors, one thread each.
+
+    Function to be run in a dedicated process: the parent sets the stop event
+    to make it return.
+
+    Args:
+        distance_sensors (list): Ultrasonic distance sensors to read.
+        stop_event (:obj:`Event`): Event to stop the reading.
+        timeout_s (float): Maximum time to wait for the threads to stop once
+            the event is set, in seconds.
+    """
+    threads = [
+        threading.Thread(target=_trigger_sensor_reading,
+                         args=(distance_sensor, stop_event),
+                         name='{}Reading'.format(distance_sensor._name),
+                         daemon=True)
+        for distance_sensor in distance_sensors
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        stop_event.wait()
+    except KeyboardInterrupt:
+        stop_event.set()
+
+    deadline = time.monotonic() + timeout_s
+    for thread in threads:
+        thread.join(max(0., deadline - time.monotonic()))
+
+
+def _obstacle_detected_callback(safety_flags, flag):
     def _f(distance_cm):
         _logger.debug('Obstacle detected at {:.1f} cm'.format(distance_cm))
-        event.set()
+        safety_flags.set(flag)
 
     return _f
 
 
-def _clear_way_callback(event):
+def _clear_way_callback(safety_flags, flag):
     def _f(_distance_cm):
         _logger.debug('Clear way')
-        event.clear()
+        safety_flags.clear(flag)
 
     return _f
 
 
+def _distance_log(distances_cm, idx, when_measured=None):
+    """Returns a callback storing every measured distance in shared memory,
+    then calling `when_measured` with the distance and its time, if provided.
+    """
+    def _f(distance_cm, timestamp_s):
+        distances_cm[idx] = distance_cm
+        if when_measured is not None:
+            when_measured(distance_cm, timestamp_s)
+
+    return _f
+
+
+def _motion_pace(motion_state, direction):
+    """Returns the pace of a sensor (see UltrasonicSensor) following the
+    motion of the robot.
+
+    Args:
+        motion_state (:obj:`MotionState`): Motion state of the driver.
+        direction (int): 1 if the sensor faces forward, -1 if backward.
+    """
+    def _f():
+        left, right = motion_state.values
+        if left == 0 and right == 0:
+            return _PACE_STILL
+        if direction * (left + right) >= 0:
+            # Moving towards the sensor's side, or turning on the spot.
+            return _PACE_TOWARDS
+        return _PACE_AWAY
+
+    return _f
+
+
+class _CollisionPredictor:
+    """Raises a predicted safety stop if the time to collision with the
+    obstacle in front of a sensor becomes too short.
+
+    The closing speed is the largest of the one estimated from the stream of
+    distances and the speed at which the driver is commanded to move the robot
+    towards the sensor's side: the former accounts for moving obstacles, the
+    latter reacts as soon as the robot accelerates and keeps the stop raised
+    while the robot is held still by it.
+
+    Attributes:
+        _safety_flags (:obj:`SafetyFlags`): Flags of the driver.
+        _flag (int): Flag to raise when a collision is predicted.
+        _motion_state (:obj:`MotionState`): Motion state of the driver.
+        _direction (int): 1 if the sensor faces forward, -1 if backward.
+        _time_to_collision_s (float): A collision is predicted if the time to
+            collision is shorter than this.
+    """
+
+    # Once predicted, the collision is cleared only when the time to collision
+    # becomes longer than the threshold times this factor.
+    _RELEASE_FACTOR = 1.5
+
+    def __init__(self,
+                 safety_flags,
+                 flag,
+                 motion_state,
+                 direction,
+                 time_to_collision_s):
+        self._safety_flags = safety_flags
+        self._flag = flag
+        self._motion_state = motion_state
+        self._direction = direction
+        self._time_to_collision_s = time_to_collision_s
+        self._rate_filter = filters.AlphaBetaFilter(alpha=0.5, beta=0.2)
+        self._predicted = False
+
+    def __call__(self, distance_cm, timestamp_s):
+        """Updates the prediction with a new distance.
+
+        Args:
+            distance_cm (float): Measured distance, in cm.
+            timestamp_s (float): Monotonic time of the measurement, in
+                seconds. The closing speed follows from the time between the
+                measurements rather than from when they are processed.
+        """
+        self._rate_filter.update(distance_cm, timestamp_s)
+
+        closing_speed_mps = max(
+            -self._rate_filter.rate_cmps / 100,
+            self._direction * self._motion_state.forward_speed_mps)
+        if closing_speed_mps <= 0:
+            time_to_collision_s = float('inf')
+        else:
+            time_to_collision_s = distance_cm / 100 / closing_speed_mps
+
+        if self._predicted:
+            predicted = time_to_collision_s \
+                < self._time_to_collision_s * self._RELEASE_FACTOR
+        else:
+            predicted = time_to_collision_s < self._time_to_collision_s
+
+        if predicted == self._predicted:
+            return
+
+        self._predicted = predicted
+        if predicted:
+            _logger.debug('Collision predicted in {:.2f} s'.format(
+                time_to_collision_s))
+            self._safety_flags.set(self._flag)
+        else:
+            _logger.debug('Collision no longer predicted')
+            self._safety_flags.clear(self._flag)
+
+
 class ObstacleBreak:
     """Stops the motors if an obstacle is detected in the moving way.
 
-    This class spawns two parallel processes to monitor the front and the rear
-    distance sensors.
+    By default, this class spawns two parallel processes to monitor the front
+    and the rear distance sensors. If `use_sensor_array` is set, both sensors
+    are driven by a single process through an `UltrasonicArray`, which fires
+    them in alternate time slots.
+
+    If `single_process` is set, both sensors are monitored by a single
+    process, one thread each, so that adding sensors does not add processes.
+
+    If `edge_timing` is set, the sensors time their echoes with edge
+    interrupts and a lost echo stalls the monitoring for tens of milliseconds
+    rather than seconds. The sensor array always times the echoes this way.
+
+    To make the detection robust to noisy readings, a factory of distance
+    filters (see robot.sensor.filters) can be provided, which is called once
+    per sensor, together with a release distance larger than `distance_m`
+    beyond which an obstacle is considered cleared.
+
+    If `time_to_collision_s` is provided, the motion towards an obstacle is
+    also stopped when the obstacle would be reached within that time, given
+    the closing speed. This brakes earlier at high speed, without affecting
+    slow motion.
+
+    If `adaptive_sampling` is set, the sampling rate of each sensor follows
+    the motion commanded to the driver: the sensor facing the direction of
+    travel measures at the full rate, the other one at a third of it, and
+    both measure every ten intervals while the motors are stopped. Starting
+    to move restores the full rate within one measure interval.
+
+    The latest distances measured by the sensors are available, from any
+    process, through `distances_cm`. If a recorder (see robot.recording) is
+    provided, every raw measurement is recorded, with source 0 for the front
+    sensor and 1 for the rear one.
     """
 
-    def __init__(self, driver, distance_m):
+    # Maximum time to wait for the monitoring processes to exit before
+    # terminating them, in seconds.
+    _CLOSE_TIMEOUT_s = 0.5
+
+    def __init__(self,
+                 driver,
+                 distance_m,
+                 use_sensor_array=False,
+                 edge_timing=False,
+                 single_process=False,
+                 release_distance_m=None,
+                 distance_filter_factory=None,
+                 time_to_collision_s=None,
+                 adaptive_sampling=False,
+                 recorder=None):
         if distance_m <= 0:
             raise ValueError('Distance must be positive. '
                              'Provided is {}'.format(distance_m))
 
-        # Stops the forward motion if an obstacle is detected.
-        front_event = driver.safety_stop_forward_event
-        self._front_sensor = ultrasonic.UltrasonicSensor(
-            trig_pin=_ULTRASONIC_SENSOR_FRONT_TRIG_PIN,
-            echo_pin=_ULTRASONIC_SENSOR_FRONT_ECHO_PIN,
-            pulse_s=hc_sr04.PULSE_s,
-            measure_interval_s=hc_sr04.MEASURE_INTERVAL_s,
-            distance_threshold_m=distance_m,
-            when_in_range=_obstacle_detected_callback(event=front_event),
-            when_out_of_range=_clear_way_callback(event=front_event),
-            name='FrontDistanceSensor',
-        )
-
-        # Stops the backward motion if an obstacle is detected.
-        rear_event = driver.safety_stop_backward_event
-        self._rear_sensor = ultrasonic.UltrasonicSensor(
-            trig_pin=_ULTRASONIC_SENSOR_REAR_TRIG_PIN,
-            echo_pin=_ULTRASONIC_SENSOR_REAR_ECHO_PIN,
-            pulse_s=playknowlogy.PULSE_s,
-            measure_interval_s=playknowlogy.MEASURE_INTERVAL_s,
-            distance_threshold_m=distance_m,
-            when_in_range=_obstacle_detected_callback(event=rear_event),
-            when_out_of_range=_clear_way_callback(event=rear_event),
-            name='RearDistanceSensor',
-        )
-
-        self._obstacle_detection_process_front = \
-            mp.Process(target=_trigger_sensor_reading,
-                       args=(self._front_sensor,),
-                       name='ObstacleDetectionFront')
-
-        self._obstacle_detection_process_rear = \
-            mp.Process(target=_trigger_sensor_reading,
-                       args=(self._rear_sensor,),
-                       name='ObstacleDetectionRear')
+        def _make_distance_filter(source):
+            distance_filter = None
+            if distance_filter_factory is not None:
+                distance_filter = distance_filter_factory()
+            if recorder is None:
+                return distance_filter
+            return recording.RecordingFilter(recorder=recorder,
+                                             source=source,
+                                             distance_filter=distance_filter)
+
+        def _make_collision_predictor(flag, direction):
+            if time_to_collision_s is None:
+                return None
+            return _CollisionPredictor(safety_flags=safety_flags,
+                                       flag=flag,
+                                       motion_state=driver.motion_state,
+                                       direction=direction,
+                                       time_to_collision_s=time_to_collision_s)
+
+        def _make_pace(direction):
+            if not adaptive_sampling:
+                return None
+            return _motion_pace(motion_state=driver.motion_state,
+                                direction=direction)
+
+        safety_flags = driver.safety_flags
+
+        # Latest (front, rear) distances, written by the monitoring processes.
+        self._distances_cm = mp.RawArray(ctypes.c_double, [math.nan] * 2)
+
+        # Each sensor waits for its pins to settle: set them up at the same
+        # time.
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=2, thread_name_prefix='SensorSetup') as executor:
+            # Stops the forward motion if an obstacle is detected.
+            front_sensor = executor.submit(
+                ultrasonic.UltrasonicSensor,
+                trig_pin=_ULTRASONIC_SENSOR_FRONT_TRIG_PIN,
+                echo_pin=_ULTRASONIC_SENSOR_FRONT_ECHO_PIN,
+                pulse_s=hc_sr04.PULSE_s,
+                measure_interval_s=hc_sr04.MEASURE_INTERVAL_s,
+                distance_threshold_m=distance_m,
+                when_in_range=_obstacle_detected_callback(
+                    safety_flags=safety_flags, flag=safety.STOP_FORWARD),
+                when_out_of_range=_clear_way_callback(
+                    safety_flags=safety_flags, flag=safety.STOP_FORWARD),
+                name='FrontDistanceSensor',
+                edge_timing=edge_timing,
+                distance_filter=_make_distance_filter(source=0),
+                release_threshold_m=release_distance_m,
+                when_measured=_distance_log(
+                    distances_cm=self._distances_cm,
+                    idx=0,
+                    when_measured=_make_collision_predictor(
+                        flag=safety.PREDICTED_STOP_FORWARD, direction=1)),
+                pace=_make_pace(direction=1),
+            )
+
+            # Stops the backward motion if an obstacle is detected.
+            rear_sensor = executor.submit(
+                ultrasonic.UltrasonicSensor,
+                trig_pin=_ULTRASONIC_SENSOR_REAR_TRIG_PIN,
+                echo_pin=_ULTRASONIC_SENSOR_REAR_ECHO_PIN,
+                pulse_s=playknowlogy.PULSE_s,
+                measure_interval_s=playknowlogy.MEASURE_INTERVAL_s,
+                distance_threshold_m=distance_m,
+                when_in_range=_obstacle_detected_callback(
+                    safety_flags=safety_flags, flag=safety.STOP_BACKWARD),
+                when_out_of_range=_clear_way_callback(
+                    safety_flags=safety_flags, flag=safety.STOP_BACKWARD),
+                name='RearDistanceSensor',
+                edge_timing=edge_timing,
+                distance_filter=_make_distance_filter(source=1),
+                release_threshold_m=release_distance_m,
+                when_measured=_distance_log(
+                    distances_cm=self._distances_cm,
+                    idx=1,
+                    when_measured=_make_collision_predictor(
+                        flag=safety.PREDICTED_STOP_BACKWARD, direction=-1)),
+                pace=_make_pace(direction=-1),
+            )
+        self._front_sensor = front_sensor.result()
+        self._rear_sensor = rear_sensor.result()
+
+        # Set to stop the monitoring processes.
+        self._stop_event = mp.Event()
+
+        if use_sensor_array:
+            sensor_array = ultrasonic.UltrasonicArray(
+                sensors=[self._front_sensor, self._rear_sensor],
+                name='DistanceSensorArray')
+            self._obstacle_detection_processes = [
+                mp.Process(target=_trigger_sensor_reading,
+                           args=(sensor_array, self._stop_event),
+                           name='ObstacleDetection'),
+            ]
+        elif single_process:
+            self._obstacle_detection_processes = [
+                mp.Process(target=_trigger_sensors_reading,
+                           args=([self._front_sensor, self._rear_sensor],
+                                 self._stop_event,
+                                 self._CLOSE_TIMEOUT_s),
+                           name='ObstacleDetection'),
+            ]
+        else:
+            self._obstacle_detection_processes = [
+                mp.Process(target=_trigger_sensor_reading,
+                           args=(self._front_sensor, self._stop_event),
+                           name='ObstacleDetectionFront'),
+                mp.Process(target=_trigger_sensor_reading,
+                           args=(self._rear_sensor, self._stop_event),
+                           name='ObstacleDetectionRear'),
+            ]
 
         _logger.debug('{} initialized'.format(self.__class__.__name__))
 
+    @property
+    def sensors(self):
+        """tuple: The (front, rear) :obj:`UltrasonicSensor` objects.
+        """
+        return self._front_sensor, self._rear_sensor
+
+    @property
+    def distances_cm(self):
+        """tuple: Latest (front, rear) measured distances, in cm, or NaN if
+        not measured yet.
+        """
+        return self._distances_cm[0], self._distances_cm[1]
+
     def run(self):
-        self._obstacle_detection_process_front.start()
-        self._obstacle_detection_process_rear.start()
+        for process in self._obstacle_detection_processes:
+            process.start()
         _logger.debug('{} started'.format(self.__class__.__name__))
 
     def close(self):
-        self._obstacle_detection_process_front.terminate()
-        self._obstacle_detection_process_rear.terminate()
+        self._stop_event.set()
+
+        # Give the processes some time to properly exit, then terminate the
+        # ones still running, for example because blocked waiting for an echo.
+        deadline = time.monotonic() + self._CLOSE_TIMEOUT_s
+        for process in self._obstacle_detection_processes:
+            if process.pid is not None:
+                process.join(max(0., deadline - time.monotonic()))
 
-        # Join the terminated processes to give them time to properly exit.
-        self._obstacle_detection_process_front.join()
-        self._obstacle_detection_process_rear.join()
+        for process in self._obstacle_detection_processes:
+            if process.is_alive():
+                _logger.warning('{} did not stop in time: '
+                                'terminate it'.format(process.name))
+                process.terminate()
+                process.join(self._CLOSE_TIMEOUT_s)
 
         self._front_sensor.close()
         self._rear_sensor.close()
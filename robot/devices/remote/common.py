@@ -1,4 +1,7 @@
-from pynput import keyboard
+import collections
+
+import robot.devices.remote.protocol as protocol
+import robot.hardware as hardware
 
 
 class Commands:
@@ -18,18 +21,91 @@ class Commands:
     SHUTDOWN = b's'
 
 
-# Maps a key to a pair of commands to send respectively when pressing or
-# releasing the associated key.
-key_bindings = {
-    keyboard.Key.up: (Commands.FORWARD_ON,
-                      Commands.FORWARD_OFF),
-    keyboard.Key.down: (Commands.BACKWARD_ON,
-                        Commands.BACKWARD_OFF),
-    keyboard.Key.left: (Commands.LEFT_ON,
-                        Commands.LEFT_OFF),
-    keyboard.Key.right: (Commands.RIGHT_ON,
-                         Commands.RIGHT_OFF),
-    keyboard.Key.shift: (Commands.TURBO_ON,
-                         Commands.TURBO_OFF),
-    keyboard.KeyCode.from_char('q'): (None, Commands.SHUTDOWN),
+# Key bindings of the remote:
+#   legacy      Maps a key to a pair of commands to send respectively when
+#               pressing or releasing the associated key.
+#   commands    Maps a key to the bit of the commands bitmask which is set
+#               while the key is held down.
+#   shutdown    Key to shut down the robot.
+#   targets     In fleet mode, maps a key to the id of the robot to address.
+#               Key '0' addresses all the robots.
+#   groups      In fleet mode, maps a key to the bitmask of the group of
+#               robots to address.
+KeyBindings = collections.namedtuple('KeyBindings', ['legacy',
+                                                     'commands',
+                                                     'shutdown',
+                                                     'targets',
+                                                     'groups'])
+
+
+def load_key_bindings():
+    """Returns the key bindings of the remote. Loads the keyboard library,
+    which the robot does not need: call it on remote's side only.
+
+    The bindings are also available as the module attributes key_bindings,
+    command_bindings, shutdown_key, target_bindings and group_bindings,
+    loaded on first access.
+
+    Returns:
+        :obj:`KeyBindings`: The bindings.
+    """
+    keyboard = hardware.keyboard()
+    return KeyBindings(
+        legacy={
+            keyboard.Key.up: (Commands.FORWARD_ON,
+                              Commands.FORWARD_OFF),
+            keyboard.Key.down: (Commands.BACKWARD_ON,
+                                Commands.BACKWARD_OFF),
+            keyboard.Key.left: (Commands.LEFT_ON,
+                                Commands.LEFT_OFF),
+            keyboard.Key.right: (Commands.RIGHT_ON,
+                                 Commands.RIGHT_OFF),
+            keyboard.Key.shift: (Commands.TURBO_ON,
+                                 Commands.TURBO_OFF),
+            keyboard.KeyCode.from_char('q'): (None, Commands.SHUTDOWN),
+        },
+        commands={
+            keyboard.Key.up: protocol.FORWARD,
+            keyboard.Key.down: protocol.BACKWARD,
+            keyboard.Key.left: protocol.LEFT,
+            keyboard.Key.right: protocol.RIGHT,
+            keyboard.Key.shift: protocol.TURBO,
+        },
+        shutdown=keyboard.KeyCode.from_char('q'),
+        targets={keyboard.KeyCode.from_char(str(robot_id)): robot_id
+                 for robot_id in range(10)},
+        groups={
+            keyboard.Key.f1: 1 << 0,
+            keyboard.Key.f2: 1 << 1,
+            keyboard.Key.f3: 1 << 2,
+            keyboard.Key.f4: 1 << 3,
+            keyboard.Key.f5: 1 << 4,
+            keyboard.Key.f6: 1 << 5,
+            keyboard.Key.f7: 1 << 6,
+            keyboard.Key.f8: 1 << 7,
+        })
+
+
+# Module attributes of the former interface, loaded on first access: maps
+# each name to the field of the key bindings.
+_LEGACY_ATTRIBUTES = {
+    'key_bindings': 'legacy',
+    'command_bindings': 'commands',
+    'shutdown_key': 'shutdown',
+    'target_bindings': 'targets',
+    'group_bindings': 'groups',
 }
+
+_key_bindings = None
+
+
+def __getattr__(name):
+    global _key_bindings
+    field = _LEGACY_ATTRIBUTES.get(name)
+    if field is None:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(
+            __name__, name))
+
+    if _key_bindings is None:
+        _key_bindings = load_key_bindings()
+    return getattr(_key_bindings, field)
@@ -0,0 +1,201 @@
+"""Binary protocol between remote and robot.
+
+Every frame carries the full state of the controls, rather than a single
+key event, together with a sequence number. The robot can therefore drop
+frames arriving late or duplicated, and a lost frame is recovered by the
+next one instead of leaving a motor running.
+
+Frame layout (little endian, 10 bytes):
+    magic       uint8   Always _MAGIC.
+    version     uint8   Protocol version.
+    flags       uint8   Bitmask of FLAG_* values.
+    session     uint16  Random id chosen by the sender at startup, so that
+                        a restarted sender is not mistaken for a stale one.
+    sequence    uint32  Incremented by the sender at every frame.
+    commands    uint8   Bitmask of the active controls, where bit i
+                        corresponds to the driver command with code i.
+
+Fleet frames, sent to several robots at once over multicast, have version
+FLEET_VERSION and two more bytes (12 bytes):
+    target      uint8   Id of the robot addressed, or ALL_ROBOTS to address
+                        the groups instead.
+    groups      uint8   If target is ALL_ROBOTS, bitmask of the groups
+                        addressed, or ALL_GROUPS to address every robot.
+A robot ignores the fleet frames which do not address it, and accepts all
+the other frames.
+
+Legacy senders send a single byte from common.Commands per key event: those
+frames are recognized by their length.
+"""
+import collections
+import random
+import struct
+
+VERSION = 1
+FLEET_VERSION = 2
+
+_MAGIC = 0xB6
+_FRAME = struct.Struct('<BBBHIB')
+_FLEET_FRAME = struct.Struct('<BBBHIBBB')
+
+# Session and sequence number, after magic, version and flags.
+_SEQUENCE_FIELDS = struct.Struct('<HI')
+_SEQUENCE_OFFSET = 3
+
+FRAME_SIZE = _FRAME.size
+FLEET_FRAME_SIZE = _FLEET_FRAME.size
+
+# Offsets of the addressing fields in a fleet frame, to filter the frames
+# without decoding them.
+_TARGET_OFFSET = FRAME_SIZE
+_GROUPS_OFFSET = FRAME_SIZE + 1
+
+# Addressing of the fleet frames. Robot ids go from 1 to MAX_ROBOT_ID.
+ALL_ROBOTS = 0
+MAX_ROBOT_ID = 0xFF
+ALL_GROUPS = 0xFF
+
+_SEQUENCE_MODULO = 1 << 32
+
+# Bits of the commands bitmask. They match the driver command codes.
+FORWARD = 1 << 0
+BACKWARD = 1 << 1
+LEFT = 1 << 2
+RIGHT = 1 << 3
+TURBO = 1 << 4
+
+# Frame flags.
+FLAG_SNAPSHOT = 1 << 0      # Periodic re-send of an unchanged state.
+FLAG_SHUTDOWN = 1 << 1      # Shut the robot down.
+
+# Frames with target None are not fleet frames.
+Frame = collections.namedtuple('Frame',
+                               ['flags', 'session', 'sequence', 'commands',
+                                'target', 'groups'],
+                               defaults=(None, ALL_GROUPS))
+
+
+def new_session():
+    """Returns a random session id for a new sender.
+    """
+    return random.getrandbits(16)
+
+
+def encode(frame):
+    """Packs a frame into bytes.
+
+    Args:
+        frame (:obj:`Frame`): The frame to pack.
+
+    Returns:
+        bytes: The packed frame.
+    """
+    if frame.target is not None:
+        return _FLEET_FRAME.pack(_MAGIC,
+                                 FLEET_VERSION,
+                                 frame.flags,
+                                 frame.session,
+                                 frame.sequence % _SEQUENCE_MODULO,
+                                 frame.commands,
+                                 frame.target,
+                                 frame.groups)
+
+    return _FRAME.pack(_MAGIC,
+                       VERSION,
+                       frame.flags,
+                       frame.session,
+                       frame.sequence % _SEQUENCE_MODULO,
+                       frame.commands)
+
+
+def decode(data):
+    """Unpacks a frame.
+
+    Args:
+        data (bytes): The received data.
+
+    Returns:
+        :obj:`Frame`: The unpacked frame, or None if the data is not a valid
+            frame of this version.
+    """
+    if len(data) == FLEET_FRAME_SIZE:
+        magic, version, flags, session, sequence, commands, target, groups = \
+            _FLEET_FRAME.unpack(data)
+        if magic != _MAGIC or version != FLEET_VERSION:
+            return None
+
+        return Frame(flags=flags,
+                     session=session,
+                     sequence=sequence,
+                     commands=commands,
+                     target=target,
+                     groups=groups)
+
+    if len(data) != FRAME_SIZE:
+        return None
+
+    magic, version, flags, session, sequence, commands = _FRAME.unpack(data)
+    if magic != _MAGIC or version != VERSION:
+        return None
+
+    return Frame(flags=flags,
+                 session=session,
+                 sequence=sequence,
+                 commands=commands)
+
+
+def is_addressed_to(data, robot_id, groups):
+    """Tells whether a received frame concerns a robot, by looking at its
+    addressing fields only. Not-fleet frames concern every robot.
+
+    Args:
+        data (bytes-like): The received frame.
+        robot_id (int): Id of the robot.
+        groups (int): Bitmask of the groups of the robot.
+
+    Returns:
+        bool: False if the frame is a fleet frame addressed to other robots.
+    """
+    if len(data) != FLEET_FRAME_SIZE:
+        return True
+
+    target = data[_TARGET_OFFSET]
+    if target != ALL_ROBOTS:
+        return target == robot_id
+
+    target_groups = data[_GROUPS_OFFSET]
+    return target_groups == ALL_GROUPS or bool(target_groups & groups)
+
+
+def peek_sequence(data):
+    """Reads the session and the sequence number of a frame, without
+    decoding nor validating it, for example to account for the fleet frames
+    addressed to other robots.
+
+    Args:
+        data (bytes-like): The received frame.
+
+    Returns:
+        tuple: The (session, sequence) of the frame, or None if it is not a
+            frame of this protocol.
+    """
+    if len(data) not in (FRAME_SIZE, FLEET_FRAME_SIZE) \
+            or data[0] != _MAGIC:
+        return None
+
+    return _SEQUENCE_FIELDS.unpack_from(data, _SEQUENCE_OFFSET)
+
+
+def is_newer(sequence, last_sequence):
+    """Tells whether a sequence number follows another one, taking into
+    account the wrap-around of the counter.
+
+    Args:
+        sequence (int): The sequence number of the received frame.
+        last_sequence (int): The sequence number of the latest accepted frame.
+
+    Returns:
+        bool: True if the frame is newer than the latest accepted one.
+    """
+    difference = (sequence - last_sequence) % _SEQUENCE_MODULO
+    return 0 < difference < _SEQUENCE_MODULO // 2
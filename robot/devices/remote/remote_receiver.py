@@ -1,17 +1,66 @@
+import asyncio
+import collections
 import logging
-import signal
 
 import robot.devices.led_status as ls
 import robot.devices.remote.common as common
+import robot.devices.remote.protocol as protocol
+import robot.devices.remote.watchdog as watchdog
+import robot.instrumentation as instrumentation
 import robot.motion.driver as dvr
 import robot.network as network
+import robot.recording as recording
 
 _logger = logging.getLogger(__name__)
 
+# Maps each single-byte command of legacy senders to the driver command code
+# and value to set.
+_LEGACY_COMMANDS = {
+    common.Commands.FORWARD_ON: (dvr.COMMAND_FORWARD, True),
+    common.Commands.FORWARD_OFF: (dvr.COMMAND_FORWARD, False),
+    common.Commands.BACKWARD_ON: (dvr.COMMAND_BACKWARD, True),
+    common.Commands.BACKWARD_OFF: (dvr.COMMAND_BACKWARD, False),
+    common.Commands.LEFT_ON: (dvr.COMMAND_LEFT, True),
+    common.Commands.LEFT_OFF: (dvr.COMMAND_LEFT, False),
+    common.Commands.RIGHT_ON: (dvr.COMMAND_RIGHT, True),
+    common.Commands.RIGHT_OFF: (dvr.COMMAND_RIGHT, False),
+    common.Commands.TURBO_ON: (dvr.COMMAND_TURBO, True),
+    common.Commands.TURBO_OFF: (dvr.COMMAND_TURBO, False),
+}
+
 
 class RemoteReceiver:
     """Remote controller on robot's side: receives signals from the sender at
     user's side.
+
+    The receiver accepts both the sequenced frames of the protocol module,
+    applying only the newest state and dropping stale frames, and the legacy
+    single bytes of common.Commands.
+
+    A new session, that is a new or restarted sender, takes over the robot
+    with its first frame. The sessions it replaced cannot take it back, so
+    that their late frames are dropped, until the link times out.
+
+    The receiver runs in an asyncio event loop: run() starts a dedicated one,
+    while serve() can share a loop with other tasks. Every time the socket is
+    readable, all the pending datagrams are received at once and only the
+    resulting state is applied to the driver: after a network hiccup, a burst
+    of queued packets moves the motors once rather than replaying every
+    intermediate state.
+
+    The receiver listens on port `port` of the interface with address or
+    hostname `ip`, or of all the interfaces if `ip` is empty.
+
+    If `robot_id` is provided, the robot is part of a fleet: the receiver also
+    listens to the fleet multicast group, and drops the fleet frames
+    addressed to other robots before decoding them. `groups` is the bitmask
+    of the groups the robot belongs to. The sequence numbers of those frames
+    still reach the watchdog, so that they do not count as lost.
+
+    If a recorder (see robot.recording) is provided, the commands resulting
+    from every batch of packets are recorded. If instrumentation (see
+    robot.instrumentation) is enabled, the inter-arrival time of the batches
+    and the number of datagrams are measured.
     """
 
     # The remote sends a signal to start the motors and a signal to stop
@@ -19,80 +68,299 @@ class RemoteReceiver:
     # never stop. For this reason, the sender has to keep sending data to
     # the receiver. If data is not received for a large enough interval,
     # the receiver will interpret it as a communication breakdown and will
-    # stop the motors automatically.
+    # stop the motors automatically. The interval adapts to the heartbeat
+    # rate of the sender, within these bounds. Legacy senders have no
+    # heartbeat and always get the upper bound.
+    _MIN_NO_SIGNAL_RECEIVED_TIMEOUT_s = 0.2
     _NO_SIGNAL_RECEIVED_TIMEOUT_s = 1.0
 
-    def __init__(self, driver, status_led):
+    # How many replaced sessions to remember.
+    _MAX_RETIRED_SESSIONS = 16
+
+    def __init__(self, driver, status_led, recorder=None,
+                 ip='', port=network.PORT,
+                 robot_id=None, groups=0):
+        if robot_id is not None and \
+                not 0 < robot_id <= protocol.MAX_ROBOT_ID:
+            raise ValueError('Robot id must be between 1 and {}. Provided is '
+                             '{}'.format(protocol.MAX_ROBOT_ID, robot_id))
+
         self._driver = driver
+        self._recorder = recorder
         self._status_led = status_led
-        self._server = network.UDPServer(ip=network.RASPBERRYPI_HOSTNAME,
-                                         port=network.PORT)
+        self._robot_id = robot_id
+        self._groups = groups
+        self._server = network.UDPServer(
+            ip=ip,
+            port=port,
+            multicast_group=None if robot_id is None else network.FLEET_GROUP)
+
+        self._watchdog = watchdog.LinkWatchdog(
+            on_timeout=self._on_timeout,
+            min_timeout_s=self._MIN_NO_SIGNAL_RECEIVED_TIMEOUT_s,
+            max_timeout_s=self._NO_SIGNAL_RECEIVED_TIMEOUT_s)
+
+        # Session and sequence number of the latest accepted frame.
+        self._session = None
+        self._sequence = None
+
+        # Sessions replaced by a newer one since the link is up.
+        self._retired_sessions = collections.deque(
+            maxlen=self._MAX_RETIRED_SESSIONS)
+        self._num_stale_frames = 0
+        self._num_foreign_frames = 0
+
+        # Sequence number of the latest accepted frame which was not a
+        # snapshot, to acknowledge the state changes to the remote.
+        self._acked_sequence = 0
+
+        self._arrival_period = instrumentation.period(
+            'remote_receiver.arrival')
+        self._num_datagrams = instrumentation.counter(
+            'remote_receiver.datagrams')
 
-        signal.signal(signal.SIGALRM, self._on_timeout)
+        # Resolved when the robot must shut down. Created by serve(), in the
+        # event loop.
+        self._shutdown = None
+        self._closed = False
 
-        self._status_led.set(ls.Status.WAITING_FOR_REMOTE)
+        self._status = None
+        self._set_status(ls.Status.WAITING_FOR_REMOTE)
 
         _logger.debug('{} initialized'.format(self.__class__.__name__))
 
-    def _on_timeout(self, signum, frame):
+    def _on_timeout(self):
         _logger.warning('Signal from remote stopped unexpectedly: '
                         'stop the motors')
-        self._driver.stop()
-        self._status_led.set(ls.Status.WAITING_FOR_REMOTE)
+        self._driver.stop(reason=recording.STOP_LINK_LOST)
+        self._set_status(ls.Status.WAITING_FOR_REMOTE)
 
-    def run(self):
+        # Any sender can take over the broken link, including one which was
+        # replaced before.
+        if self._session is not None:
+            self._retired_sessions.clear()
+            self._session = None
+            self._sequence = None
+
+    def _set_status(self, status):
+        """Sets the status LED, if the status changed.
+        """
+        if status == self._status:
+            return
+
+        self._status = status
+        self._status_led.set(status)
+
+    def _is_newest(self, frame):
+        """Tells whether a frame is newer than all the accepted ones and, if
+        so, accepts it.
+
+        Args:
+            frame (:obj:`protocol.Frame`): The received frame.
+
+        Returns:
+            bool: True if the frame is accepted.
+        """
+        if frame.session == self._session and \
+                not protocol.is_newer(frame.sequence, self._sequence):
+            # Late or duplicated frame.
+            self._num_stale_frames += 1
+            return False
+
+        if frame.session in self._retired_sessions:
+            # Late frame from a sender which was replaced.
+            self._num_stale_frames += 1
+            return False
+
+        if frame.session != self._session:
+            _logger.info('Receiving from remote session {}'.format(
+                frame.session))
+            if self._session is not None:
+                self._retired_sessions.append(self._session)
+            self._watchdog.sequence_received(None)
+
+        self._session = frame.session
+        self._sequence = frame.sequence
+        self._watchdog.sequence_received(frame.sequence)
+        return True
+
+    def _foreign_sequence_received(self, data):
+        """Accounts for a frame addressed to other robots in the packet loss
+        estimate: the sender numbers the frames for the whole fleet.
+        """
+        session_sequence = protocol.peek_sequence(data)
+        if session_sequence is None:
+            return
+
+        session, sequence = session_sequence
+        if session == self._session:
+            self._watchdog.sequence_received(sequence)
+
+    def _handle_frame(self, data, commands):
+        """Applies the state carried by a frame, if it is the newest.
+
+        Args:
+            data (bytes-like): The received frame.
+            commands (int): Bitmask of the commands before the frame.
+
+        Returns:
+            tuple: Whether the frame was accepted, and the bitmask of the
+                commands after the frame, or None if the robot must shut
+                down.
+        """
+        frame = protocol.decode(data)
+        if frame is None:
+            _logger.warning('Invalid frame received')
+            return False, commands
+
+        if not self._is_newest(frame):
+            return False, commands
+
+        if not frame.flags & protocol.FLAG_SNAPSHOT:
+            self._acked_sequence = frame.sequence
+
+        if frame.flags & protocol.FLAG_SHUTDOWN:
+            return True, None
+
+        return True, frame.commands
+
+    def _handle_legacy_byte(self, data_byte, commands):
+        """Applies a single command from a legacy sender.
+
+        Args:
+            data_byte (bytes): The received command.
+            commands (int): Bitmask of the commands before the command.
+
+        Returns:
+            tuple: Whether the command was accepted, that is known, and the
+                bitmask of the commands after the command, or None if the
+                robot must shut down.
+        """
+        if data_byte == common.Commands.SHUTDOWN:
+            return True, None
+
+        command = _LEGACY_COMMANDS.get(data_byte)
+        if command is None:
+            return False, commands
+
+        command_code, command_value = command
+        if command_value:
+            return True, commands | (1 << command_code)
+
+        return True, commands & ~(1 << command_code)
+
+    def _on_readable(self):
+        datagrams = self._server.receive_batch(block=False)
+        if not datagrams or self._shutdown.done():
+            return
+
+        if self._arrival_period is not None:
+            self._arrival_period.tick()
+            self._num_datagrams.increment(len(datagrams))
+
+        commands = self._driver.command_mask
+        num_accepted = 0
+        num_legacy = 0
+        for data in datagrams:
+            if self._robot_id is not None and not protocol.is_addressed_to(
+                    data, self._robot_id, self._groups):
+                self._num_foreign_frames += 1
+                self._foreign_sequence_received(data)
+                continue
+
+            if len(data) == 1:
+                # Single bytes are cached by the interpreter: no allocation.
+                accepted, commands = self._handle_legacy_byte(bytes(data),
+                                                              commands)
+                num_legacy += accepted
+            else:
+                accepted, commands = self._handle_frame(data, commands)
+            num_accepted += accepted
+
+            if commands is None:
+                self._driver.stop(reason=recording.STOP_SHUTDOWN)
+                self._shutdown.set_result(None)
+                return
+
+        if num_accepted == 0:
+            # Only traffic for the rest of the fleet, stale frames from
+            # replaced sessions or garbage: the link is not proven alive.
+            return
+
+        # Any accepted packet proves that the link is alive, but only the
+        # frames of the protocol come with a heartbeat.
+        self._watchdog.packet_received(heartbeat=num_legacy < num_accepted)
+
+        # Only the latest state of a burst reaches the motors.
+        if self._recorder is not None:
+            self._recorder.record(recording.KIND_REMOTE, value=commands)
+        self._driver.set_command_mask(commands)
+        self._set_status(ls.Status.READING_REMOTE)
+
+    async def serve(self):
+        """Receives from the remote until a shutdown command is received.
+        """
         _logger.debug('{} started'.format(self.__class__.__name__))
 
+        loop = asyncio.get_running_loop()
+        self._shutdown = loop.create_future()
+        self._server.socket.setblocking(False)
+        loop.add_reader(self._server.socket.fileno(), self._on_readable)
+        watchdog_task = loop.create_task(self._watchdog.run())
         try:
-            for data_byte in self._server.receive():
-                if data_byte == common.Commands.SHUTDOWN:
-                    self._driver.stop()
-                    break
-                elif data_byte == common.Commands.FORWARD_ON:
-                    self._driver.set_command(command_code=dvr.COMMAND_FORWARD,
-                                             command_value=True)
-                elif data_byte == common.Commands.FORWARD_OFF:
-                    self._driver.set_command(command_code=dvr.COMMAND_FORWARD,
-                                             command_value=False)
-                elif data_byte == common.Commands.BACKWARD_ON:
-                    self._driver.set_command(command_code=dvr.COMMAND_BACKWARD,
-                                             command_value=True)
-                elif data_byte == common.Commands.BACKWARD_OFF:
-                    self._driver.set_command(command_code=dvr.COMMAND_BACKWARD,
-                                             command_value=False)
-                elif data_byte == common.Commands.LEFT_ON:
-                    self._driver.set_command(command_code=dvr.COMMAND_LEFT,
-                                             command_value=True)
-                elif data_byte == common.Commands.LEFT_OFF:
-                    self._driver.set_command(command_code=dvr.COMMAND_LEFT,
-                                             command_value=False)
-                elif data_byte == common.Commands.RIGHT_ON:
-                    self._driver.set_command(command_code=dvr.COMMAND_RIGHT,
-                                             command_value=True)
-                elif data_byte == common.Commands.RIGHT_OFF:
-                    self._driver.set_command(command_code=dvr.COMMAND_RIGHT,
-                                             command_value=False)
-                elif data_byte == common.Commands.TURBO_ON:
-                    self._driver.set_command(command_code=dvr.COMMAND_TURBO,
-                                             command_value=True)
-                elif data_byte == common.Commands.TURBO_OFF:
-                    self._driver.set_command(command_code=dvr.COMMAND_TURBO,
-                                             command_value=False)
-
-                # Reset the timer to trigger an alarm signal if the next signal
-                # from the sender takes too long.
-                signal.setitimer(signal.ITIMER_REAL,
-                                 self._NO_SIGNAL_RECEIVED_TIMEOUT_s,
-                                 0)
-
-                self._status_led.set(ls.Status.READING_REMOTE)
+            await self._shutdown
 
         finally:
             # If anything happens, make sure to shut things down properly.
-            self._close()
+            watchdog_task.cancel()
+            loop.remove_reader(self._server.socket.fileno())
+            self.close()
 
-    def _close(self):
-        # Cancel the alarm.
-        signal.setitimer(signal.ITIMER_REAL, 0, 0)
+    def run(self):
+        asyncio.run(self.serve())
+
+    def close(self):
+        """Closes the socket. Called at the end of serve(), and to call if
+        the receiver is never served.
+        """
+        if self._closed:
+            return
+
+        self._closed = True
         self._server.close()
-        _logger.debug('{} stopped'.format(self.__class__.__name__))
+        _logger.debug('{} stopped, dropped {} stale frames and {} frames for '
+                      'other robots, link quality: {}'.format(
+                          self.__class__.__name__,
+                          self._num_stale_frames,
+                          self._num_foreign_frames,
+                          self._watchdog.link_quality))
+
+    @property
+    def remote_ip(self):
+        """str: IP address of the remote, learned from the latest received
+        packets, or None if nothing was received yet.
+        """
+        address = self._server.last_address
+        if address is None:
+            return None
+        return address[0]
+
+    @property
+    def robot_id(self):
+        """int: Id of the robot in the fleet, or None if not in a fleet.
+        """
+        return self._robot_id
+
+    @property
+    def acked_sequence(self):
+        """int: Sequence number of the latest state change received from
+        the remote, or 0 if none.
+        """
+        return self._acked_sequence
+
+    @property
+    def link_quality(self):
+        """dict: Quality of the link with the remote, see
+        LinkWatchdog.link_quality.
+        """
+        return self._watchdog.link_quality
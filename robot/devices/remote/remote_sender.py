@@ -1,9 +1,12 @@
 import logging
-
-from pynput import keyboard
+import threading
+import time
 
 import robot.devices.remote.common as common
+import robot.devices.remote.protocol as protocol
+import robot.hardware as hardware
 import robot.network as network
+import robot.telemetry as telemetry
 
 _logger = logging.getLogger(__name__)
 
@@ -14,45 +17,227 @@ Hold shift for turbo.
 Press 'q' to shut down the robot (but not the remote).
 """
 
+_fleet_instructions = """Press 1 to 9 to control a single robot.
+Press F1 to F8 to control a group of robots.
+Press 0 to control all the robots.
+'q' shuts down the robots controlled.
+"""
+
 
 class RemoteSender:
     """Remote controller on user's side.
 
-    The remote sends raw signals: it is up to the receiver to interpret them.
+    The remote sends the full state of the controls in sequenced frames (see
+    the protocol module): it is up to the receiver to interpret them. A frame
+    is sent as soon as the state changes. Auto-repeated key presses do not
+    change the state, hence they are not sent.
+
+    Whenever no frame was sent for a heartbeat period, the unchanged state is
+    re-sent as a snapshot: the receiver relies on this heartbeat to tell that
+    the link is alive, without depending on the auto-repeat of the keyboard.
+
+    The frames are sent to the robot at `ip`, a hostname or an IP address,
+    on port `port`. The hostname is resolved once, not at every frame (see
+    robot.network.Endpoint).
+
+    If `fleet` is set, `ip` is ignored and the frames are multicast to a
+    fleet of robots on port `port`. They address the robot or group of
+    robots selected with the keyboard: all of them at first. Before
+    switching to other robots, the ones controlled so far are stopped.
+
+    If `show_telemetry` is set, the telemetry sent back by each robot is
+    shown on a continuously updated line.
     """
 
-    def __init__(self):
-        self._client = network.UDPClient(ip=network.RASPBERRYPI_HOSTNAME,
-                                         port=network.PORT)
+    _DEFAULT_HEARTBEAT_HZ = 10.
+
+    # Failed sends are logged at most this often, in seconds.
+    _SEND_ERROR_LOG_INTERVAL_s = 5.
+
+    def __init__(self, heartbeat_hz=_DEFAULT_HEARTBEAT_HZ,
+                 show_telemetry=False, ip=network.RASPBERRYPI_HOSTNAME,
+                 port=network.PORT, fleet=False, interface_ip=None):
+        if heartbeat_hz <= 0:
+            raise ValueError('Heartbeat rate must be positive. '
+                             'Provided is {}'.format(heartbeat_hz))
+        self._heartbeat_interval_s = 1 / heartbeat_hz
+        self._keyboard = hardware.keyboard()
+        self._keys = common.load_key_bindings()
+
+        self._fleet = fleet
+        if fleet:
+            self._client = network.MulticastClient(ip=network.FLEET_GROUP,
+                                                   port=port,
+                                                   interface_ip=interface_ip)
+        else:
+            self._client = network.UDPClient(ip=ip, port=port)
+
+        self._session = protocol.new_session()
+        self._sequence = 0
+        self._commands = 0
+        self._target = protocol.ALL_ROBOTS
+        self._groups = protocol.ALL_GROUPS
+        self._last_send_s = time.monotonic()
+        self._num_send_errors = 0
+        self._last_send_error_log_s = None
+
+        # Frames are sent both by the keyboard listener and by the heartbeat
+        # thread.
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._heartbeat_thread = threading.Thread(target=self._send_heartbeats,
+                                                  name='RemoteHeartbeat',
+                                                  daemon=True)
+
+        self._telemetry_display = None
+        if show_telemetry:
+            self._telemetry_display = telemetry.TelemetryDisplay()
+
         _logger.debug('{} initialized'.format(self.__class__.__name__))
 
+    def _send(self, flags=0):
+        """Sends the current state. The caller must hold the lock.
+
+        The heartbeat thread and the keyboard listener both send through
+        here: a failed send, for example because the network is down, is
+        logged and dropped, so that neither of them dies. The next frame
+        carries the full state anyway.
+
+        Args:
+            flags (int, optional): Flags of the frame.
+        """
+        self._sequence += 1
+        frame = protocol.Frame(flags=flags,
+                               session=self._session,
+                               sequence=self._sequence,
+                               commands=self._commands)
+        if self._fleet:
+            frame = frame._replace(target=self._target, groups=self._groups)
+        try:
+            self._client.send(protocol.encode(frame))
+        except OSError as e:
+            self._send_failed(e)
+        self._last_send_s = time.monotonic()
+
+    def _send_failed(self, error):
+        """Logs a failed send, at most every _SEND_ERROR_LOG_INTERVAL_s."""
+        self._num_send_errors += 1
+        now_s = time.monotonic()
+        if self._last_send_error_log_s is not None and \
+                now_s - self._last_send_error_log_s \
+                < self._SEND_ERROR_LOG_INTERVAL_s:
+            return
+
+        self._last_send_error_log_s = now_s
+        _logger.warning('Cannot send to the robot ({} failed sends so far): '
+                        '{}'.format(self._num_send_errors, error))
+
+    def _update_commands(self, set_bits=0, clear_bits=0):
+        with self._lock:
+            commands = (self._commands | set_bits) & ~clear_bits
+            if commands == self._commands:
+                # Nothing changed, for example because of auto-repeat.
+                return
+
+            self._commands = commands
+            self._send()
+
+    def _select(self, target, groups):
+        """Switches to controlling other robots, after stopping the current
+        ones.
+
+        Args:
+            target (int): Id of the robot to control, or ALL_ROBOTS.
+            groups (int): If target is ALL_ROBOTS, bitmask of the groups to
+                control.
+        """
+        with self._lock:
+            if (target, groups) == (self._target, self._groups):
+                return
+
+            if self._commands:
+                self._commands = 0
+                self._send()
+
+            self._target = target
+            self._groups = groups
+            # Let the new robots know of the current state right away.
+            self._send()
+
+        if target != protocol.ALL_ROBOTS:
+            description = 'robot {}'.format(target)
+        elif groups == protocol.ALL_GROUPS:
+            description = 'all the robots'
+        else:
+            description = 'groups {:08b}'.format(groups)
+        _logger.info('Controlling {}'.format(description))
+
+    def _send_heartbeats(self):
+        wait_s = self._heartbeat_interval_s
+        while not self._stop_event.wait(wait_s):
+            with self._lock:
+                # Frames sent because of a state change count as heartbeats.
+                wait_s = self._last_send_s + self._heartbeat_interval_s \
+                    - time.monotonic()
+                if wait_s <= 0:
+                    self._send(flags=protocol.FLAG_SNAPSHOT)
+                    wait_s = self._heartbeat_interval_s
+
     def _on_press(self, key):
-        data_byte = common.key_bindings.get(key, (None, None))[0]
-        if data_byte is not None:
-            self._client.send(data_byte)
+        command_bit = self._keys.commands.get(key)
+        if command_bit is not None:
+            self._update_commands(set_bits=command_bit)
+            return
+
+        if not self._fleet:
+            return
+
+        robot_id = self._keys.targets.get(key)
+        if robot_id is not None:
+            self._select(robot_id, protocol.ALL_GROUPS)
+            return
+
+        group = self._keys.groups.get(key)
+        if group is not None:
+            self._select(protocol.ALL_ROBOTS, group)
 
     def _on_release(self, key):
-        if key == keyboard.Key.esc:
+        if key == self._keyboard.Key.esc:
             # Note that this will shut down the remote but not the robot!
             return False
 
-        data_byte = common.key_bindings.get(key, (None, None))[1]
-        if data_byte is not None:
-            self._client.send(data_byte)
+        if key == self._keys.shutdown:
+            with self._lock:
+                self._commands = 0
+                self._send(flags=protocol.FLAG_SHUTDOWN)
+            return
+
+        command_bit = self._keys.commands.get(key)
+        if command_bit is not None:
+            self._update_commands(clear_bits=command_bit)
 
     def run(self):
         _logger.debug('{} started'.format(self.__class__.__name__))
 
         print(_instructions)
-        listener = keyboard.Listener(on_press=self._on_press,
-                                     on_release=self._on_release,
-                                     suppress=True)
+        if self._fleet:
+            print(_fleet_instructions)
+        listener = self._keyboard.Listener(on_press=self._on_press,
+                                           on_release=self._on_release,
+                                           suppress=True)
 
         listener.start()
+        self._heartbeat_thread.start()
+        if self._telemetry_display is not None:
+            self._telemetry_display.start()
         try:
             listener.wait()
             listener.join()
         finally:
             listener.stop()
+            self._stop_event.set()
+            self._heartbeat_thread.join()
+            if self._telemetry_display is not None:
+                self._telemetry_display.close()
             self._client.close()
             _logger.debug('{} stopped'.format(self.__class__.__name__))
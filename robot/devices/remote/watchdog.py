@@ -0,0 +1,181 @@
+"""Watchdog detecting a broken link between remote and robot.
+
+The remote sends frames at a regular heartbeat rate, even when the state of
+the controls does not change. The watchdog measures the time between packets
+and raises an alarm if no packet is received for much longer than usual.
+
+The timeout adapts to the link, in the same way TCP estimates its
+retransmission timeout: it tracks the smoothed interval between packets and
+its mean deviation, and allows for a few lost heartbeats plus the jitter. A
+steady link with a fast heartbeat is thus monitored with a short timeout,
+while a jittery or slow one gets a longer timeout, always within bounds.
+
+Legacy senders have no heartbeat: they rely on the auto-repeat of the keys,
+whose initial delay is up to several hundred milliseconds. Their packets
+re-arm the watchdog but reset the estimate, so that the timeout stays at its
+upper bound until heartbeat packets are received again.
+"""
+import asyncio
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+_SEQUENCE_MODULO = 1 << 32
+
+
+class LinkWatchdog:
+    """Calls a function when the link seems broken.
+
+    The watchdog is armed by the first received packet and disarmed when it
+    fires, until the next packet is received. It runs as a task of an asyncio
+    event loop, and all its methods must be called from the same loop.
+
+    Attributes:
+        _on_timeout (callable): Function to call when the link seems broken.
+        _min_timeout_s (float): Lower bound of the timeout, in seconds.
+        _max_timeout_s (float): Upper bound of the timeout, in seconds.
+    """
+
+    # Gains of the exponential moving averages of the interval between
+    # packets and of its deviation, like the ones of TCP.
+    _INTERVAL_GAIN = 1 / 8
+    _DEVIATION_GAIN = 1 / 4
+
+    # The timeout allows for this many consecutive lost packets...
+    _MAX_LOST_PACKETS = 2
+
+    # ...plus this many times the mean deviation of the interval.
+    _DEVIATION_FACTOR = 4
+
+    # Gain of the exponential moving average of the packet loss.
+    _LOSS_GAIN = 1 / 32
+
+    # How often to log the link quality.
+    _REPORT_INTERVAL_s = 10.
+
+    def __init__(self, on_timeout, min_timeout_s=0.2, max_timeout_s=1.0):
+        self._on_timeout = on_timeout
+        self._min_timeout_s = min_timeout_s
+        self._max_timeout_s = max_timeout_s
+
+        # Created by run(), in the event loop, to wake it up before the
+        # deadline it is waiting for.
+        self._wakeup = None
+        self._deadline_s = None
+
+        self._armed = False
+        self._last_packet_s = None
+        self._interval_s = None
+        self._deviation_s = 0.
+        self._last_sequence = None
+        self._loss_rate = 0.
+        self._num_timeouts = 0
+
+    @property
+    def timeout_s(self):
+        """float: Current timeout, in seconds.
+        """
+        if self._interval_s is None:
+            return self._max_timeout_s
+
+        timeout_s = (1 + self._MAX_LOST_PACKETS) * self._interval_s \
+            + self._DEVIATION_FACTOR * self._deviation_s
+        return min(max(timeout_s, self._min_timeout_s), self._max_timeout_s)
+
+    @property
+    def link_quality(self):
+        """dict: Smoothed interval between packets and its deviation, in
+        seconds, fraction of lost packets, current timeout and number of
+        timeouts so far.
+        """
+        return {
+            'interval_s': self._interval_s,
+            'jitter_s': self._deviation_s,
+            'loss_rate': self._loss_rate,
+            'timeout_s': self.timeout_s,
+            'num_timeouts': self._num_timeouts,
+        }
+
+    def packet_received(self, heartbeat=True):
+        """Records the arrival of a packet and re-arms the watchdog.
+
+        Args:
+            heartbeat (bool, optional): False if the packet comes from a
+                sender without heartbeat, like a legacy one. The timeout
+                then goes back to its upper bound.
+        """
+        now_s = time.monotonic()
+        if not heartbeat:
+            self._interval_s = None
+            self._deviation_s = 0.
+        elif self._armed:
+            # Long pauses, for example while the watchdog was disarmed, must
+            # not inflate the estimate.
+            interval_s = min(now_s - self._last_packet_s, self._max_timeout_s)
+            if self._interval_s is None:
+                self._interval_s = interval_s
+                self._deviation_s = interval_s / 2
+            else:
+                error_s = interval_s - self._interval_s
+                self._interval_s += self._INTERVAL_GAIN * error_s
+                self._deviation_s += self._DEVIATION_GAIN \
+                    * (abs(error_s) - self._deviation_s)
+
+        self._last_packet_s = now_s
+        self._armed = True
+
+        # Usually packets move the deadline forward and the watchdog does not
+        # need to know. However, it must wake up if it is sleeping with no
+        # deadline, or with a later one because the timeout got shorter.
+        if self._wakeup is not None and (
+                self._deadline_s is None
+                or now_s + self.timeout_s < self._deadline_s):
+            self._wakeup.set()
+
+    def sequence_received(self, sequence):
+        """Records the sequence number of an accepted packet to estimate the
+        packet loss.
+
+        Args:
+            sequence (int): Sequence number of the packet, or None to restart
+                the count, for example because the sender changed. Sequence
+                numbers older than the previous one are ignored.
+        """
+        if sequence is not None and self._last_sequence is not None:
+            num_lost = (sequence - self._last_sequence) % _SEQUENCE_MODULO - 1
+            if num_lost < 0 or num_lost >= _SEQUENCE_MODULO // 2:
+                # Duplicated or late packet, already counted as lost.
+                return
+
+            self._loss_rate += self._LOSS_GAIN * (
+                num_lost / (num_lost + 1) - self._loss_rate)
+        self._last_sequence = sequence
+
+    async def run(self):
+        """Watches the link until cancelled.
+        """
+        self._wakeup = asyncio.Event()
+        next_report_s = time.monotonic() + self._REPORT_INTERVAL_s
+        while True:
+            wait_s = self._REPORT_INTERVAL_s
+            self._deadline_s = None
+            if self._armed:
+                self._deadline_s = self._last_packet_s + self.timeout_s
+                wait_s = self._deadline_s - time.monotonic()
+                if wait_s <= 0:
+                    self._armed = False
+                    self._num_timeouts += 1
+                    self._on_timeout()
+                    continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(),
+                                       min(wait_s, self._REPORT_INTERVAL_s))
+            except asyncio.TimeoutError:
+                pass
+
+            if time.monotonic() >= next_report_s:
+                next_report_s += self._REPORT_INTERVAL_s
+                _logger.debug('Link quality: {}'.format(self.link_quality))
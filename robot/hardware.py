@@ -0,0 +1,128 @@
+"""Access to the hardware libraries, loaded only when a device is built.
+
+The devices get their libraries from this module when they are created
+rather than importing them at module load:
+    gpio()          RPi.GPIO, for the ultrasonic sensors.
+    gpiozero()      gpiozero, for the motors, the LED and the line sensors.
+    keyboard()      pynput's keyboard, for the remote.
+
+Importing the control code is then fast and does not require the libraries,
+so that for example the remote does not drag in the GPIO ones. The
+libraries come from the selected backend:
+    'rpi'           The real libraries, on the robot (default).
+    'mock'          robot.mock_gpio and gpiozero's mock pins, to run the
+                    control code on any machine, like the simulation does.
+
+Other backends can be added with register_backend(). The backend must be
+selected before building the first device.
+
+Example:
+    import robot.hardware as hardware
+    hardware.use_backend('mock')
+    driver = Driver()   # Drives mock pins.
+"""
+import logging
+import threading
+
+_logger = logging.getLogger(__name__)
+
+# Devices can be built in parallel threads (see robot.lifecycle): the pin
+# factory of gpiozero must be set up once.
+_lock = threading.Lock()
+
+
+class Backend:
+    """Provider of the hardware libraries. Each method imports the library
+    the first time it is called.
+    """
+
+    def gpio(self):
+        """Returns the module implementing the RPi.GPIO interface.
+        """
+        import RPi.GPIO as GPIO
+        return GPIO
+
+    def gpiozero(self):
+        """Returns the gpiozero module, with a suitable pin factory.
+        """
+        import gpiozero
+
+        # The first device would set up the default factory, which is not
+        # thread-safe.
+        if gpiozero.Device.pin_factory is None:
+            gpiozero.Device.pin_factory = \
+                gpiozero.Device._default_pin_factory()
+        return gpiozero
+
+    def keyboard(self):
+        """Returns the module implementing pynput's keyboard interface.
+        """
+        from pynput import keyboard
+        return keyboard
+
+
+class MockBackend(Backend):
+    """Backend on mock pins, which tests can drive and inspect.
+    """
+
+    def gpio(self):
+        import robot.mock_gpio as mock_gpio
+        return mock_gpio
+
+    def gpiozero(self):
+        import gpiozero
+        from gpiozero.pins.mock import MockFactory, MockPWMPin
+
+        # Keep the pins already in use, possibly set up by the caller.
+        if not isinstance(gpiozero.Device.pin_factory, MockFactory):
+            gpiozero.Device.pin_factory = MockFactory(pin_class=MockPWMPin)
+        return gpiozero
+
+
+_backends = {
+    'rpi': Backend(),
+    'mock': MockBackend(),
+}
+_backend_name = 'rpi'
+
+
+def register_backend(name, backend):
+    """Makes a backend available to use_backend().
+
+    Args:
+        name (str): Name of the backend.
+        backend (:obj:`Backend`): The backend.
+    """
+    _backends[name] = backend
+
+
+def use_backend(name):
+    """Selects the backend providing the libraries to the devices built
+    afterwards.
+
+    Args:
+        name (str): Name of the backend, for example 'rpi' or 'mock'.
+    """
+    global _backend_name
+    if name not in _backends:
+        raise ValueError('Unknown hardware backend {}. Available are '
+                         '{}'.format(name, ', '.join(sorted(_backends))))
+    _backend_name = name
+    _logger.debug('Using the {} hardware backend'.format(name))
+
+
+def backend_name():
+    return _backend_name
+
+
+def gpio():
+    return _backends[_backend_name].gpio()
+
+
+def gpiozero():
+    with _lock:
+        return _backends[_backend_name].gpiozero()
+
+
+def keyboard():
+    return _backends[_backend_name].keyboard()
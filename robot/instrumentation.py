@@ -0,0 +1,298 @@
+"""Lightweight instrumentation of the hot paths of the robot.
+
+Instruments are histograms of durations and counters, identified by a dotted
+name like 'driver.move.duration'. They live in shared memory, so that the
+processes started by the robot, such as the obstacle detection ones, update
+the instruments created by the parent before starting them.
+
+Instrumentation is off unless enable() is called before creating the
+components. When off, histogram(), counter() and period() return None and
+timed() returns the function unchanged: the instrumented code only pays for a
+None check.
+
+Histograms have fixed log2 buckets: bucket i counts the values v with
+2^(i-1) <= v < 2^i ns, so their size does not depend on the number of
+samples. Updates are not synchronized: each instrument is meant to be updated
+by a single thread at a time.
+
+Example:
+    instrumentation.enable()
+    dumper = instrumentation.Dumper('robot.stats')
+    ...   # Create the components, run the robot.
+    dumper.close()
+"""
+import ctypes
+import functools
+import json
+import logging
+import multiprocessing as mp
+import threading
+import time
+
+import robot.network as network
+
+_logger = logging.getLogger(__name__)
+
+# Number of buckets of a histogram. The last one also counts all the values
+# larger than 2^(_NUM_BUCKETS - 2) ns, about 275 s.
+_NUM_BUCKETS = 40
+
+# Position of the summary values after the buckets in a histogram array.
+_COUNT = _NUM_BUCKETS
+_SUM = _NUM_BUCKETS + 1
+_MAX = _NUM_BUCKETS + 2
+
+_enabled = False
+_instruments = {}
+
+
+class Histogram:
+    """Histogram of durations, in ns, with log2 buckets.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._values = mp.RawArray(ctypes.c_int64, _NUM_BUCKETS + 3)
+
+    def record(self, value_ns):
+        """Adds a value to the histogram.
+
+        Args:
+            value_ns (int): A non-negative duration, in ns.
+        """
+        values = self._values
+        values[min(value_ns.bit_length(), _NUM_BUCKETS - 1)] += 1
+        values[_COUNT] += 1
+        values[_SUM] += value_ns
+        if value_ns > values[_MAX]:
+            values[_MAX] = value_ns
+
+    def _percentile_ns(self, values, fraction):
+        """Upper bound of the bucket holding the given fraction of the values,
+        or the maximum value if smaller.
+        """
+        threshold = fraction * values[_COUNT]
+        cumulative = 0
+        for idx in range(_NUM_BUCKETS):
+            cumulative += values[idx]
+            if cumulative >= threshold:
+                break
+        return min(1 << idx, values[_MAX])
+
+    def snapshot(self):
+        """Returns the current content of the histogram.
+
+        Returns:
+            dict: The count, mean, p50, p99 and maximum of the values, in ns,
+                and the non-empty buckets, by their upper bound in ns.
+        """
+        values = self._values[:]
+        buckets = values[:_NUM_BUCKETS]
+        count = values[_COUNT]
+        if count == 0:
+            return {'count': 0}
+
+        return {
+            'count': count,
+            'mean_ns': values[_SUM] // count,
+            'p50_ns': self._percentile_ns(values, 0.50),
+            'p99_ns': self._percentile_ns(values, 0.99),
+            'max_ns': values[_MAX],
+            'buckets': {str(1 << idx): bucket
+                        for idx, bucket in enumerate(buckets) if bucket},
+        }
+
+
+class Counter:
+    """Counter of events.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._value = mp.RawValue(ctypes.c_int64, 0)
+
+    def increment(self, amount=1):
+        self._value.value += amount
+
+    def snapshot(self):
+        return self._value.value
+
+
+class Period:
+    """Records the time between successive ticks in the '<name>.period'
+    histogram, and its change from one tick to the next, that is the jitter,
+    in '<name>.jitter'.
+    """
+
+    def __init__(self, name):
+        self._period = histogram('{}.period'.format(name))
+        self._jitter = histogram('{}.jitter'.format(name))
+        self._last_tick_ns = None
+        self._last_period_ns = None
+
+    def tick(self):
+        now_ns = time.perf_counter_ns()
+        if self._last_tick_ns is not None:
+            period_ns = now_ns - self._last_tick_ns
+            self._period.record(period_ns)
+            if self._last_period_ns is not None:
+                self._jitter.record(abs(period_ns - self._last_period_ns))
+            self._last_period_ns = period_ns
+        self._last_tick_ns = now_ns
+
+
+def enable():
+    """Turns the instrumentation on, for the components created afterwards.
+    """
+    global _enabled
+    _enabled = True
+
+
+def is_enabled():
+    return _enabled
+
+
+def _get(cls, name):
+    if not _enabled:
+        return None
+
+    instrument = _instruments.get(name)
+    if instrument is None:
+        instrument = cls(name)
+        _instruments[name] = instrument
+    elif not isinstance(instrument, cls):
+        raise ValueError('{} is not a {}'.format(name, cls.__name__))
+    return instrument
+
+
+def histogram(name):
+    """Returns the histogram with the given name, creating it if needed.
+
+    Returns:
+        :obj:`Histogram`: The histogram, or None if instrumentation is off.
+    """
+    return _get(Histogram, name)
+
+
+def counter(name):
+    """Returns the counter with the given name, creating it if needed.
+
+    Returns:
+        :obj:`Counter`: The counter, or None if instrumentation is off.
+    """
+    return _get(Counter, name)
+
+
+def period(name):
+    """Returns a :obj:`Period` with the given name, or None if
+    instrumentation is off.
+    """
+    if not _enabled:
+        return None
+    return Period(name)
+
+
+def timed(name, function):
+    """Wraps a function to record the interval between its calls in the
+    '<name>.interval' histogram and their duration in '<name>.duration'.
+
+    Args:
+        name (str): Prefix of the names of the histograms.
+        function (callable): The function to instrument.
+
+    Returns:
+        callable: The wrapped function, or the function itself if
+            instrumentation is off.
+    """
+    if not _enabled:
+        return function
+
+    interval = histogram('{}.interval'.format(name))
+    duration = histogram('{}.duration'.format(name))
+    last_call_ns = [None]
+
+    @functools.wraps(function)
+    def _wrapper(*args, **kwargs):
+        start_ns = time.perf_counter_ns()
+        if last_call_ns[0] is not None:
+            interval.record(start_ns - last_call_ns[0])
+        last_call_ns[0] = start_ns
+        try:
+            return function(*args, **kwargs)
+        finally:
+            duration.record(time.perf_counter_ns() - start_ns)
+
+    return _wrapper
+
+
+def snapshot():
+    """Returns the current content of all the instruments.
+
+    Returns:
+        dict: Maps the name of each instrument to its snapshot.
+    """
+    return {name: instrument.snapshot()
+            for name, instrument in sorted(_instruments.items())}
+
+
+class Dumper:
+    """Periodically dumps a snapshot of all the instruments as a line of JSON,
+    either appended to a file or sent to a local UDP port.
+
+    Attributes:
+        _target (str): Path of the file, or 'udp:PORT' to send the snapshots
+            to that port of localhost.
+        _interval_s (float): Time between two dumps, in seconds.
+    """
+
+    def __init__(self, target, interval_s=5.):
+        self._target = target
+        self._interval_s = interval_s
+        self._file = None
+        self._client = None
+        if target.startswith('udp:'):
+            self._client = network.UDPClient(ip='127.0.0.1',
+                                             port=int(target[len('udp:'):]))
+        else:
+            self._file = open(target, 'a')
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='InstrumentationDumper',
+                                        daemon=True)
+        self._thread.start()
+
+        _logger.info('{} initialized, dumping to {} every {} s'.format(
+            self.__class__.__name__, target, interval_s))
+
+    def dump(self):
+        line = json.dumps({'time_s': time.time(),
+                           'instruments': snapshot()},
+                          sort_keys=True)
+        if self._client is not None:
+            self._client.send(line.encode())
+        else:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval_s):
+            try:
+                self.dump()
+            except OSError as e:
+                _logger.warning('Instrumentation dump failed: {}'.format(e))
+
+    def close(self):
+        """Stops the periodic dumps after a last one.
+        """
+        self._stop_event.set()
+        self._thread.join()
+        try:
+            self.dump()
+        except OSError as e:
+            _logger.warning('Instrumentation dump failed: {}'.format(e))
+
+        if self._client is not None:
+            self._client.close()
+        else:
+            self._file.close()
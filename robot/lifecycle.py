@@ -0,0 +1,191 @@
+"""Parallel bring-up and bounded-time teardown of the devices of the robot.
+
+Devices are declared with the names of the devices they require. start()
+builds each device in its own thread, as soon as the devices it requires
+are built, so that independent devices, which mostly wait for their pins to
+settle, come up at the same time.
+
+close() first runs the stop actions of the devices, like stopping the
+motors, right away and one after the other. Then it closes all the devices
+in parallel, each after the devices requiring it, within a global deadline:
+a device which does not close in time is reported and left behind, rather
+than holding up the shutdown.
+
+Example:
+    lifecycle = Lifecycle()
+    lifecycle.add('driver', dvr.Driver, stop=dvr.Driver.stop)
+    lifecycle.add('obstacle_break',
+                  lambda driver: ob.ObstacleBreak(driver=driver,
+                                                  distance_m=0.1),
+                  requires=['driver'])
+    devices = lifecycle.start()
+    ...
+    lifecycle.close()
+"""
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+_Device = collections.namedtuple('_Device',
+                                 ['factory', 'requires', 'stop', 'close'])
+
+
+class Lifecycle:
+    """Brings a set of devices up and down.
+
+    Attributes:
+        _close_timeout_s (float): Time given to close() to close all the
+            devices, in seconds.
+    """
+
+    _DEFAULT_CLOSE_TIMEOUT_s = 2.
+
+    def __init__(self, close_timeout_s=_DEFAULT_CLOSE_TIMEOUT_s):
+        self._close_timeout_s = close_timeout_s
+        self._declared = collections.OrderedDict()
+        self._devices = collections.OrderedDict()
+
+    def add(self, name, factory, requires=(), stop=None, close=None):
+        """Declares a device.
+
+        Args:
+            name (str): Name of the device.
+            factory (callable): Builds the device, given the devices it
+                requires as keyword arguments named after them.
+            requires (iterable, optional): Names of the devices to build
+                before this one and to close after it. They must be declared
+                before.
+            stop (callable, optional): Called with the device at the very
+                start of the teardown, before closing any device. Must be
+                fast.
+            close (callable, optional): Called with the device to close it.
+                If None, the close() method of the device, if any.
+        """
+        if name in self._declared:
+            raise ValueError('Device {} already declared'.format(name))
+        for required in requires:
+            if required not in self._declared:
+                raise ValueError('Device {} requires {}, which is not '
+                                 'declared'.format(name, required))
+
+        self._declared[name] = _Device(factory=factory,
+                                       requires=tuple(requires),
+                                       stop=stop,
+                                       close=close)
+
+    def _build(self, name, required_futures):
+        kwargs = {required: future.result()
+                  for required, future in required_futures.items()}
+        start_s = time.monotonic()
+        device = self._declared[name].factory(**kwargs)
+        _logger.debug('{} built in {:.1f} ms'.format(
+            name, 1000 * (time.monotonic() - start_s)))
+        return device
+
+    def start(self):
+        """Builds all the devices.
+
+        If a device fails to build, the ones already built are closed and
+        the exception is raised.
+
+        Returns:
+            dict: Maps the name of each device to the device.
+        """
+        start_s = time.monotonic()
+        futures = collections.OrderedDict()
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(len(self._declared), 1),
+                thread_name_prefix='BringUp') as executor:
+            for name, declared in self._declared.items():
+                required_futures = {required: futures[required]
+                                    for required in declared.requires}
+                futures[name] = executor.submit(self._build,
+                                                name,
+                                                required_futures)
+
+        error = None
+        for name, future in futures.items():
+            if future.exception() is None:
+                self._devices[name] = future.result()
+            elif error is None:
+                error = future.exception()
+
+        if error is not None:
+            _logger.error('Bring-up failed: {}'.format(error))
+            self.close()
+            raise error
+
+        _logger.info('{} devices ready in {:.1f} ms'.format(
+            len(self._devices), 1000 * (time.monotonic() - start_s)))
+        return dict(self._devices)
+
+    def _close_device(self, name, dependents, closed, deadline_s):
+        for dependent in dependents:
+            if not closed[dependent].wait(
+                    max(0., deadline_s - time.monotonic())):
+                _logger.warning('{} left open: {} did not close in '
+                                'time'.format(name, dependent))
+                return
+
+        device = self._devices[name]
+        close = self._declared[name].close
+        try:
+            if close is not None:
+                close(device)
+            elif hasattr(device, 'close'):
+                device.close()
+        except Exception:
+            _logger.exception('Closing {} failed'.format(name))
+        closed[name].set()
+
+    def close(self):
+        """Stops and closes all the built devices.
+
+        Returns:
+            bool: True if all the devices closed in time.
+        """
+        start_s = time.monotonic()
+        deadline_s = start_s + self._close_timeout_s
+
+        for name, device in self._devices.items():
+            stop = self._declared[name].stop
+            if stop is None:
+                continue
+            try:
+                stop(device)
+            except Exception:
+                _logger.exception('Stopping {} failed'.format(name))
+
+        closed = {name: threading.Event() for name in self._devices}
+        threads = []
+        for name in self._devices:
+            dependents = [dependent
+                          for dependent, declared in self._declared.items()
+                          if name in declared.requires
+                          and dependent in self._devices]
+            thread = threading.Thread(target=self._close_device,
+                                      args=(name, dependents, closed,
+                                            deadline_s),
+                                      name='Close{}'.format(name),
+                                      daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join(max(0., deadline_s - time.monotonic()))
+
+        not_closed = [name for name, event in closed.items()
+                      if not event.is_set()]
+        if not_closed:
+            _logger.warning('Devices not closed in time: {}'.format(
+                ', '.join(not_closed)))
+        else:
+            _logger.info('{} devices closed in {:.1f} ms'.format(
+                len(closed), 1000 * (time.monotonic() - start_s)))
+
+        self._devices.clear()
+        return not not_closed
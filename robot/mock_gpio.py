@@ -0,0 +1,166 @@
+"""In-memory stand-in for the RPi.GPIO module, to run the robot's code on a
+machine without GPIO pins, for example to replay a recording.
+
+The module provides the subset of the RPi.GPIO interface used by the robot.
+Input levels are driven by calling set_input(); output levels are stored and
+can be read back with get_output().
+
+The devices of the robot use it with the 'mock' backend of robot.hardware.
+Code importing RPi.GPIO directly can be pointed to it with install().
+
+Example:
+    import robot.hardware as hardware
+    hardware.use_backend('mock')
+    sensor = UltrasonicSensor(...)   # Uses the mock.
+"""
+import sys
+import threading
+import types
+
+BCM = 11
+BOARD = 10
+OUT = 0
+IN = 1
+LOW = 0
+HIGH = 1
+RISING = 31
+FALLING = 32
+BOTH = 33
+PUD_OFF = 20
+PUD_DOWN = 21
+PUD_UP = 22
+
+_levels = {}
+_num_edges = {}     # pin -> [number of falling edges, of rising edges]
+_edge_callbacks = {}
+_output_callbacks = []
+_condition = threading.Condition()
+
+
+def install():
+    """Makes `import RPi.GPIO` import this module instead of the real one.
+
+    Must be called before importing any module using RPi.GPIO.
+    """
+    package = sys.modules.get('RPi')
+    if package is None:
+        package = types.ModuleType('RPi')
+        sys.modules['RPi'] = package
+    package.GPIO = sys.modules[__name__]
+    sys.modules['RPi.GPIO'] = sys.modules[__name__]
+
+
+def add_output_callback(callback):
+    """Registers a function to call with (pin, level) at every output() call,
+    for example to simulate the devices wired to the pins.
+    """
+    _output_callbacks.append(callback)
+
+
+def remove_output_callback(callback):
+    """Unregisters a function registered with add_output_callback().
+    """
+    _output_callbacks.remove(callback)
+
+
+def setmode(_mode):
+    pass
+
+
+def setwarnings(_flag):
+    pass
+
+
+def setup(pin, _direction, pull_up_down=PUD_OFF, initial=LOW):
+    with _condition:
+        _levels.setdefault(pin, HIGH if pull_up_down == PUD_UP else initial)
+
+
+def output(pin, level):
+    with _condition:
+        _levels[pin] = int(bool(level))
+    for callback in _output_callbacks:
+        callback(pin, int(bool(level)))
+
+
+def get_output(pin):
+    return _levels.get(pin, LOW)
+
+
+def input(pin):
+    return _levels.get(pin, LOW)
+
+
+def set_input(pin, level):
+    """Drives an input pin, calling the edge callbacks if the level changes.
+
+    Args:
+        pin (int): The pin.
+        level (int or bool): The new level.
+    """
+    level = int(bool(level))
+    with _condition:
+        previous = _levels.get(pin, LOW)
+        _levels[pin] = level
+        if level == previous:
+            return
+
+        _num_edges.setdefault(pin, [0, 0])[level] += 1
+        _condition.notify_all()
+        edge_callback = _edge_callbacks.get(pin)
+
+    if edge_callback is None:
+        return
+
+    edge, callback = edge_callback
+    if edge == BOTH or edge == (RISING if level else FALLING):
+        callback(pin)
+
+
+def add_event_detect(pin, edge, callback=None, bouncetime=None):
+    with _condition:
+        _edge_callbacks[pin] = (edge, callback)
+
+
+def remove_event_detect(pin):
+    with _condition:
+        _edge_callbacks.pop(pin, None)
+
+
+def wait_for_edge(pin, edge, timeout=None):
+    """Waits for the next edge of an input pin in the given direction.
+
+    Returns:
+        int: The pin, or None if timed out.
+    """
+    timeout_s = None if timeout is None else timeout / 1000
+
+    def _count():
+        num_falling, num_rising = _num_edges.get(pin, (0, 0))
+        if edge == RISING:
+            return num_rising
+        if edge == FALLING:
+            return num_falling
+        return num_falling + num_rising
+
+    with _condition:
+        start = _count()
+        if not _condition.wait_for(lambda: _count() != start, timeout_s):
+            return None
+    return pin
+
+
+def cleanup(pins=None):
+    with _condition:
+        if pins is None:
+            _levels.clear()
+            _num_edges.clear()
+            _edge_callbacks.clear()
+            return
+
+        if isinstance(pins, int):
+            pins = (pins,)
+        for pin in pins:
+            _levels.pop(pin, None)
+            _num_edges.pop(pin, None)
+            _edge_callbacks.pop(pin, None)
@@ -9,10 +9,16 @@ Example (drive forward for one second and then stop):
     driver.close()
 """
 
+import ctypes
 import logging
 import multiprocessing as mp
+import threading
 
-from gpiozero import Robot
+import robot.hardware as hardware
+import robot.instrumentation as instrumentation
+import robot.motion.safety as safety
+import robot.recording as recording
+import robot.scheduling as scheduling
 
 _logger = logging.getLogger(__name__)
 
@@ -31,14 +37,179 @@ COMMAND_LEFT = 2
 COMMAND_RIGHT = 3
 COMMAND_TURBO = 4
 
+_NUM_COMMANDS = 5
+
+# How much the inner wheel slows down when turning while moving.
+_CURVE = 0.5
+
+# Default ground speed of the buggy with both motors at full power. The one
+# of the actual buggy is given to the Driver: calibrate it by timing the
+# buggy over a known distance.
+MAX_SPEED_mps = 1.0
+
+
+def _commands_to_motor_values(commands, normal_speed, turbo_speed):
+    """Computes the (left, right) motor values for a configuration of commands.
+
+    Args:
+        commands (list): Value of each command, indexed by command code.
+        normal_speed (float): Motor speed, between 0 and 1.
+        turbo_speed (float): Motor speed in turbo mode, between 0 and 1.
+
+    Returns:
+        tuple: The (left, right) motor values, between -1 and 1, or None if
+            the configuration is invalid and the current course should be
+            maintained.
+    """
+    if sum(commands[:4]) == 0:
+        # All the motion commands are unset: stop the motors.
+        return 0., 0.
+
+    # Setting both "forward" and "backward" or "left" and "right"
+    # is not allowed.
+    if (commands[COMMAND_FORWARD] and commands[COMMAND_BACKWARD]) or \
+            (commands[COMMAND_LEFT] and commands[COMMAND_RIGHT]):
+        return None
+
+    speed = turbo_speed if commands[COMMAND_TURBO] else normal_speed
+
+    if not commands[COMMAND_FORWARD] and not commands[COMMAND_BACKWARD]:
+        # Only left-right commands provided: spin in place.
+        if commands[COMMAND_LEFT]:
+            return -speed, speed
+        else:
+            return speed, -speed
+
+    # Move forward or backward, possible also turning left or right.
+    left = right = speed
+    if commands[COMMAND_LEFT]:
+        left *= 1 - _CURVE
+    elif commands[COMMAND_RIGHT]:
+        right *= 1 - _CURVE
+
+    if commands[COMMAND_BACKWARD]:
+        return -left, -right
+
+    return left, right
+
+
+def velocity_to_motor_values(linear, angular):
+    """Computes the (left, right) motor values of a differential drive for a
+    linear and an angular velocity.
+
+    If a motor value would exceed the range of the motors, both are scaled
+    down by the same factor: the robot moves slower, but along the same
+    curve.
+
+    Args:
+        linear (float): Forward velocity, as a fraction of the maximum speed,
+            between -1 and 1. Negative to move backward.
+        angular (float): Turning rate, as the difference between the right and
+            the left motor values divided by 2, between -1 and 1. Positive to
+            turn left, that is counterclockwise.
+
+    Returns:
+        tuple: The (left, right) motor values, between -1 and 1.
+    """
+    left = linear - angular
+    right = linear + angular
+    scale = max(abs(left), abs(right), 1.)
+    return left / scale, right / scale
+
+
+def _build_motor_values_table(normal_speed, turbo_speed):
+    """Computes the motor values for every configuration of the commands.
+
+    Args:
+        normal_speed (float): Motor speed, between 0 and 1.
+        turbo_speed (float): Motor speed in turbo mode, between 0 and 1.
+
+    Returns:
+        list: The (left, right) motor values, or None for invalid
+            configurations, indexed by the bitmask of the commands, where
+            bit i is set if the command with code i is set.
+    """
+    return [
+        _commands_to_motor_values(
+            commands=[(mask >> code) & 1 for code in range(_NUM_COMMANDS)],
+            normal_speed=normal_speed,
+            turbo_speed=turbo_speed)
+        for mask in range(1 << _NUM_COMMANDS)
+    ]
+
+
+class MotionState:
+    """Latest motor values requested by the commands, before applying the
+    safety stops, in shared memory for other processes to know how the robot
+    is meant to move.
+
+    Attributes:
+        _max_speed_mps (float): Ground speed of the buggy with both motors at
+            full power, in m/s.
+    """
+
+    def __init__(self, max_speed_mps=MAX_SPEED_mps):
+        self._max_speed_mps = max_speed_mps
+        self._values = mp.RawArray(ctypes.c_double, 2)
+
+    def set(self, left, right):
+        self._values[0] = left
+        self._values[1] = right
+
+    @property
+    def values(self):
+        """tuple: The (left, right) motor values, between -1 and 1.
+        """
+        return self._values[0], self._values[1]
+
+    @property
+    def forward_speed_mps(self):
+        """float: Approximate forward speed of the robot, in m/s. Negative
+        when moving backward.
+        """
+        return (self._values[0] + self._values[1]) / 2 * self._max_speed_mps
+
 
 class Driver:
     """Controls the motors and the motion direction and speed.
+
+    The safety flags can be raised from other processes at any time: the
+    driver checks them for changes every few milliseconds and applies them
+    without waiting for the next command.
+
+    Instead of the commands, the motion can be given as a continuous linear
+    and angular velocity, through set_velocity(). The velocity holds until the
+    next command, and the safety stops apply to it in the same way.
+
+    If a recorder (see robot.recording) is provided, every value written to
+    the motors is recorded, together with the stops given a reason.
+
+    If instrumentation (see robot.instrumentation) is enabled, the interval
+    between motor updates and their duration are measured.
+
+    `max_speed_mps`, the ground speed of the buggy with both motors at full
+    power, converts the motor values to a speed in the motion state.
     """
     _NORMAL_SPEED = 0.5
     _TURBO_SPEED = 1.0
 
-    def __init__(self):
+    # Motor values for each configuration of the commands.
+    _MOTOR_VALUES = _build_motor_values_table(normal_speed=_NORMAL_SPEED,
+                                              turbo_speed=_TURBO_SPEED)
+
+    # How often to check the safety flags for changes, in seconds.
+    _SAFETY_CHECK_INTERVAL_s = 5e-3
+
+    # SCHED_FIFO priority of the safety check, if real-time scheduling is
+    # enabled (see robot.scheduling). Above the control loops.
+    _SAFETY_REALTIME_PRIORITY = 60
+
+    def __init__(self, recorder=None, max_speed_mps=MAX_SPEED_mps):
+        if max_speed_mps <= 0:
+            raise ValueError('Maximum speed must be positive. '
+                             'Provided is {}'.format(max_speed_mps))
+
+        self._recorder = recorder
         self._commands = [
             0,  # forward
             0,  # backward
@@ -47,87 +218,107 @@ class Driver:
             0,  # turbo
         ]
 
-        self._robot = Robot(left=(_LEFT_MOTOR_NEG_PIN,
-                                  _LEFT_MOTOR_POS_PIN),
-                            right=(_RIGHT_MOTOR_POS_PIN,
-                                   _RIGHT_MOTOR_NEG_PIN))
+        gpiozero = hardware.gpiozero()
+        self._robot = gpiozero.Robot(left=(_LEFT_MOTOR_NEG_PIN,
+                                           _LEFT_MOTOR_POS_PIN),
+                                     right=(_RIGHT_MOTOR_POS_PIN,
+                                            _RIGHT_MOTOR_NEG_PIN))
 
-        # A Driver exposes a number of multiprocess Events objects that
-        # external objects can use to signal the need of an emergency stops.
-        # It is up to the caller to clear the safety stop Event.
-        self._safety_stop_event = mp.Event()
-        self._safety_stop_forward_event = mp.Event()
-        self._safety_stop_backward_event = mp.Event()
+        # Latest (left, right) values written to the motors.
+        self._motor_values = (0., 0.)
 
-        _logger.debug('{} initialized'.format(self.__class__.__name__))
+        # The (left, right) motor values requested by set_velocity(), or None
+        # if the motion follows the commands.
+        self._velocity_motor_values = None
 
-    def _move(self):
-        if self._safety_stop_event.is_set():
-            if self._robot.left_motor.is_active or self._robot.right_motor.is_active:
-                # Both motors must be completely still.
-                self._robot.stop()
+        # Latest (left, right) values requested by the commands.
+        self._motion_state = MotionState(max_speed_mps=max_speed_mps)
 
-            # Not further actions allowed in case of full safety stop.
-            return
+        # Number of motor writes skipped because the motors already had the
+        # target values.
+        self._num_skipped_writes = 0
 
-        # In case of forward/backward safety stop, motors cannot spin in the
-        # same forbidden direction. At most one is allowed to let the robot
-        # spin in place.
-        if self._safety_stop_forward_event.is_set():
-            if self._robot.left_motor.value > 0 and self._robot.right_motor.value > 0:
-                self._robot.stop()
-                return
+        # Commands can be set from multiple threads: a set of commands must
+        # be applied all at once.
+        self._lock = threading.Lock()
 
-        if self._safety_stop_backward_event.is_set():
-            if self._robot.left_motor.value < 0 and self._robot.right_motor.value < 0:
-                self._robot.stop()
-                return
+        # A Driver exposes shared safety flags that external objects, even
+        # in other processes, can use to signal the need of an emergency
+        # stop. It is up to the caller to clear the safety flags.
+        self._safety_flags = safety.SafetyFlags()
 
-        if sum(self._commands[:4]) == 0:
-            # All the motion commands are unset: stop the motors.
-            self._robot.stop()
-            return
+        # Event-like views of the safety flags.
+        self._safety_stop_event = self._safety_flags.as_event(safety.STOP)
+        self._safety_stop_forward_event = \
+            self._safety_flags.as_event(safety.STOP_FORWARD)
+        self._safety_stop_backward_event = \
+            self._safety_flags.as_event(safety.STOP_BACKWARD)
 
-        # Setting both "forward" and "backward" or "left" and "right"
-        # is not allowed. Maintain the current course.
-        if (self._commands[COMMAND_FORWARD] and self._commands[COMMAND_BACKWARD]) or \
-                (self._commands[COMMAND_LEFT] and self._commands[COMMAND_RIGHT]):
-            _logger.warning('Invalid command configuration')
+        self._move = instrumentation.timed('driver.move', self._move)
+
+        self._closed = threading.Event()
+        self._safety_thread = threading.Thread(target=self._watch_safety_flags,
+                                               name='DriverSafety',
+                                               daemon=True)
+        self._safety_thread.start()
+
+        _logger.debug('{} initialized'.format(self.__class__.__name__))
+
+    def _watch_safety_flags(self):
+        """Moves the motors again every time the safety flags change.
+        """
+        rate = scheduling.FixedRate(period_s=self._SAFETY_CHECK_INTERVAL_s,
+                                    name='driver.safety',
+                                    stop_event=self._closed,
+                                    priority=self._SAFETY_REALTIME_PRIORITY)
+        rate.start()
+        sequence = self._safety_flags.sequence
+        while not rate.wait():
+            new_sequence = self._safety_flags.sequence
+            if new_sequence != sequence:
+                sequence = new_sequence
+                with self._lock:
+                    self._move()
+
+    def _write_motors(self, left, right):
+        if (left, right) == self._motor_values:
+            self._num_skipped_writes += 1
             return
 
-        speed = self._TURBO_SPEED if self._commands[COMMAND_TURBO] \
-            else self._NORMAL_SPEED
-
-        if not self._commands[COMMAND_FORWARD] and not self._commands[COMMAND_BACKWARD]:
-            # Only left-right commands provided.
-            if self._commands[COMMAND_LEFT]:
-                self._robot.left(speed)
-            elif self._commands[COMMAND_RIGHT]:
-                self._robot.right(speed)
-            else:
-                assert False, 'Reached unexpected condition'
-        else:
-            # Move forward or backward, possible also turning left or right.
-            kwargs = dict(speed=speed)
+        self._robot.value = (left, right)
+        self._motor_values = (left, right)
+        if self._recorder is not None:
+            self._recorder.record(recording.KIND_MOTORS, x=left, y=right)
 
-            # We already checked that left and right cannot be set together.
-            if self._commands[COMMAND_LEFT]:
-                kwargs['curve_left'] = 0.5
-            elif self._commands[COMMAND_RIGHT]:
-                kwargs['curve_right'] = 0.5
+    def _move(self):
+        safety_mask = self._safety_flags.mask
+        if safety_mask & safety.STOP:
+            # Both motors must be completely still. Not further actions
+            # allowed in case of full safety stop.
+            self._write_motors(0., 0.)
+            return
 
-            # We already checked that forward and backward cannot be set together.
-            if self._commands[COMMAND_FORWARD]:
-                if self._safety_stop_forward_event.is_set():
-                    return
+        motor_values = self._velocity_motor_values
+        if motor_values is None:
+            motor_values = self._MOTOR_VALUES[self.command_mask]
+        if motor_values is None:
+            # Maintain the current course.
+            _logger.warning('Invalid command configuration')
+            return
 
-                self._robot.forward(**kwargs)
+        left, right = motor_values
+        self._motion_state.set(left, right)
 
-            elif self._commands[COMMAND_BACKWARD]:
-                if self._safety_stop_backward_event.is_set():
-                    return
+        # In case of forward/backward safety stop, motors cannot spin in the
+        # same forbidden direction. At most one is allowed to let the robot
+        # spin in place.
+        if left > 0 and right > 0 and safety_mask & safety.ANY_STOP_FORWARD:
+            left, right = 0., 0.
+
+        if left < 0 and right < 0 and safety_mask & safety.ANY_STOP_BACKWARD:
+            left, right = 0., 0.
 
-                self._robot.backward(**kwargs)
+        self._write_motors(left, right)
 
     def set_command(self, command_code, command_value):
         """Receives an external command, stores it and processes it.
@@ -137,21 +328,111 @@ class Driver:
             command_value (int): The value associated with this command. Often
                 1 to set and 0 to cancel.
         """
-        if command_code < 0 or command_code >= len(self._commands):
-            # Unrecognized command.
-            _logger.warning('Unrecognized command code: '
-                            '{}'.format(command_code))
-            return
+        self.set_commands({command_code: command_value})
+
+    def set_commands(self, commands):
+        """Receives several external commands and processes them at once.
+
+        The motors only see the final configuration, never an intermediate
+        one.
+
+        If any command code is unrecognized, none of the commands is applied.
+
+        Args:
+            commands (dict): Maps command codes to their values.
+        """
+        for command_code in commands:
+            if command_code < 0 or command_code >= len(self._commands):
+                # Unrecognized command.
+                _logger.warning('Unrecognized command code: '
+                                '{}'.format(command_code))
+                return
+
+        with self._lock:
+            self._velocity_motor_values = None
+            for command_code, command_value in commands.items():
+                self._commands[command_code] = command_value
+
+            self._move()
 
-        self._commands[command_code] = command_value
-        self._move()
+    def set_command_mask(self, mask):
+        """Replaces all the commands at once.
 
-    def stop(self):
+        Args:
+            mask (int): Bitmask of the commands, where bit i is set if the
+                command with code i is set.
+        """
+        with self._lock:
+            self._velocity_motor_values = None
+            for command_code in range(len(self._commands)):
+                self._commands[command_code] = (mask >> command_code) & 1
+            self._move()
+
+    def set_velocity(self, linear, angular):
+        """Moves with a continuous linear and angular velocity, until the
+        next call or the next command.
+
+        Args:
+            linear (float): Forward velocity, as a fraction of the maximum
+                speed, between -1 and 1. Negative to move backward.
+            angular (float): Turning rate, between -1 and 1. Positive to turn
+                left. See velocity_to_motor_values().
+        """
+        motor_values = velocity_to_motor_values(linear=linear, angular=angular)
+        with self._lock:
+            self._velocity_motor_values = motor_values
+            self._move()
+
+    def stop(self, reason=None):
         """Stops all the motors at the same time.
+
+        Args:
+            reason (int, optional): One of the recording.STOP_* values. If
+                provided, the stop is recorded as an input, to replay it.
+        """
+        if reason is not None and self._recorder is not None:
+            self._recorder.record(recording.KIND_STOP, source=reason)
+        self.set_command_mask(0)
+
+    def apply_safety_flags(self):
+        """Applies the current safety flags right away, without waiting for
+        the driver to notice that they changed.
+        """
+        with self._lock:
+            self._move()
+
+    @property
+    def command_mask(self):
+        """int: Bitmask of the commands, where bit i is set if the command
+        with code i is set.
+        """
+        mask = 0
+        for command_code, command_value in enumerate(self._commands):
+            if command_value:
+                mask |= 1 << command_code
+        return mask
+
+    @property
+    def motor_values(self):
+        """tuple: Latest (left, right) values written to the motors, between
+        -1 and 1.
+        """
+        return self._motor_values
+
+    @property
+    def num_skipped_writes(self):
+        """int: Number of motor writes skipped because the motors already had
+        the target values.
         """
-        for idx in range(len(self._commands)):
-            self._commands[idx] = 0
-        self._move()
+        return self._num_skipped_writes
+
+    @property
+    def motion_state(self):
+        return self._motion_state
+
+    @property
+    def safety_flags(self):
+        return self._safety_flags
 
     @property
     def safety_stop_event(self):
@@ -166,6 +447,9 @@ class Driver:
         return self._safety_stop_backward_event
 
     def close(self):
+        self._closed.set()
+        self._safety_thread.join()
         self._robot.stop()
         self._robot.close()
-        _logger.debug('{} stopped'.format(self.__class__.__name__))
+        _logger.debug('{} stopped, skipped {} motor writes'.format(
+            self.__class__.__name__, self._num_skipped_writes))
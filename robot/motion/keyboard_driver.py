@@ -2,33 +2,33 @@
 """
 import logging
 
-from pynput import keyboard
-
+import robot.hardware as hardware
 import robot.motion.driver as driver
 
 _logger = logging.getLogger(__name__)
 
-_EXIT_KEY = keyboard.Key.esc
-_key_to_command = {
-    # Forward
-    keyboard.KeyCode.from_char('w'): driver.COMMAND_FORWARD,
-    keyboard.KeyCode.from_char('W'): driver.COMMAND_FORWARD,
 
-    # Backward
-    keyboard.KeyCode.from_char('s'): driver.COMMAND_BACKWARD,
-    keyboard.KeyCode.from_char('S'): driver.COMMAND_BACKWARD,
+def _key_to_command(keyboard):
+    return {
+        # Forward
+        keyboard.KeyCode.from_char('w'): driver.COMMAND_FORWARD,
+        keyboard.KeyCode.from_char('W'): driver.COMMAND_FORWARD,
+
+        # Backward
+        keyboard.KeyCode.from_char('s'): driver.COMMAND_BACKWARD,
+        keyboard.KeyCode.from_char('S'): driver.COMMAND_BACKWARD,
 
-    # Left
-    keyboard.KeyCode.from_char('a'): driver.COMMAND_LEFT,
-    keyboard.KeyCode.from_char('A'): driver.COMMAND_LEFT,
+        # Left
+        keyboard.KeyCode.from_char('a'): driver.COMMAND_LEFT,
+        keyboard.KeyCode.from_char('A'): driver.COMMAND_LEFT,
 
-    # Right
-    keyboard.KeyCode.from_char('d'): driver.COMMAND_RIGHT,
-    keyboard.KeyCode.from_char('D'): driver.COMMAND_RIGHT,
+        # Right
+        keyboard.KeyCode.from_char('d'): driver.COMMAND_RIGHT,
+        keyboard.KeyCode.from_char('D'): driver.COMMAND_RIGHT,
 
-    # Turbo
-    keyboard.Key.shift_l: driver.COMMAND_TURBO,
-}
+        # Turbo
+        keyboard.Key.shift_l: driver.COMMAND_TURBO,
+    }
 
 _instructions = """Press ESC to quit.
 Use keys W, A, S, D for directions.
@@ -40,21 +40,24 @@ class KeyboardDriver(driver.Driver):
 
     def __init__(self):
         super().__init__()
+        keyboard = hardware.keyboard()
+        self._exit_key = keyboard.Key.esc
+        self._key_to_command = _key_to_command(keyboard)
         self._listener = keyboard.Listener(on_press=self._on_press,
                                            on_release=self._on_release,
                                            suppress=True)
 
     def _on_press(self, key):
-        command = _key_to_command.get(key)
+        command = self._key_to_command.get(key)
         if command is not None:
             self.set_command(command_code=command, command_value=1)
 
     def _on_release(self, key):
-        if key == _EXIT_KEY:
+        if key == self._exit_key:
             _logger.debug('Captured exit signal')
             return False
 
-        command = _key_to_command.get(key)
+        command = self._key_to_command.get(key)
         if command is not None:
             self.set_command(command_code=command, command_value=0)
 
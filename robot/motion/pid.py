@@ -0,0 +1,74 @@
+"""PID controller, to compute a correction from the error of a measurement.
+
+Example (steer towards a line):
+    controller = PidController(kp=0.5, ki=1.0, output_limit=1.0)
+    angular = controller.update(error, time.monotonic())
+"""
+
+
+class PidController:
+    """Proportional-integral-derivative controller.
+
+    The output is clamped to [-output_limit, output_limit]. While the output
+    is clamped, the error stops being integrated in the direction which would
+    push it further out of range, so that the integral does not wind up.
+
+    Attributes:
+        _kp (float): Proportional gain.
+        _ki (float): Integral gain, per second.
+        _kd (float): Derivative gain, in seconds.
+        _output_limit (float, optional): Maximum absolute value of the
+            output. Unlimited if None.
+    """
+
+    def __init__(self, kp, ki=0., kd=0., output_limit=None):
+        self._kp = kp
+        self._ki = ki
+        self._kd = kd
+        self._output_limit = output_limit
+        self.reset()
+
+    def reset(self):
+        """Forgets the history of the error.
+        """
+        self._integral = 0.
+        self._last_error = None
+        self._last_timestamp_s = None
+
+    def reset_integral(self):
+        """Forgets the accumulated error only, for example once the error
+        is known to be back to zero.
+        """
+        self._integral = 0.
+
+    def update(self, error, timestamp_s):
+        """Computes the output for the latest error.
+
+        Args:
+            error (float): The latest error.
+            timestamp_s (float): Monotonic time of the error, in seconds.
+
+        Returns:
+            float: The output.
+        """
+        derivative = 0.
+        integral = self._integral
+        if self._last_timestamp_s is not None:
+            dt_s = timestamp_s - self._last_timestamp_s
+            if dt_s > 0:
+                integral += error * dt_s
+                derivative = (error - self._last_error) / dt_s
+
+        output = self._kp * error + self._ki * integral + self._kd * derivative
+        limit = self._output_limit
+        if limit is not None and abs(output) > limit:
+            output = limit if output > 0 else -limit
+            if abs(integral) > abs(self._integral) and \
+                    (integral > 0) == (output > 0):
+                # Winding up: keep the previous integral.
+                integral = self._integral
+
+        self._integral = integral
+        self._last_error = error
+        self._last_timestamp_s = timestamp_s
+        return output
@@ -0,0 +1,154 @@
+"""Safety stop flags shared among processes.
+
+The flags are read by the Driver every time it moves the motors, therefore
+reading them must be as cheap as possible. All the flags are packed into a
+single 32-bit word in shared memory together with a sequence counter, so
+that reading them all takes a single memory load and no IPC call. Writers,
+such as the obstacle detection processes, serialize on a lock.
+
+Example (stop any forward motion):
+    flags = SafetyFlags()
+    flags.set(STOP_FORWARD)
+    assert flags.mask & STOP_FORWARD
+"""
+
+import ctypes
+import multiprocessing as mp
+import time
+
+# Flags, to combine as a bitmask.
+STOP = 1 << 0
+STOP_FORWARD = 1 << 1
+STOP_BACKWARD = 1 << 2
+
+# Same as STOP_FORWARD and STOP_BACKWARD, but raised because a collision is
+# predicted rather than because an obstacle is already too close. Separate
+# flags let the two detectors set and clear them independently.
+PREDICTED_STOP_FORWARD = 1 << 3
+PREDICTED_STOP_BACKWARD = 1 << 4
+
+# Any of these flags forbids the motion in the given direction.
+ANY_STOP_FORWARD = STOP_FORWARD | PREDICTED_STOP_FORWARD
+ANY_STOP_BACKWARD = STOP_BACKWARD | PREDICTED_STOP_BACKWARD
+
+# The lowest bits of the shared word hold the flags, the others hold the
+# sequence counter.
+_MASK_BITS = 8
+_MASK = (1 << _MASK_BITS) - 1
+_MAX_SEQUENCE = (1 << (32 - _MASK_BITS)) - 1
+
+
+class SafetyFlags:
+    """Bitmask of safety stop flags in shared memory.
+
+    The sequence counter is incremented at every change of the flags, so that
+    readers can tell whether the flags changed since their last read.
+    """
+
+    def __init__(self):
+        # A 32-bit aligned word is read and written atomically.
+        self._word = mp.RawValue(ctypes.c_uint32, 0)
+        self._lock = mp.Lock()
+
+    def _update(self, set_bits, clear_bits):
+        with self._lock:
+            word = self._word.value
+            mask = ((word & _MASK) | set_bits) & ~clear_bits
+            if mask == word & _MASK:
+                return
+
+            sequence = ((word >> _MASK_BITS) + 1) & _MAX_SEQUENCE
+            self._word.value = (sequence << _MASK_BITS) | mask
+
+    def set(self, flags):
+        """Sets the given flags.
+
+        Args:
+            flags (int): Bitmask of the flags to set.
+        """
+        self._update(set_bits=flags, clear_bits=0)
+
+    def clear(self, flags):
+        """Clears the given flags.
+
+        Args:
+            flags (int): Bitmask of the flags to clear.
+        """
+        self._update(set_bits=0, clear_bits=flags)
+
+    def is_set(self, flags):
+        """Returns True if any of the given flags is set.
+
+        Args:
+            flags (int): Bitmask of the flags to check.
+        """
+        return bool(self._word.value & flags)
+
+    @property
+    def mask(self):
+        """int: Bitmask of the flags currently set.
+        """
+        return self._word.value & _MASK
+
+    @property
+    def sequence(self):
+        """int: Number of changes of the flags, modulo 2^24.
+        """
+        return self._word.value >> _MASK_BITS
+
+    def as_event(self, flag):
+        """Returns a view of a flag with the interface of an Event.
+
+        Args:
+            flag (int): The flag to view.
+
+        Returns:
+            :obj:`SafetyFlagEvent`: The view.
+        """
+        return SafetyFlagEvent(self, flag)
+
+
+class SafetyFlagEvent:
+    """A single safety flag with the set/clear/is_set/wait interface of
+    multiprocessing.Event, for code written against the Events.
+
+    The flags live in a plain shared word with no condition to notify, so
+    wait() polls the flag.
+    """
+
+    # Seconds between two checks of the flag while waiting.
+    _WAIT_POLL_INTERVAL_s = 1e-3
+
+    def __init__(self, safety_flags, flag):
+        self._safety_flags = safety_flags
+        self._flag = flag
+
+    def set(self):
+        self._safety_flags.set(self._flag)
+
+    def clear(self):
+        self._safety_flags.clear(self._flag)
+
+    def is_set(self):
+        return self._safety_flags.is_set(self._flag)
+
+    def wait(self, timeout=None):
+        """Blocks until the flag is set or the timeout expires.
+
+        Args:
+            timeout (float): Maximum time to wait, in seconds. If None,
+                waits forever.
+
+        Returns:
+            True if the flag is set, False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.is_set():
+            if deadline is None:
+                time.sleep(self._WAIT_POLL_INTERVAL_s)
+                continue
+            remaining_s = deadline - time.monotonic()
+            if remaining_s <= 0:
+                return False
+            time.sleep(min(self._WAIT_POLL_INTERVAL_s, remaining_s))
+        return True
@@ -0,0 +1,239 @@
+"""Binary recording of the sensor and command streams of the robot.
+
+Every event is stored as a fixed-size record, so that a recording can be
+memory-mapped and scanned without parsing:
+    timestamp_ns    int64   Monotonic time of the event, in ns.
+    kind            uint8   One of the KIND_* values.
+    source          uint8   Which sensor for KIND_ULTRASONIC, one of the
+                            STOP_* reasons for KIND_STOP. 0 otherwise.
+    (padding)       2 bytes
+    value           int32   State of the line navigator for KIND_LINE,
+                            bitmask of the commands for KIND_REMOTE.
+    x               float32 Raw distance in cm for KIND_ULTRASONIC, left
+                            motor value for KIND_MOTORS.
+    y               float32 Right motor value for KIND_MOTORS.
+
+The file starts with a header of _HEADER.size bytes, which keeps the records
+aligned.
+
+Recording is meant to be left on while driving: records are packed into a
+preallocated buffer and written with a single append once the buffer is full
+or old enough. The file is opened in append mode, so the processes of the
+robot, such as the obstacle detection ones, can record to the same file at
+the same time. Their records are not in time order: sort them by timestamp.
+
+Example (dump a recording):
+    for record in read_records('drive.rec'):
+        print(record)
+"""
+import collections
+import logging
+import mmap
+import multiprocessing.util
+import os
+import struct
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+VERSION = 1
+
+_MAGIC = b'BUGGYREC'
+_HEADER = struct.Struct('<8sHH4x')
+_RECORD = struct.Struct('<qBB2xiff')
+
+RECORD_SIZE = _RECORD.size
+
+# Kinds of record.
+KIND_ULTRASONIC = 1
+KIND_LINE = 2
+KIND_REMOTE = 3
+KIND_MOTORS = 4
+KIND_STOP = 5
+
+# Reasons of the stops, for KIND_STOP. Only the stops which do not follow
+# from the other recorded inputs are recorded, like these.
+STOP_LINK_LOST = 1      # The watchdog of the remote fired.
+STOP_SHUTDOWN = 2       # The robot is shutting down.
+
+Record = collections.namedtuple('Record',
+                                ['timestamp_ns', 'kind', 'source', 'value',
+                                 'x', 'y'])
+
+
+class Recorder:
+    """Appends records to a recording file.
+
+    Records are buffered in memory and written when the buffer is full, when
+    the oldest buffered record is older than _FLUSH_INTERVAL_s, or on
+    flush(). A process started with multiprocessing gets its own empty buffer
+    and flushes it when it exits.
+
+    Attributes:
+        _path (str): Path of the recording file.
+    """
+
+    # Number of records to buffer before writing them.
+    _BUFFER_RECORDS = 512
+
+    # Maximum age of a buffered record, in seconds.
+    _FLUSH_INTERVAL_s = 1.
+
+    def __init__(self, path):
+        self._path = path
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size == 0:
+            os.write(self._fd, _HEADER.pack(_MAGIC, VERSION, RECORD_SIZE))
+        else:
+            _check_header(path)
+
+        self._buffer = bytearray(RECORD_SIZE * self._BUFFER_RECORDS)
+        self._flush_interval_ns = int(1e9 * self._FLUSH_INTERVAL_s)
+        self._reset()
+
+        # Processes forked by multiprocessing must not write the records
+        # buffered by the parent, and must write their own before exiting.
+        multiprocessing.util.register_after_fork(self, Recorder._after_fork)
+
+        _logger.info('Recording to {}'.format(path))
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._num_buffered = 0
+        self._first_buffered_ns = None
+
+    def _after_fork(self):
+        self._reset()
+        multiprocessing.util.Finalize(self, self.flush, exitpriority=10)
+
+    def record(self, kind, source=0, value=0, x=0., y=0., timestamp_ns=None):
+        """Records an event.
+
+        Args:
+            kind (int): One of the KIND_* values.
+            source (int, optional): Which sensor produced the event.
+            value (int, optional): Integer payload.
+            x (float, optional): First float payload.
+            y (float, optional): Second float payload.
+            timestamp_ns (int, optional): Monotonic time of the event, in ns.
+                Now, if not provided.
+        """
+        now_ns = time.monotonic_ns()
+        if timestamp_ns is None:
+            timestamp_ns = now_ns
+        with self._lock:
+            if self._fd is None:
+                return
+
+            _RECORD.pack_into(self._buffer,
+                              self._num_buffered * RECORD_SIZE,
+                              timestamp_ns, kind, source, value, x, y)
+            self._num_buffered += 1
+            if self._first_buffered_ns is None:
+                self._first_buffered_ns = now_ns
+
+            if self._num_buffered == self._BUFFER_RECORDS or \
+                    now_ns - self._first_buffered_ns \
+                    >= self._flush_interval_ns:
+                self._flush()
+
+    def _flush(self):
+        """Writes the buffered records. The caller must hold the lock.
+        """
+        if self._num_buffered == 0:
+            return
+
+        # A single write per buffer: appends from different processes do not
+        # interleave within a buffer.
+        with memoryview(self._buffer) as view:
+            os.write(self._fd, view[:self._num_buffered * RECORD_SIZE])
+        self._num_buffered = 0
+        self._first_buffered_ns = None
+
+    def flush(self):
+        """Writes the buffered records.
+        """
+        with self._lock:
+            if self._fd is not None:
+                self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._fd is None:
+                return
+
+            self._flush()
+            os.close(self._fd)
+            self._fd = None
+        _logger.info('Recording to {} closed'.format(self._path))
+
+
+class RecordingFilter:
+    """Distance filter recording every raw sample before passing it to
+    another filter, if any, with the interface of the filters in
+    robot.sensor.filters.
+
+    Attributes:
+        _recorder (:obj:`Recorder`): Where to record the samples.
+        _source (int): Id of the sensor.
+        _distance_filter (object, optional): Filter to pass the samples to.
+    """
+
+    def __init__(self, recorder, source, distance_filter=None):
+        self._recorder = recorder
+        self._source = source
+        self._distance_filter = distance_filter
+
+    def update(self, distance_cm, timestamp_s):
+        # Recorded with the time of the measurement, which replay gives back
+        # to the filters and the collision predictors.
+        self._recorder.record(KIND_ULTRASONIC,
+                              source=self._source,
+                              x=distance_cm,
+                              timestamp_ns=round(1e9 * timestamp_s))
+        if self._distance_filter is None:
+            return distance_cm
+        return self._distance_filter.update(distance_cm, timestamp_s)
+
+
+def _check_header(path):
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER.size)
+
+    if len(header) < _HEADER.size:
+        raise ValueError('{} is not a recording'.format(path))
+
+    magic, version, record_size = _HEADER.unpack(header)
+    if magic != _MAGIC or version != VERSION or record_size != RECORD_SIZE:
+        raise ValueError('{} is not a recording of version {}'.format(
+            path, VERSION))
+
+
+def read_records(path):
+    """Reads all the records of a recording, in time order.
+
+    A record truncated because the robot was switched off while writing it
+    is ignored.
+
+    Args:
+        path (str): Path of the recording file.
+
+    Returns:
+        list: The :obj:`Record` objects.
+    """
+    _check_header(path)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        num_records = (size - _HEADER.size) // RECORD_SIZE
+        if num_records == 0:
+            return []
+
+        end = _HEADER.size + num_records * RECORD_SIZE
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm)[_HEADER.size:end] as view:
+                records = [Record(*fields)
+                           for fields in _RECORD.iter_unpack(view)]
+
+    records.sort(key=lambda record: record.timestamp_ns)
+    return records
@@ -0,0 +1,255 @@
+"""Replays a recording (see robot.recording) through the control code, on
+mock pins, and compares the resulting motor values with the recorded ones.
+
+The recorded inputs, that is the raw distances, the line states, the
+commands from the remote and the stops of the watchdog and of the shutdown,
+are fed to an ObstacleBreak, a LineNavigator and a
+Driver, in time order. By default, the recording is replayed as fast as
+possible and every input is fully processed before the next one, so that the
+replay is deterministic. With --speed, the inputs are paced at the given
+multiple of real time instead.
+
+The comparison is only meaningful if the control code is configured as it
+was when recording: see the options, whose defaults match the ones of the
+robot.
+
+Usage:
+    python -m robot.replay drive.rec [--speed 4] [--time-to-collision 0]
+"""
+import argparse
+import difflib
+import logging
+import sys
+import time
+
+from gpiozero import Device
+from gpiozero.pins.mock import MockFactory, MockPWMPin
+
+import robot.hardware as hardware
+import robot.motion.driver as dvr
+import robot.recording as recording
+import robot.robot as rbt
+
+_logger = logging.getLogger(__name__)
+
+# Whether the (left, right) line sensors are on the track, for each value of
+# LineNavigator._State.
+_STATE_TO_TRACK = {
+    0: (True, False),
+    1: (False, True),
+    2: (True, True),
+    3: (False, False),
+}
+
+# Motor values are recorded as 32-bit floats: compare them with this many
+# decimal digits.
+_MOTOR_DIGITS = 3
+
+
+class _MotorCollector:
+    """Recorder for the replay Driver, collecting the motor values together
+    with the timestamp of the input causing them.
+    """
+
+    def __init__(self):
+        self.timestamp_ns = None
+        self.motor_values = []
+
+    def record(self, kind, source=0, value=0, x=0., y=0., timestamp_ns=None):
+        if kind == recording.KIND_MOTORS:
+            self.motor_values.append((self.timestamp_ns, x, y))
+
+
+def _round(values):
+    return tuple(round(value, _MOTOR_DIGITS) for value in values)
+
+
+def replay(records,
+           speed=None,
+           distance_m=0.1,
+           release_distance_m=None,
+           black_track=True,
+           max_speed_mps=dvr.MAX_SPEED_mps,
+           time_to_collision_s=rbt.DEFAULT_TIME_TO_COLLISION_s,
+           adaptive_sampling=True):
+    """Feeds the inputs of a recording to the control code.
+
+    Args:
+        records (list): The :obj:`Record` objects, in time order.
+        speed (float, optional): Multiple of real time at which to replay. As
+            fast as possible, and deterministically, if None.
+        distance_m (float, optional): Distance of the obstacle break, in m.
+        release_distance_m (float, optional): Release distance of the
+            obstacle break, in m.
+        black_track (bool, optional): Whether the track is black.
+        max_speed_mps (float, optional): Ground speed of the buggy with both
+            motors at full power, in m/s.
+        time_to_collision_s (float, optional): Time to collision of the
+            predictive stop of the obstacle break, in seconds. Disabled if
+            None.
+        adaptive_sampling (bool, optional): Whether the obstacle break adapts
+            the sampling rate of the sensors to the motion.
+
+    Returns:
+        list: The (timestamp_ns, left, right) values written to the motors,
+            with the timestamp of the recorded input causing them.
+    """
+    # The devices get mock pins, fresh ones at every run.
+    hardware.use_backend('mock')
+    Device.pin_factory = MockFactory(pin_class=MockPWMPin)
+
+    import robot.devices.led_status as ls
+    import robot.devices.line_navigator as ln
+    import robot.devices.obstacle_break as ob
+
+    collector = _MotorCollector()
+    driver = dvr.Driver(recorder=collector, max_speed_mps=max_speed_mps)
+    obstacle_break = ob.ObstacleBreak(driver=driver,
+                                      distance_m=distance_m,
+                                      release_distance_m=release_distance_m,
+                                      time_to_collision_s=time_to_collision_s,
+                                      adaptive_sampling=adaptive_sampling)
+    status_led = ls.StatusLed()
+    line_navigator = None
+
+    start_ns = records[0].timestamp_ns if records else 0
+    start_s = time.monotonic()
+    try:
+        for record in records:
+            if speed is not None:
+                delay_s = start_s + (record.timestamp_ns - start_ns) * 1e-9 \
+                    / speed - time.monotonic()
+                if delay_s > 0:
+                    time.sleep(delay_s)
+
+            collector.timestamp_ns = record.timestamp_ns
+            if record.kind == recording.KIND_ULTRASONIC:
+                sensor = obstacle_break.sensors[record.source]
+                sensor.feed(record.x, timestamp_s=record.timestamp_ns * 1e-9)
+                driver.apply_safety_flags()
+
+            elif record.kind == recording.KIND_LINE:
+                if line_navigator is None:
+                    line_navigator = ln.LineNavigator(driver=driver,
+                                                      status_led=status_led,
+                                                      black_track=black_track)
+                    # As LineNavigator.run() does before reading the sensors.
+                    driver.set_command(command_code=dvr.COMMAND_FORWARD,
+                                       command_value=True)
+
+                on_track_left, on_track_right = _STATE_TO_TRACK[record.value]
+                line_navigator.step(left_active=on_track_left != black_track,
+                                    right_active=on_track_right != black_track)
+
+            elif record.kind == recording.KIND_REMOTE:
+                driver.set_command_mask(record.value)
+
+            elif record.kind == recording.KIND_STOP:
+                driver.stop()
+
+    finally:
+        if line_navigator is not None:
+            line_navigator.close()
+        status_led.close()
+        obstacle_break.close()
+        driver.close()
+
+    return collector.motor_values
+
+
+def compare(records, motor_values):
+    """Prints the differences between the recorded and the replayed motor
+    values.
+
+    Args:
+        records (list): The recorded :obj:`Record` objects, in time order.
+        motor_values (list): The replayed (timestamp_ns, left, right) values.
+
+    Returns:
+        bool: True if the motor values are the same.
+    """
+    recorded = [(record.timestamp_ns, record.x, record.y)
+                for record in records
+                if record.kind == recording.KIND_MOTORS]
+    start_ns = records[0].timestamp_ns if records else 0
+
+    print('Motor values: {} recorded, {} replayed'.format(len(recorded),
+                                                          len(motor_values)))
+    matcher = difflib.SequenceMatcher(
+        a=[_round(values[1:]) for values in recorded],
+        b=[_round(values[1:]) for values in motor_values],
+        autojunk=False)
+
+    num_differences = 0
+    for tag, a_start, a_end, b_start, b_end in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+
+        num_differences += 1
+        timestamps_ns = [values[0] for values in
+                         recorded[a_start:a_end] + motor_values[b_start:b_end]]
+        print('{:>7} at {:8.3f} s: recorded {} replayed {}'.format(
+            tag,
+            (min(timestamps_ns) - start_ns) * 1e-9,
+            [_round(values[1:]) for values in recorded[a_start:a_end]],
+            [_round(values[1:]) for values in motor_values[b_start:b_end]]))
+
+    if num_differences == 0:
+        print('Identical motor values')
+    return num_differences == 0
+
+
+def _main():
+    parser = argparse.ArgumentParser(
+        description='Replay a recording and compare the motor values.')
+    parser.add_argument('path', help='Recording to replay.')
+    parser.add_argument('--speed',
+                        type=float,
+                        help='Replay at this multiple of real time. If not '
+                             'set, replay deterministically, as fast as '
+                             'possible.')
+    parser.add_argument('--distance-m',
+                        type=float,
+                        default=0.1,
+                        help='Distance of the obstacle break, in m.')
+    parser.add_argument('--release-distance-m',
+                        type=float,
+                        help='Release distance of the obstacle break, in m.')
+    parser.add_argument('--white-track',
+                        action='store_true',
+                        help='If set, the track is white rather than black.')
+    parser.add_argument('--max-speed',
+                        metavar='MPS',
+                        type=float,
+                        default=dvr.MAX_SPEED_mps,
+                        help='Ground speed of the buggy with the motors at '
+                             'full power, in m/s (default: %(default)s).')
+    parser.add_argument('--time-to-collision',
+                        metavar='S',
+                        type=float,
+                        default=rbt.DEFAULT_TIME_TO_COLLISION_s,
+                        help='Time to collision of the predictive stop, in '
+                             'seconds. 0 disables it (default: %(default)s).')
+    args = parser.parse_args()
+
+    if args.max_speed <= 0:
+        parser.error('Maximum speed must be positive')
+
+    records = recording.read_records(args.path)
+    start_s = time.monotonic()
+    motor_values = replay(records=records,
+                          speed=args.speed,
+                          distance_m=args.distance_m,
+                          release_distance_m=args.release_distance_m,
+                          black_track=not args.white_track,
+                          max_speed_mps=args.max_speed,
+                          time_to_collision_s=args.time_to_collision or None)
+    print('Replayed {} records in {:.3f} s'.format(len(records),
+                                                   time.monotonic() - start_s))
+    if not compare(records, motor_values):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    _main()
@@ -1,70 +1,281 @@
 import logging
 
 import robot.devices.led_status as ls
-import robot.devices.line_navigator as ln
 import robot.devices.obstacle_break as ob
-import robot.devices.remote.remote_receiver as rr
+import robot.instrumentation as instrumentation
+import robot.lifecycle as lc
 import robot.motion.driver as dvr
+import robot.network as network
+import robot.recording as recording
+import robot.scheduling as scheduling
+
+# The modules of each mode are imported when the mode starts, so that
+# starting the robot does not pay for the modules of the other one.
 
 _logger = logging.getLogger(__name__)
 
+# The motion towards an obstacle is stopped if the obstacle would be reached
+# within this time, in seconds (see ObstacleBreak).
+DEFAULT_TIME_TO_COLLISION_s = 0.3
+
 
-def _run_manual():
-    driver = dvr.Driver()
-    obstacle_break = ob.ObstacleBreak(driver=driver, distance_m=0.1)
-    status_led = ls.StatusLed()
-    remote_receiver = rr.RemoteReceiver(driver=driver, status_led=status_led)
+async def _serve_remote(remote_receiver, telemetry_publisher):
+    import asyncio
+
+    telemetry_task = asyncio.ensure_future(telemetry_publisher.serve())
+    try:
+        await remote_receiver.serve()
+    finally:
+        telemetry_task.cancel()
+
+
+def _declare_common_devices(lifecycle, recorder, max_speed_mps,
+                            time_to_collision_s):
+    # Stopping the driver comes before anything else is closed.
+    lifecycle.add('driver',
+                  lambda: dvr.Driver(recorder=recorder,
+                                     max_speed_mps=max_speed_mps),
+                  stop=lambda driver: driver.stop(
+                      reason=recording.STOP_SHUTDOWN))
+    lifecycle.add('status_led', ls.StatusLed)
+    lifecycle.add('obstacle_break',
+                  lambda driver: ob.ObstacleBreak(
+                      driver=driver,
+                      distance_m=0.1,
+                      adaptive_sampling=True,
+                      time_to_collision_s=time_to_collision_s,
+                      recorder=recorder),
+                  requires=['driver'])
+
+
+def _manual_lifecycle(recorder=None, robot_id=None, groups=0, listen_ip='',
+                      listen_port=network.PORT,
+                      max_speed_mps=dvr.MAX_SPEED_mps,
+                      time_to_collision_s=DEFAULT_TIME_TO_COLLISION_s):
+    """Declares the devices of the manual mode.
+
+    Returns:
+        :obj:`Lifecycle`: The lifecycle of the devices, not started yet.
+    """
+    import robot.devices.remote.remote_receiver as rr
+    import robot.telemetry as telemetry
+
+    def _remote_receiver(driver, status_led):
+        return rr.RemoteReceiver(driver=driver,
+                                 status_led=status_led,
+                                 recorder=recorder,
+                                 ip=listen_ip,
+                                 port=listen_port,
+                                 robot_id=robot_id,
+                                 groups=groups)
+
+    def _telemetry_publisher(driver, obstacle_break, remote_receiver):
+        # Sends the state of the robot back to whoever is driving it.
+        return telemetry.TelemetryPublisher(
+            driver=driver,
+            remote_ip=lambda: remote_receiver.remote_ip,
+            obstacle_break=obstacle_break,
+            robot_id=robot_id or telemetry.NO_ROBOT_ID,
+            acked_sequence=lambda: remote_receiver.acked_sequence)
+
+    lifecycle = lc.Lifecycle()
+    _declare_common_devices(lifecycle, recorder,
+                            max_speed_mps=max_speed_mps,
+                            time_to_collision_s=time_to_collision_s)
+    lifecycle.add('remote_receiver',
+                  _remote_receiver,
+                  requires=['driver', 'status_led'])
+    lifecycle.add('telemetry_publisher',
+                  _telemetry_publisher,
+                  requires=['driver', 'obstacle_break', 'remote_receiver'])
+    return lifecycle
+
+
+def _auto_lifecycle(recorder=None, telemetry_ip=None,
+                    max_speed_mps=dvr.MAX_SPEED_mps,
+                    time_to_collision_s=DEFAULT_TIME_TO_COLLISION_s,
+                    event_driven=False, proportional=False):
+    """Declares the devices of the line-tracking mode.
+
+    Args:
+        telemetry_ip (str, optional): Address or hostname to send the
+            telemetry to. No telemetry is sent if None.
+        event_driven (bool, optional): If True, the navigator reacts to the
+            events of the line sensors rather than polling them.
+        proportional (bool, optional): If True, the navigator steers
+            continuously rather than stopping to turn.
+
+    Returns:
+        :obj:`Lifecycle`: The lifecycle of the devices, not started yet.
+    """
+    import robot.devices.line_navigator as ln
+    import robot.telemetry as telemetry
+
+    def _telemetry_publisher(driver, obstacle_break, line_navigator):
+        # Reports the state of the navigation, if anyone listens.
+        return telemetry.TelemetryPublisher(
+            driver=driver,
+            remote_ip=lambda: telemetry_ip,
+            line_navigator=line_navigator,
+            obstacle_break=obstacle_break)
+
+    lifecycle = lc.Lifecycle()
+    _declare_common_devices(lifecycle, recorder,
+                            max_speed_mps=max_speed_mps,
+                            time_to_collision_s=time_to_collision_s)
+    lifecycle.add('line_navigator',
+                  lambda driver, status_led: ln.LineNavigator(
+                      driver=driver,
+                      status_led=status_led,
+                      black_track=True,
+                      event_driven=event_driven,
+                      recorder=recorder,
+                      proportional=proportional),
+                  requires=['driver', 'status_led'])
+    lifecycle.add('telemetry_publisher',
+                  _telemetry_publisher,
+                  requires=['driver', 'obstacle_break', 'line_navigator'])
+    return lifecycle
+
+
+def _run_manual(recorder=None, robot_id=None, groups=0, listen_ip='',
+                listen_port=network.PORT, max_speed_mps=dvr.MAX_SPEED_mps,
+                time_to_collision_s=DEFAULT_TIME_TO_COLLISION_s):
+    import asyncio
+
+    lifecycle = _manual_lifecycle(recorder=recorder,
+                                  robot_id=robot_id,
+                                  groups=groups,
+                                  listen_ip=listen_ip,
+                                  listen_port=listen_port,
+                                  max_speed_mps=max_speed_mps,
+                                  time_to_collision_s=time_to_collision_s)
+    devices = lifecycle.start()
 
     try:
         # Enable the automatic obstacle break.
-        obstacle_break.run()
+        devices['obstacle_break'].run()
 
         # Start the receiver to drive the motors.
-        remote_receiver.run()
+        asyncio.run(_serve_remote(
+            remote_receiver=devices['remote_receiver'],
+            telemetry_publisher=devices['telemetry_publisher']))
 
     except KeyboardInterrupt:
         # Legit way to interrupt the application.
         pass
 
     finally:
-        # However it goes, we want to perform these actions.
-        status_led.close()
-        obstacle_break.close()
-        driver.close()
+        # However it goes, stop the motors and close the devices.
+        lifecycle.close()
 
         print('Buggy correctly stopped.')
 
 
-def _run_auto():
-    driver = dvr.Driver()
-    obstacle_break = ob.ObstacleBreak(driver=driver, distance_m=0.1)
-    status_led = ls.StatusLed()
-    line_navigator = ln.LineNavigator(driver=driver,
-                                      status_led=status_led,
-                                      black_track=True)
+def _run_auto(recorder=None, telemetry_ip=None,
+              max_speed_mps=dvr.MAX_SPEED_mps,
+              time_to_collision_s=DEFAULT_TIME_TO_COLLISION_s,
+              event_driven=False, proportional=False):
+    lifecycle = _auto_lifecycle(recorder=recorder,
+                                telemetry_ip=telemetry_ip,
+                                max_speed_mps=max_speed_mps,
+                                time_to_collision_s=time_to_collision_s,
+                                event_driven=event_driven,
+                                proportional=proportional)
+    devices = lifecycle.start()
 
     try:
         # Enable the automatic obstacle break.
-        obstacle_break.run()
+        devices['obstacle_break'].run()
+
+        devices['telemetry_publisher'].start()
 
         # Start the automatic navigator.
-        line_navigator.run()
+        devices['line_navigator'].run()
 
     except KeyboardInterrupt:
         # Legit way to interrupt the application.
         pass
 
     finally:
-        line_navigator.close()
-        status_led.close()
-        obstacle_break.close()
-        driver.close()
+        lifecycle.close()
 
         print('Buggy correctly stopped.')
 
 
-def run(autopilot):
-    if autopilot:
-        _run_auto()
-    else:
-        _run_manual()
+def run(autopilot, record_path=None, instrument_target=None, realtime=False,
+        robot_id=None, groups=0, listen_ip='', listen_port=network.PORT,
+        telemetry_ip=None, max_speed_mps=dvr.MAX_SPEED_mps,
+        time_to_collision_s=DEFAULT_TIME_TO_COLLISION_s,
+        event_driven=False, proportional=False):
+    """Runs the robot until interrupted.
+
+    Args:
+        autopilot (bool): If True, follows the line, otherwise obeys the
+            remote.
+        record_path (str, optional): If provided, records the sensors and the
+            commands to this file (see robot.recording).
+        instrument_target (str, optional): If provided, enables the
+            instrumentation and periodically dumps it to this file, or to
+            this local port if in the form 'udp:PORT' (see
+            robot.instrumentation).
+        realtime (bool, optional): If True, pins the control loops to CPU
+            cores and runs them with real-time priority, where permitted
+            (see robot.scheduling).
+        robot_id (int, optional): If provided, the robot is part of a fleet
+            controlled over multicast, with this id. Manual mode only.
+        groups (int, optional): Bitmask of the groups of the robot in the
+            fleet.
+        listen_ip (str, optional): Address or hostname of the interface
+            to receive the commands on, all of them if empty. Manual mode
+            only.
+        listen_port (int, optional): Port to receive the commands on.
+        telemetry_ip (str, optional): Address or hostname of the remote to
+            send the telemetry to. Line-tracking mode only: in manual mode,
+            the telemetry goes to the remote sending the commands.
+        max_speed_mps (float, optional): Ground speed of the buggy with both
+            motors at full power, in m/s, to estimate the time to collision.
+        time_to_collision_s (float, optional): The motion towards an obstacle
+            is stopped if the obstacle would be reached within this time, in
+            seconds. Disabled if None.
+        event_driven (bool, optional): If True, the line is followed by
+            reacting to the events of the line sensors rather than polling
+            them (see LineNavigator). Line-tracking mode only.
+        proportional (bool, optional): If True, the line is followed by
+            steering continuously with a PID controller rather than stopping
+            to turn (see LineNavigator). Line-tracking mode only, not
+            together with event_driven.
+    """
+    recorder = None
+    if record_path is not None:
+        recorder = recording.Recorder(record_path)
+
+    if realtime:
+        scheduling.enable_realtime()
+
+    dumper = None
+    if instrument_target is not None:
+        instrumentation.enable()
+        dumper = instrumentation.Dumper(instrument_target)
+
+    try:
+        if autopilot:
+            _run_auto(recorder=recorder,
+                      telemetry_ip=telemetry_ip,
+                      max_speed_mps=max_speed_mps,
+                      time_to_collision_s=time_to_collision_s,
+                      event_driven=event_driven,
+                      proportional=proportional)
+        else:
+            _run_manual(recorder=recorder,
+                        robot_id=robot_id,
+                        groups=groups,
+                        listen_ip=listen_ip,
+                        listen_port=listen_port,
+                        max_speed_mps=max_speed_mps,
+                        time_to_collision_s=time_to_collision_s)
+    finally:
+        if dumper is not None:
+            dumper.close()
+        if recorder is not None:
+            recorder.close()
@@ -0,0 +1,155 @@
+"""Fixed-rate pacing of the periodic loops of the robot.
+
+A loop paced by a FixedRate runs at the start of every period on the
+monotonic clock, however long each iteration takes, rather than sleeping a
+fixed time after its work: the rate does not drift. An iteration which does
+not finish before the next deadline is an overrun: the overruns are counted
+and the missed deadlines are skipped rather than caught up with.
+
+Loops can also ask to be pinned to a CPU core and to run with real-time
+priority. These requests are ignored unless enable_realtime() is called, and
+are dropped with a warning if the system does not allow them, for example
+without root privileges.
+
+Example:
+    rate = FixedRate(period_s=0.01, name='control')
+    rate.start()
+    while True:
+        step()
+        rate.wait()
+"""
+import logging
+import os
+import threading
+import time
+
+import robot.instrumentation as instrumentation
+
+_logger = logging.getLogger(__name__)
+
+_realtime = False
+
+
+def enable_realtime():
+    """Lets the loops started afterwards, also in the processes started
+    afterwards, pin themselves to a core and raise their priority.
+    """
+    global _realtime
+    _realtime = True
+
+
+def set_realtime(cpu=None, priority=None):
+    """Pins the calling thread to a core and gives it real-time priority.
+
+    Args:
+        cpu (int, optional): Core to run on. Any if None.
+        priority (int, optional): SCHED_FIFO priority, between 1 and 99.
+            Normal scheduling if None.
+
+    Returns:
+        bool: True if all the requests were applied.
+    """
+    applied = True
+    if cpu is not None:
+        try:
+            # On Linux, pid 0 is the calling thread.
+            os.sched_setaffinity(0, {cpu})
+        except (AttributeError, OSError) as e:
+            _logger.warning('Cannot pin {} to CPU {}: {}'.format(
+                threading.current_thread().name, cpu, e))
+            applied = False
+
+    if priority is not None:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        except (AttributeError, OSError) as e:
+            _logger.warning('Cannot give real-time priority {} to {}: '
+                            '{}'.format(priority,
+                                        threading.current_thread().name, e))
+            applied = False
+
+    return applied
+
+
+class FixedRate:
+    """Paces a loop at a fixed rate.
+
+    Attributes:
+        _period_ns (int): Period of the loop, in ns.
+        _name (str): Name of the loop, for the logs and the instrumentation.
+        _stop_event (:obj:`Event`, optional): Event interrupting the waits.
+        _cpu (int, optional): Core to pin the loop to, if real-time is
+            enabled.
+        _priority (int, optional): SCHED_FIFO priority of the loop, if
+            real-time is enabled.
+    """
+
+    def __init__(self, period_s, name, stop_event=None, cpu=None,
+                 priority=None):
+        if period_s <= 0:
+            raise ValueError('Period must be positive. '
+                             'Provided is {}'.format(period_s))
+
+        self._period_ns = int(1e9 * period_s)
+        self._name = name
+        self._stop_event = stop_event
+        self._cpu = cpu
+        self._priority = priority
+
+        self._deadline_ns = None
+        self._num_periods = 0
+        self._num_overruns = 0
+        self._overruns = instrumentation.counter('{}.overruns'.format(name))
+
+    def start(self, stop_event=None):
+        """Sets the first deadline one period from now. To call from the
+        thread running the loop, right before the first iteration.
+
+        Args:
+            stop_event (:obj:`Event`, optional): Event interrupting the waits,
+                replacing the one provided at creation.
+        """
+        if stop_event is not None:
+            self._stop_event = stop_event
+
+        if _realtime and (self._cpu is not None or
+                          self._priority is not None):
+            set_realtime(cpu=self._cpu, priority=self._priority)
+
+        self._deadline_ns = time.monotonic_ns() + self._period_ns
+
+    def wait(self):
+        """Waits for the start of the next period.
+
+        Returns:
+            bool: True if the stop event is set.
+        """
+        if self._deadline_ns is None:
+            self.start()
+
+        self._num_periods += 1
+        now_ns = time.monotonic_ns()
+        if now_ns >= self._deadline_ns:
+            # The iteration took longer than a period: start the next one
+            # right away, one period before the following deadline.
+            self._num_overruns += 1
+            if self._overruns is not None:
+                self._overruns.increment()
+            self._deadline_ns = now_ns + self._period_ns
+            return self._stop_event is not None and self._stop_event.is_set()
+
+        timeout_s = (self._deadline_ns - now_ns) * 1e-9
+        self._deadline_ns += self._period_ns
+        if self._stop_event is None:
+            time.sleep(timeout_s)
+            return False
+        return self._stop_event.wait(timeout_s)
+
+    @property
+    def stats(self):
+        """dict: Number of periods elapsed and of overruns.
+        """
+        return {
+            'periods': self._num_periods,
+            'overruns': self._num_overruns,
+        }
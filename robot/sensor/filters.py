@@ -0,0 +1,238 @@
+"""Streaming filters for the distance measurements of ultrasonic sensors.
+
+Ultrasonic sensors are noisy: readings jitter by a few centimeters and every
+now and then a reading is completely off, for example because the echo was
+lost or because the ping of another sensor was received. The filters in this
+module smooth the stream of measurements and reject the outliers, one sample
+at a time and in constant time and memory.
+
+Every filter provides an update() method which takes the latest raw sample
+and returns the filtered distance, or None if the sample was rejected.
+
+Run this module to compare the number of spurious in-range/out-of-range
+transitions, and the cost per sample, with and without filtering:
+    python -m robot.sensor.filters
+"""
+import math
+import random
+import time
+
+# Readings outside the working range of HC-SR0X sensors are never valid.
+MIN_DISTANCE_cm = 2.
+MAX_DISTANCE_cm = 400.
+
+
+class _Filter:
+    """Base class providing the outlier rejection.
+
+    A sample is an outlier if it is outside the working range of the sensor,
+    or if it is farther than "max_jump_cm" from the current estimate. However,
+    if "max_outliers" consecutive samples are rejected for being too far from
+    the estimate, the estimate is assumed wrong and the filter is reset: a
+    real obstacle suddenly appearing must not be filtered away.
+
+    Attributes:
+        _max_jump_cm (float, optional): Maximum distance of a sample from the
+            current estimate, in cm. No limit if None.
+        _max_outliers (int): Maximum number of consecutive rejected samples.
+    """
+
+    def __init__(self, max_jump_cm=None, max_outliers=2):
+        self._max_jump_cm = max_jump_cm
+        self._max_outliers = max_outliers
+        self._num_outliers = 0
+        self._estimate_cm = None
+
+    def _reset(self):
+        self._estimate_cm = None
+
+    def _filter(self, distance_cm, timestamp_s):
+        raise NotImplementedError()
+
+    def update(self, distance_cm, timestamp_s):
+        """Processes a new sample.
+
+        Args:
+            distance_cm (float): Raw measured distance, in cm.
+            timestamp_s (float): Monotonic time of the measurement, in seconds.
+
+        Returns:
+            float: The filtered distance in cm, or None if the sample was
+                rejected as an outlier.
+        """
+        if not MIN_DISTANCE_cm <= distance_cm <= MAX_DISTANCE_cm:
+            return None
+
+        if self._max_jump_cm is not None and self._estimate_cm is not None \
+                and abs(distance_cm - self._estimate_cm) > self._max_jump_cm:
+            self._num_outliers += 1
+            if self._num_outliers <= self._max_outliers:
+                return None
+
+            # Too many consecutive outliers: the scene changed.
+            self._reset()
+
+        self._num_outliers = 0
+        self._estimate_cm = self._filter(distance_cm, timestamp_s)
+        return self._estimate_cm
+
+    @property
+    def estimate_cm(self):
+        """float: Latest filtered distance in cm, or None if no sample was
+        accepted yet.
+        """
+        return self._estimate_cm
+
+
+class MedianFilter(_Filter):
+    """Rolling median over the latest samples.
+
+    The median ignores isolated spikes but delays real changes by half the
+    window.
+
+    Attributes:
+        _window (list): Ring buffer of the latest samples.
+    """
+
+    def __init__(self, window_size=5, max_jump_cm=None, max_outliers=2):
+        super().__init__(max_jump_cm=max_jump_cm, max_outliers=max_outliers)
+        if window_size < 1:
+            raise ValueError('Window size must be positive. '
+                             'Provided is {}'.format(window_size))
+
+        self._window = [0.] * window_size
+        self._next_idx = 0
+        self._num_samples = 0
+
+    def _reset(self):
+        super()._reset()
+        self._next_idx = 0
+        self._num_samples = 0
+
+    def _filter(self, distance_cm, timestamp_s):
+        self._window[self._next_idx] = distance_cm
+        self._next_idx = (self._next_idx + 1) % len(self._window)
+        self._num_samples = min(self._num_samples + 1, len(self._window))
+
+        samples = sorted(self._window[:self._num_samples])
+        return samples[self._num_samples // 2]
+
+
+class AlphaBetaFilter(_Filter):
+    """Alpha-beta filter tracking distance and closing rate.
+
+    The filter predicts the distance from the latest estimate and rate, then
+    corrects both by a fraction (alpha and beta) of the prediction error. It
+    follows steady approaches with less lag than the median.
+
+    Attributes:
+        _alpha (float): Gain of the distance correction, in (0, 1].
+        _beta (float): Gain of the rate correction, in [0, 2).
+        _rate_cmps (float): Estimated rate of change of the distance, in cm/s.
+    """
+
+    def __init__(self, alpha=0.5, beta=0.1, max_jump_cm=None, max_outliers=2):
+        super().__init__(max_jump_cm=max_jump_cm, max_outliers=max_outliers)
+        self._alpha = alpha
+        self._beta = beta
+        self._rate_cmps = 0.
+        self._timestamp_s = None
+
+    def _reset(self):
+        super()._reset()
+        self._rate_cmps = 0.
+        self._timestamp_s = None
+
+    def _filter(self, distance_cm, timestamp_s):
+        if self._estimate_cm is None:
+            self._timestamp_s = timestamp_s
+            return distance_cm
+
+        dt_s = timestamp_s - self._timestamp_s
+        self._timestamp_s = timestamp_s
+
+        predicted_cm = self._estimate_cm + self._rate_cmps * dt_s
+        error_cm = distance_cm - predicted_cm
+        if dt_s > 0:
+            self._rate_cmps += self._beta * error_cm / dt_s
+
+        return predicted_cm + self._alpha * error_cm
+
+    @property
+    def rate_cmps(self):
+        """float: Estimated rate of change of the distance, in cm/s. Negative
+        when approaching.
+        """
+        return self._rate_cmps
+
+
+def _count_transitions(samples, enter_cm, exit_cm, distance_filter=None):
+    in_range = None
+    num_transitions = 0
+    start_s = time.perf_counter()
+    for timestamp_s, distance_cm in samples:
+        if distance_filter is not None:
+            distance_cm = distance_filter.update(distance_cm, timestamp_s)
+            if distance_cm is None:
+                continue
+
+        if in_range:
+            new_in_range = distance_cm <= exit_cm
+        else:
+            new_in_range = distance_cm <= enter_cm
+
+        if in_range is not None and new_in_range != in_range:
+            num_transitions += 1
+        in_range = new_in_range
+
+    cost_s = (time.perf_counter() - start_s) / len(samples)
+    return num_transitions, cost_s
+
+
+def _benchmark():
+    # The robot approaches an obstacle, hovers around the threshold, then
+    # backs away: only two transitions are real.
+    threshold_cm = 10.
+    measure_interval_s = 72e-3
+    num_samples = 20000
+    noise_cm = 1.5
+    outlier_rate = 0.03
+
+    rng = random.Random(0)
+    samples = []
+    for idx in range(num_samples):
+        phase = 2 * math.pi * idx / num_samples
+        true_cm = threshold_cm + 8 * math.cos(phase) + 0.5
+        distance_cm = true_cm + rng.gauss(0, noise_cm)
+        if rng.random() < outlier_rate:
+            distance_cm = rng.choice([MAX_DISTANCE_cm, rng.uniform(3, 60)])
+        samples.append((idx * measure_interval_s, distance_cm))
+
+    configurations = [
+        ('raw, single threshold', None, threshold_cm),
+        ('raw, hysteresis', None, threshold_cm + 3),
+        ('median(5), hysteresis',
+         MedianFilter(window_size=5, max_jump_cm=15),
+         threshold_cm + 3),
+        ('alpha-beta, hysteresis',
+         AlphaBetaFilter(alpha=0.4, beta=0.05, max_jump_cm=15),
+         threshold_cm + 3),
+    ]
+
+    print('{} samples, 2 real transitions'.format(num_samples))
+    print('{:<24} {:>12} {:>14}'.format('configuration',
+                                        'transitions',
+                                        'us per sample'))
+    for name, distance_filter, exit_cm in configurations:
+        num_transitions, cost_s = _count_transitions(
+            samples=samples,
+            enter_cm=threshold_cm,
+            exit_cm=exit_cm,
+            distance_filter=distance_filter)
+        print('{:<24} {:>12} {:>14.2f}'.format(name,
+                                               num_transitions,
+                                               1e6 * cost_s))
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -6,10 +6,16 @@ We had to implement our own class for two reasons:
 * we want to able to drive multiple sensors simultaneously using the same
   trigger pin to save resources.
 """
+import collections
 import logging
+import math
+import queue
+import threading
 import time
 
-import RPi.GPIO as GPIO
+import robot.hardware as hardware
+import robot.instrumentation as instrumentation
+import robot.scheduling as scheduling
 
 _logger = logging.getLogger(__name__)
 
@@ -20,6 +26,44 @@ class _TimeoutError(Exception):
     pass
 
 
+class _CallbackDispatcher:
+    """Runs callbacks in a dedicated thread, in the same order they are
+    submitted, so that slow callbacks do not delay the caller.
+    """
+
+    def __init__(self, name):
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run,
+                                        name=name,
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            callback, args = item
+            try:
+                callback(*args)
+            except Exception:
+                _logger.exception('Callback {} failed'.format(callback))
+
+    def submit(self, callback, *args):
+        self._queue.put((callback, args))
+
+    def close(self, timeout_s=None):
+        """Stops the dispatcher after all the pending callbacks have run.
+
+        Args:
+            timeout_s (float, optional): Maximum time to wait for the pending
+                callbacks, in seconds. Wait forever if None.
+        """
+        self._queue.put(None)
+        self._thread.join(timeout_s)
+
+
 class UltrasonicSensor:
     """Implements the basic functionality to use an ultrasonic distance sensor
     like the common HC-SR04.
@@ -34,6 +78,31 @@ class UltrasonicSensor:
     range or out of range. The functions are blocking: while the functions do
     not return, no further measurement will be taken.
 
+    Either way, the sensor waits for the echo at most as long as an echo from
+    the maximum range takes to come back, so that a lost echo does not stall
+    the measurements, nor delay stopping them.
+
+    If "edge_timing" is set, the ECHO pulse is timed by edge interrupts with
+    monotonic nanosecond timestamps instead of blocking on each edge. In this
+    mode the callback functions run in a dedicated dispatcher thread and do
+    not delay the following measurements.
+
+    If instrumentation (see robot.instrumentation) is enabled, the interval
+    between the pings, the number of timeouts and, in edge timing mode, the
+    delay from the trigger to the rising ECHO edge are measured.
+
+    The raw measurements can be passed through a filter from
+    robot.sensor.filters before being yielded and compared to the threshold.
+    To avoid flapping when the distance is close to the threshold, a larger
+    "release_threshold_m" can be provided: the obstacle is then out of range
+    only when the distance becomes larger than the release threshold.
+
+    The sampling rate can be lowered while fast measurements are not needed
+    by providing a "pace": the sensor still wakes up every measure interval,
+    but pings only once the number of intervals returned by the pace has
+    elapsed since the previous measurement. A faster pace then applies
+    within an interval.
+
     Attributes:
         _trig_pin (int): TRIG pin.
         _echo_pin (int): ECHO pin.
@@ -45,11 +114,26 @@ class UltrasonicSensor:
             read distance becomes lower than this threshold, the callback
             "when_in_range" is called. When the read distance becomes bigger,
             the "when_out_of_rage" is called.
+        _release_threshold_m (float, optional): Distance in meters. If
+            provided, an obstacle in range goes out of range only when the
+            read distance becomes bigger than this threshold.
         _when_in_range (callable, optional): Function to call when the read
             distance becomes smaller than "_distance_threshold_m".
         _when_out_of_range (callable, optional): Function to call when the read
-            distance becomes larger than "_distance_threshold_m".
+            distance becomes larger than "_distance_threshold_m", or
+            "_release_threshold_m" if provided.
+        _when_measured (callable, optional): Function to call with every
+            distance measurement, in cm, and its monotonic time, in seconds.
         _name (str, optional): Name of the device.
+        _edge_timing (bool, optional): If True, time the ECHO pulse with edge
+            interrupts.
+        _echo_timeout_s (float): How long to wait for each ECHO edge, or for
+            the complete ECHO pulse in edge timing mode, in seconds.
+        _distance_filter (object, optional): Filter for the raw measurements,
+            like the ones in robot.sensor.filters.
+        _pace (callable, optional): Function returning the number of measure
+            intervals, at least 1, between two measurements. Every interval
+            if None.
     """
 
     # The formula to convert the pulse duration to distance in centimeters is:
@@ -68,8 +152,18 @@ class UltrasonicSensor:
     # some slack time between consecutive measurements.
     _MEASURE_INTERVAL_FACTOR = 1.2
 
-    # How long to wait before giving up waiting for the signal back, in seconds.
-    _TIMEOUT_s = 1
+    # Nominal maximum range of HC-SR0X sensors.
+    _MAX_RANGE_m = 4.0
+
+    # Wait for the echo from the maximum range plus some margin for the delay
+    # between the trigger and the rising ECHO edge.
+    _ECHO_TIMEOUT_FACTOR = 1.5
+    _ECHO_RISE_DELAY_s = 1e-3
+
+    # Core and SCHED_FIFO priority of the measuring loop, if real-time
+    # scheduling is enabled (see robot.scheduling).
+    _CPU = 2
+    _REALTIME_PRIORITY = 40
 
     # Name id.
     _id = 0
@@ -82,29 +176,82 @@ class UltrasonicSensor:
                  distance_threshold_m=None,
                  when_in_range=None,
                  when_out_of_range=None,
-                 name=None):
+                 name=None,
+                 edge_timing=False,
+                 max_range_m=None,
+                 distance_filter=None,
+                 release_threshold_m=None,
+                 when_measured=None,
+                 pace=None):
         self._trig_pin = trig_pin
         self._echo_pin = echo_pin
         self._pulse_s = pulse_s
         self._measure_interval_s = \
             measure_interval_s * self._MEASURE_INTERVAL_FACTOR
         self._distance_threshold_m = distance_threshold_m
+        self._release_threshold_m = release_threshold_m
+        if release_threshold_m is None:
+            self._release_threshold_m = distance_threshold_m
+        elif distance_threshold_m is None or \
+                release_threshold_m < distance_threshold_m:
+            raise ValueError('Release threshold must not be smaller than the '
+                             'distance threshold. Provided are {} and '
+                             '{}'.format(release_threshold_m,
+                                         distance_threshold_m))
+        self._distance_filter = distance_filter
         self._when_in_range = when_in_range
         self._when_out_of_range = when_out_of_range
+        self._when_measured = when_measured
+        self._pace = pace
         self._name = name
         if self._name is None:
             self._name = 'UltrasonicSensor{}'.format(self._id)
             self._update_id()
 
+        self._edge_timing = edge_timing
+        if max_range_m is None:
+            max_range_m = self._MAX_RANGE_m
+        self._echo_timeout_s = \
+            2 * max_range_m / _SPEED_OF_SOUND_mps * self._ECHO_TIMEOUT_FACTOR \
+            + self._ECHO_RISE_DELAY_s
+
+        # Edge timing state. The edge detection and the dispatcher thread
+        # are set up when reading starts, because the sensor may be read
+        # in a different process than the one it was created in.
+        self._edge_times_ns = []
+        self._echo_received = threading.Event()
+        self._dispatcher = None
+
         # Keeps track if the measured distance is in range or not.
         self._in_range = None
 
+        # Measure intervals elapsed since the previous measurement. The first
+        # measurement is always due.
+        self._intervals_since_ping = float('inf')
+
+        self._ping_period = instrumentation.period(
+            'ultrasonic.{}.ping'.format(self._name))
+        self._num_timeouts = instrumentation.counter(
+            'ultrasonic.{}.timeouts'.format(self._name))
+        self._echo_delay = instrumentation.histogram(
+            'ultrasonic.{}.echo_delay'.format(self._name))
+
+        # Pace of the measuring loop. Created here rather than when reading
+        # starts, which can be in a child process: the instruments must be
+        # created by the parent to be visible to it.
+        self._rate = scheduling.FixedRate(
+            period_s=self._measure_interval_s,
+            name='ultrasonic.{}'.format(self._name),
+            cpu=self._CPU,
+            priority=self._REALTIME_PRIORITY)
+
         _logger.info('Initializing ultrasonic sensor {}'.format(self._name))
 
-        GPIO.setup(self._trig_pin, GPIO.OUT)
-        GPIO.setup(self._echo_pin, GPIO.IN)
+        self._gpio = hardware.gpio()
+        self._gpio.setup(self._trig_pin, self._gpio.OUT)
+        self._gpio.setup(self._echo_pin, self._gpio.IN)
         time.sleep(self._INIT_SETUP_TIME_s)
-        GPIO.output(self._trig_pin, False)
+        self._gpio.output(self._trig_pin, False)
 
         # Generate a pulse to zero-out the echo pin.
         self._pulse()
@@ -118,24 +265,65 @@ class UltrasonicSensor:
     def _pulse(self):
         """Sends a pulse to the TRIG pin to start a measure.
         """
-        GPIO.output(self._trig_pin, True)
+        self._gpio.output(self._trig_pin, True)
         time.sleep(self._pulse_s)
-        GPIO.output(self._trig_pin, False)
+        self._gpio.output(self._trig_pin, False)
+
+    def _start_rate(self, stop_event):
+        """Returns the pace of a measuring loop starting now.
+        """
+        self._rate.start(stop_event=stop_event)
+        return self._rate
+
+    def _due(self):
+        """Tells whether to measure in the current interval, given the pace.
+        To call once per measure interval.
+        """
+        if self._pace is None:
+            return True
+
+        self._intervals_since_ping += 1
+        if self._intervals_since_ping < self._pace():
+            return False
+
+        self._intervals_since_ping = 0
+        return True
+
+    def _ping(self):
+        """Same as _pulse(), for a measurement.
+        """
+        if self._ping_period is not None:
+            self._ping_period.tick()
+        self._pulse()
+
+    def _timed_out(self):
+        _logger.warning('Ultrasonic sensor {} timed-out'.format(self._name))
+        if self._num_timeouts is not None:
+            self._num_timeouts.increment()
 
-    def _callbacks(self, distance_cm):
-        """Calls the appropriate callback function, if a status change is
-        detected.
+    def _callbacks(self, distance_cm, timestamp_s):
+        """Calls the measurement callback and the appropriate range callback
+        function, if a status change is detected.
 
         Args:
             distance_cm (float): The latest read distance, in cm.
+            timestamp_s (float): Monotonic time of the measurement, in
+                seconds.
         """
+        if self._when_measured is not None:
+            self._call(self._when_measured, distance_cm, timestamp_s)
+
         if self._distance_threshold_m is None:
             return
 
         if self._when_in_range is None and self._when_out_of_range is None:
             return
 
-        in_range = distance_cm <= 100 * self._distance_threshold_m
+        if self._in_range:
+            in_range = distance_cm <= 100 * self._release_threshold_m
+        else:
+            in_range = distance_cm <= 100 * self._distance_threshold_m
+
         if in_range == self._in_range:
             # No status change. Note that the first time in_range is set is
             # always detected as a status change.
@@ -147,54 +335,363 @@ class UltrasonicSensor:
         if self._in_range:
             # Out of range -> in range.
             if self._when_in_range is not None:
-                self._when_in_range(distance_cm)
+                self._call(self._when_in_range, distance_cm)
         else:
             # In range -> out of range.
             if self._when_out_of_range is not None:
-                self._when_out_of_range(distance_cm)
+                self._call(self._when_out_of_range, distance_cm)
+
+    def _call(self, callback, *args):
+        if self._dispatcher is None:
+            callback(*args)
+        else:
+            self._dispatcher.submit(callback, *args)
+
+    def _filter(self, distance_cm, timestamp_s):
+        """Passes a raw measurement through the distance filter, if any.
+
+        Args:
+            distance_cm (float): The latest raw distance, in cm.
+            timestamp_s (float): Monotonic time of the measurement, in
+                seconds.
+
+        Returns:
+            float: The filtered distance in cm, or None if the measurement was
+                rejected.
+        """
+        if self._distance_filter is None:
+            return distance_cm
 
-    def read(self):
-        """Cycles forever yielding distance measurements in cm.
+        return self._distance_filter.update(distance_cm, timestamp_s)
+
+    def feed(self, distance_cm, timestamp_s=None):
+        """Processes a raw measurement taken elsewhere, for example replayed
+        from a recording, as if it was just read by the sensor.
+
+        Args:
+            distance_cm (float): Raw distance, in cm.
+            timestamp_s (float, optional): Monotonic time of the measurement,
+                in seconds. Now, if not provided.
+
+        Returns:
+            float: The filtered distance in cm, or None if the measurement was
+                rejected.
+        """
+        if timestamp_s is None:
+            timestamp_s = time.monotonic()
+        distance_cm = self._filter(distance_cm, timestamp_s)
+        if distance_cm is not None:
+            self._callbacks(distance_cm=distance_cm, timestamp_s=timestamp_s)
+        return distance_cm
+
+    def _pulse_to_distance_cm(self, pulse_duration_s):
+        """Converts the duration of an ECHO pulse to a distance in cm.
+
+        Args:
+            pulse_duration_s (float): Duration of the ECHO pulse, in seconds.
+
+        Returns:
+            float: The measured distance, in cm.
+        """
+        return pulse_duration_s * self._PULSE_TO_DISTANCE_MULTIPLIER_cmps
+
+    def _on_echo_edge(self, _channel):
+        """Records the time of an ECHO edge. Called by the GPIO library.
         """
+        self._edge_times_ns.append(time.monotonic_ns())
+        if len(self._edge_times_ns) == 2:
+            # Rising and falling edges received.
+            self._echo_received.set()
+
+    def read(self, stop_event=None):
+        """Cycles yielding distance measurements in cm.
+
+        Args:
+            stop_event (:obj:`Event`, optional): If provided, stop reading when
+                the event is set. Otherwise, cycle forever.
+        """
+        if self._edge_timing:
+            yield from self._read_edge_timing(stop_event=stop_event)
+            return
+
         # The GPIO library requires ms as units.
-        timeout_ms = int(1000 * self._TIMEOUT_s)
-        while True:
-            self._pulse()
+        timeout_ms = math.ceil(1000 * self._echo_timeout_s)
+        rate = self._start_rate(stop_event)
+        while stop_event is None or not stop_event.is_set():
+            if not self._due():
+                if rate.wait():
+                    return
+                continue
+
+            self._ping()
             try:
-                channel = GPIO.wait_for_edge(self._echo_pin,
-                                             GPIO.RISING,
-                                             timeout=timeout_ms)
+                channel = self._gpio.wait_for_edge(self._echo_pin,
+                                                   self._gpio.RISING,
+                                                   timeout=timeout_ms)
                 if channel is None:
                     _logger.debug('Waiting for HIGH timed out')
                     raise _TimeoutError()
 
-                pulse_start = time.time()
-                channel = GPIO.wait_for_edge(self._echo_pin,
-                                             GPIO.FALLING,
-                                             timeout=timeout_ms)
+                pulse_start_ns = time.monotonic_ns()
+                channel = self._gpio.wait_for_edge(self._echo_pin,
+                                                   self._gpio.FALLING,
+                                                   timeout=timeout_ms)
                 if channel is None:
                     _logger.debug('Waiting for LOW timed out')
                     raise _TimeoutError()
 
-                pulse_end = time.time()
-                distance_cm = (pulse_end - pulse_start) \
-                              * self._PULSE_TO_DISTANCE_MULTIPLIER_cmps
-                yield distance_cm
-                self._callbacks(distance_cm=distance_cm)
+                pulse_end_ns = time.monotonic_ns()
+                timestamp_s = pulse_end_ns * 1e-9
+                distance_cm = self._filter(
+                    self._pulse_to_distance_cm(
+                        (pulse_end_ns - pulse_start_ns) * 1e-9),
+                    timestamp_s)
+                if distance_cm is not None:
+                    yield distance_cm
+                    self._callbacks(distance_cm=distance_cm,
+                                    timestamp_s=timestamp_s)
 
             except _TimeoutError:
-                _logger.warning(
-                    'Ultrasonic sensor {} timed-out'.format(self._name))
+                self._timed_out()
+
+            if rate.wait():
+                return
 
-            time.sleep(self._measure_interval_s)
+    def _read_edge_timing(self, stop_event=None):
+        """Same as read(), but times the ECHO pulse with edge interrupts.
+        """
+        self._dispatcher = _CallbackDispatcher(
+            name='{}Callbacks'.format(self._name))
+        self._gpio.add_event_detect(self._echo_pin,
+                                    self._gpio.BOTH,
+                                    callback=self._on_echo_edge)
+        rate = self._start_rate(stop_event)
+        try:
+            while True:
+                if not self._due():
+                    pass
+                elif self._gpio.input(self._echo_pin):
+                    # The ECHO pin is still high from a previous late echo:
+                    # a new measurement would be corrupted.
+                    _logger.debug('ECHO pin of {} still high'.format(
+                        self._name))
+                else:
+                    self._edge_times_ns = []
+                    self._echo_received.clear()
+                    trigger_ns = time.monotonic_ns()
+                    self._ping()
+                    if self._echo_received.wait(self._echo_timeout_s):
+                        pulse_start_ns, pulse_end_ns = self._edge_times_ns[:2]
+                        if self._echo_delay is not None:
+                            self._echo_delay.record(
+                                pulse_start_ns - trigger_ns)
+                        timestamp_s = pulse_end_ns * 1e-9
+                        distance_cm = self._filter(
+                            self._pulse_to_distance_cm(
+                                (pulse_end_ns - pulse_start_ns) * 1e-9),
+                            timestamp_s)
+                        if distance_cm is not None:
+                            yield distance_cm
+                            self._callbacks(distance_cm=distance_cm,
+                                            timestamp_s=timestamp_s)
+                    else:
+                        self._timed_out()
+
+                if rate.wait():
+                    return
+
+        finally:
+            self._gpio.remove_event_detect(self._echo_pin)
+            self._dispatcher.close(timeout_s=self._measure_interval_s)
+            self._dispatcher = None
 
     def close(self):
-        GPIO.cleanup((self._trig_pin, self._echo_pin))
+        self._gpio.cleanup((self._trig_pin, self._echo_pin))
         _logger.info('Ultrasonic sensor {} shut down'.format(self._name))
 
 
+class UltrasonicArray:
+    """Drives several ultrasonic sensors from a single loop.
+
+    Sensors sharing the same TRIG pin are fired together by a single pulse and
+    their ECHO pins are timed in parallel, by edge interrupts as in the edge
+    timing mode of a single sensor: the loop sleeps while waiting for the
+    echoes, and the callbacks run in a dispatcher thread.
+
+    Sensors with different TRIG pins are assigned to different time slots of
+    the measuring cycle: each group is fired once per cycle and the pings of
+    different groups are evenly spaced, so that no sensor picks up the ping
+    of another group.
+
+    The sensors are only used as a description of the hardware and as holders
+    of the callbacks: their own read() method must not be used at the same
+    time.
+
+    Attributes:
+        _groups (list): Lists of sensors sharing the same TRIG pin, one per
+            time slot.
+        _slot_s (float): Duration of a time slot, in seconds.
+        _name (str, optional): Name of the device.
+    """
+
+    def __init__(self, sensors, name=None):
+        if not sensors:
+            raise ValueError('At least one sensor must be provided')
+
+        self._gpio = hardware.gpio()
+        groups = collections.OrderedDict()
+        for sensor in sensors:
+            groups.setdefault(sensor._trig_pin, []).append(sensor)
+        self._groups = list(groups.values())
+
+        # Every sensor must not be fired more often than its measure interval
+        # allows, hence the whole cycle lasts as long as the slowest sensor
+        # requires and is split evenly among the groups.
+        cycle_s = max(sensor._measure_interval_s for sensor in sensors)
+        self._slot_s = cycle_s / len(self._groups)
+
+        self._name = name
+        if self._name is None:
+            self._name = 'UltrasonicArray'
+
+        # Created here for its instruments to be visible to the parent, see
+        # UltrasonicSensor.
+        self._rate = scheduling.FixedRate(
+            period_s=self._slot_s,
+            name='ultrasonic.{}'.format(self._name),
+            cpu=UltrasonicSensor._CPU,
+            priority=UltrasonicSensor._REALTIME_PRIORITY)
+
+        _logger.info('Ultrasonic array {} initialized with {} sensors in {} '
+                     'time slots of {:.1f} ms'.format(self._name,
+                                                      len(sensors),
+                                                      len(self._groups),
+                                                      1000 * self._slot_s))
+
+    def _time_echoes(self, group, trigger_ns, timeout_s):
+        """Waits for the ECHO pulses of all the sensors in a group, timed in
+        parallel by edge interrupts.
+
+        Args:
+            group (list): Sensors fired by the same pulse.
+            trigger_ns (int): Monotonic time of the pulse, in ns.
+            timeout_s (float): How long to wait for all the ECHO pulses to
+                complete, in seconds.
+
+        Returns:
+            dict: Maps each sensor whose ECHO pulse completed in time to the
+                monotonic times of the start and of the end of the pulse, in
+                ns.
+        """
+        pulses_ns = {}
+        deadline_s = time.monotonic() + timeout_s
+        for sensor in group:
+            if not sensor._echo_received.wait(
+                    max(0., deadline_s - time.monotonic())):
+                sensor._timed_out()
+                continue
+
+            pulse_start_ns, pulse_end_ns = sensor._edge_times_ns[:2]
+            if sensor._echo_delay is not None:
+                sensor._echo_delay.record(pulse_start_ns - trigger_ns)
+            pulses_ns[sensor] = (pulse_start_ns, pulse_end_ns)
+
+        return pulses_ns
+
+    def _fire(self, group):
+        """Fires a group of sensors and times their echoes.
+
+        Returns:
+            dict: Same as _time_echoes(), empty if an ECHO pin is still high
+                from a previous late echo.
+        """
+        gpio = self._gpio
+        for sensor in group:
+            if gpio.input(sensor._echo_pin):
+                # A new measurement would be corrupted.
+                _logger.debug('ECHO pin of {} still high'.format(
+                    sensor._name))
+                return {}
+
+        for sensor in group:
+            sensor._edge_times_ns = []
+            sensor._echo_received.clear()
+
+        trigger_ns = time.monotonic_ns()
+        group[0]._ping()
+        return self._time_echoes(group,
+                                 trigger_ns=trigger_ns,
+                                 timeout_s=self._slot_s)
+
+    def read(self, stop_event=None):
+        """Cycles yielding (sensor, distance in cm) pairs.
+
+        Args:
+            stop_event (:obj:`Event`, optional): If provided, stop reading when
+                the event is set. Otherwise, cycle forever.
+        """
+        # Set up here rather than at creation, as for the edge timing of a
+        # single sensor, because reading may happen in another process.
+        dispatcher = _CallbackDispatcher(
+            name='{}Callbacks'.format(self._name))
+        sensors = [sensor for group in self._groups for sensor in group]
+        for sensor in sensors:
+            sensor._dispatcher = dispatcher
+            self._gpio.add_event_detect(sensor._echo_pin,
+                                        self._gpio.BOTH,
+                                        callback=sensor._on_echo_edge)
+
+        rate = self._rate
+        rate.start(stop_event=stop_event)
+        try:
+            while True:
+                for group in self._groups:
+                    # All the sensors in a group share the same TRIG pin: fire
+                    # it if any of them is due. Every sensor must count the
+                    # slot.
+                    if any([sensor._due() for sensor in group]):
+                        pulses_ns = self._fire(group)
+                    else:
+                        pulses_ns = {}
+
+                    for sensor in group:
+                        if sensor not in pulses_ns:
+                            continue
+
+                        pulse_start_ns, pulse_end_ns = pulses_ns[sensor]
+                        timestamp_s = pulse_end_ns * 1e-9
+                        distance_cm = sensor._filter(
+                            sensor._pulse_to_distance_cm(
+                                (pulse_end_ns - pulse_start_ns) * 1e-9),
+                            timestamp_s)
+                        if distance_cm is None:
+                            continue
+
+                        yield sensor, distance_cm
+                        sensor._callbacks(distance_cm=distance_cm,
+                                          timestamp_s=timestamp_s)
+
+                    # Wait for the ping to fade out before firing the next
+                    # group. If running late, do not try to catch up.
+                    if rate.wait():
+                        return
+
+        finally:
+            for sensor in sensors:
+                self._gpio.remove_event_detect(sensor._echo_pin)
+                sensor._dispatcher = None
+            dispatcher.close(timeout_s=self._slot_s)
+
+    def close(self):
+        for group in self._groups:
+            for sensor in group:
+                sensor.close()
+        _logger.info('Ultrasonic array {} shut down'.format(self._name))
+
+
 def _tryout():
-    GPIO.setmode(GPIO.BCM)
+    gpio = hardware.gpio()
+    gpio.setmode(gpio.BCM)
     sensor = UltrasonicSensor(
         trig_pin=25,
         echo_pin=8,
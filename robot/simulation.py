@@ -0,0 +1,635 @@
+"""Headless simulator running the control code of the robot on a 2D world.
+
+The world is a bitmap of the floor, where the track is drawn, plus a set of
+obstacles. The simulator moves the robot with differential-drive kinematics
+according to the values of the motor pins, drives the line sensor pins from
+the floor under the sensors and answers the pings of the ultrasonic sensors
+with echoes timed from the distance of the nearest obstacle. All of this
+happens on mock pins: gpiozero's MockFactory and robot.mock_gpio in place of
+RPi.GPIO, so that the unmodified LineNavigator, ObstacleBreak and Driver run
+on any Linux machine.
+
+The simulation runs in real time, because the control code does.
+
+Run one of the scenarios with:
+    python -m robot.simulation lap [--duration-s 60] [--proportional]
+    python -m robot.simulation stop [--turbo]
+"""
+import argparse
+import ctypes
+import logging
+import math
+import multiprocessing as mp
+import multiprocessing.util
+import random
+import resource
+import threading
+import time
+
+from gpiozero import Device
+from gpiozero.pins.mock import MockFactory, MockPWMPin
+
+import robot.hardware as hardware
+import robot.mock_gpio as mock_gpio
+
+_logger = logging.getLogger(__name__)
+
+_SPEED_OF_SOUND_mps = 343.26
+
+# Geometry of the buggy, in meters, in the frame of the robot: x forward and
+# y to the left, origin at the center of the wheel axle.
+_WHEEL_BASE_m = 0.12
+_RADIUS_m = 0.09
+_LINE_SENSOR_X_m = 0.06
+_LINE_SENSOR_Y_m = 0.02
+_FRONT_SONAR_X_m = 0.08
+_REAR_SONAR_X_m = -0.08
+
+# The motors reach the commanded speed with this time constant.
+_MOTOR_TIME_CONSTANT_s = 0.05
+
+# Maximum range of the ultrasonic sensors: no echo beyond.
+_SONAR_RANGE_m = 4.0
+
+# Delay between the end of the trigger pulse and the start of the echo. The
+# sensors start waiting for the echo right after the pulse: a shorter delay
+# may start the echo before they wait for it, as the simulator does not run
+# in real time as the hardware does.
+_ECHO_DELAY_s = 2e-3
+
+# The end of the echo is timed by spinning for this long, in seconds.
+_ECHO_SPIN_s = 1e-3
+
+
+class Box:
+    """Axis-aligned rectangular obstacle.
+    """
+
+    def __init__(self, x_min, y_min, x_max, y_max):
+        self.x_min = x_min
+        self.y_min = y_min
+        self.x_max = x_max
+        self.y_max = y_max
+
+    def ray_distance(self, x, y, dx, dy):
+        """Distance along a ray to the box, with the slab method.
+
+        Returns:
+            float: The distance, or None if the ray misses the box.
+        """
+        t_near, t_far = -math.inf, math.inf
+        for origin, direction, low, high in ((x, dx, self.x_min, self.x_max),
+                                             (y, dy, self.y_min, self.y_max)):
+            if direction == 0:
+                if not low <= origin <= high:
+                    return None
+                continue
+
+            t_low = (low - origin) / direction
+            t_high = (high - origin) / direction
+            t_near = max(t_near, min(t_low, t_high))
+            t_far = min(t_far, max(t_low, t_high))
+
+        if t_near > t_far or t_far < 0:
+            return None
+        return max(t_near, 0.)
+
+    def distance(self, x, y):
+        """Distance of a point from the box, 0 if inside.
+        """
+        dx = max(self.x_min - x, 0., x - self.x_max)
+        dy = max(self.y_min - y, 0., y - self.y_max)
+        return math.hypot(dx, dy)
+
+
+class World:
+    """Floor bitmap and obstacles.
+
+    Attributes:
+        width_m (float): Width of the floor, in meters.
+        height_m (float): Height of the floor, in meters.
+        obstacles (list): The :obj:`Box` obstacles. The walls around the
+            floor are added automatically.
+        lap_center (tuple): (x, y) point the track goes around, to count the
+            laps.
+    """
+
+    _WALL_THICKNESS_m = 0.05
+
+    def __init__(self, width_px, height_px, resolution_m, black_pixels,
+                 obstacles=(), lap_center=None):
+        """
+        Args:
+            width_px (int): Width of the bitmap, in pixels.
+            height_px (int): Height of the bitmap, in pixels.
+            resolution_m (float): Size of a pixel, in meters.
+            black_pixels (bytearray): One byte per pixel, row by row from
+                y = 0, non-zero where the floor is black.
+            obstacles (iterable, optional): The :obj:`Box` obstacles.
+            lap_center (tuple, optional): Defaults to the center of the floor.
+        """
+        self._width_px = width_px
+        self._height_px = height_px
+        self._resolution_m = resolution_m
+        self._black_pixels = black_pixels
+        self.width_m = width_px * resolution_m
+        self.height_m = height_px * resolution_m
+
+        wall_m = self._WALL_THICKNESS_m
+        self.obstacles = list(obstacles) + [
+            Box(-wall_m, -wall_m, self.width_m + wall_m, 0.),
+            Box(-wall_m, self.height_m, self.width_m + wall_m,
+                self.height_m + wall_m),
+            Box(-wall_m, 0., 0., self.height_m),
+            Box(self.width_m, 0., self.width_m + wall_m, self.height_m),
+        ]
+
+        self.lap_center = lap_center
+        if lap_center is None:
+            self.lap_center = (self.width_m / 2, self.height_m / 2)
+
+    def is_black(self, x, y):
+        col = int(x / self._resolution_m)
+        row = int(y / self._resolution_m)
+        if not (0 <= col < self._width_px and 0 <= row < self._height_px):
+            return False
+        return bool(self._black_pixels[row * self._width_px + col])
+
+    def ray_distance(self, x, y, heading, max_range_m):
+        """Distance to the nearest obstacle along a ray.
+
+        Returns:
+            float: The distance, or None if nothing is within range.
+        """
+        dx, dy = math.cos(heading), math.sin(heading)
+        distances = [obstacle.ray_distance(x, y, dx, dy)
+                     for obstacle in self.obstacles]
+        distances = [distance for distance in distances
+                     if distance is not None and distance <= max_range_m]
+        return min(distances, default=None)
+
+    def clearance(self, x, y):
+        """Distance from a point to the nearest obstacle.
+        """
+        return min(obstacle.distance(x, y) for obstacle in self.obstacles)
+
+
+def oval_world(line_width_m=0.02, resolution_m=0.005):
+    """Builds a floor with a black oval track: two straights joined by two
+    half circles.
+
+    Returns:
+        tuple: The :obj:`World` and a starting (x, y, heading) pose on the
+            track.
+    """
+    width_m, height_m = 3.0, 2.0
+    radius_m = 0.6
+    straight_m = 1.0
+    center_x, center_y = width_m / 2, height_m / 2
+
+    width_px = int(width_m / resolution_m)
+    height_px = int(height_m / resolution_m)
+    black_pixels = bytearray(width_px * height_px)
+    for row in range(height_px):
+        y = (row + 0.5) * resolution_m - center_y
+        for col in range(width_px):
+            x = (col + 0.5) * resolution_m - center_x
+            # Distance from the center line of the track.
+            nearest_x = min(max(x, -straight_m / 2), straight_m / 2)
+            distance_m = abs(math.hypot(x - nearest_x, y) - radius_m)
+            if distance_m <= line_width_m / 2:
+                black_pixels[row * width_px + col] = 1
+
+    world = World(width_px=width_px,
+                  height_px=height_px,
+                  resolution_m=resolution_m,
+                  black_pixels=black_pixels)
+
+    # On the bottom straight, driving counterclockwise.
+    return world, (center_x, center_y - radius_m, 0.)
+
+
+def wall_world(distance_m=1.0):
+    """Builds an empty white floor with an obstacle right ahead.
+
+    Returns:
+        tuple: The :obj:`World` and a starting (x, y, heading) pose facing
+            the obstacle from the given distance of its bumper.
+    """
+    resolution_m = 0.05
+    width_m, height_m = distance_m + 1.5, 1.0
+    width_px = int(width_m / resolution_m)
+    height_px = int(height_m / resolution_m)
+    obstacle_x_m = distance_m + 0.5 + _RADIUS_m
+    world = World(width_px=width_px,
+                  height_px=height_px,
+                  resolution_m=resolution_m,
+                  black_pixels=bytearray(width_px * height_px),
+                  obstacles=[Box(obstacle_x_m, 0.3, obstacle_x_m + 0.05, 0.7)])
+    return world, (0.5, height_m / 2, 0.)
+
+
+def load_pgm_world(path, resolution_m, obstacles=(), threshold=128):
+    """Builds a floor from a binary (P5) PGM image, where dark pixels are
+    black floor. The first row of the image is at y = 0.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    fields = []
+    idx = 0
+    while len(fields) < 4:
+        while data[idx:idx + 1].isspace():
+            idx += 1
+        if data[idx:idx + 1] == b'#':
+            idx = data.index(b'\n', idx)
+            continue
+        start = idx
+        while not data[idx:idx + 1].isspace():
+            idx += 1
+        fields.append(data[start:idx])
+
+    magic, width_px, height_px, max_value = fields
+    if magic != b'P5' or int(max_value) > 255:
+        raise ValueError('Only 8-bit binary PGM images are supported')
+
+    width_px, height_px = int(width_px), int(height_px)
+    pixels = data[idx + 1:idx + 1 + width_px * height_px]
+    return World(width_px=width_px,
+                 height_px=height_px,
+                 resolution_m=resolution_m,
+                 black_pixels=bytearray(pixel < threshold for pixel in pixels),
+                 obstacles=obstacles)
+
+
+class Simulator:
+    """Moves the simulated robot and drives its sensors.
+
+    The pose lives in shared memory: the ultrasonic sensors are read by the
+    obstacle detection processes, which answer their own pings.
+
+    Attributes:
+        _world (:obj:`World`): The world.
+        _noise_cm (float): Standard deviation of the noise of the distances.
+    """
+
+    # Period of the simulation steps, in seconds.
+    _STEP_s = 2e-3
+
+    def __init__(self, world, pose, noise_cm=0.3, seed=0):
+        self._world = world
+        self._noise_cm = noise_cm
+        self._rng = random.Random(seed)
+
+        # (x, y, heading) of the robot, and the speed of the wheels.
+        self._pose = mp.RawArray(ctypes.c_double, pose)
+        self._wheel_speeds_mps = [0., 0.]
+
+        self._num_collisions = 0
+        self._colliding = False
+        self._distance_m = 0.
+        self._laps = []
+        self._lap_angle = None
+        self._lap_turns = 0.
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='Simulator',
+                                        daemon=True)
+
+        # The devices get mock pins, fresh ones at every run.
+        hardware.use_backend('mock')
+        Device.pin_factory = MockFactory(pin_class=MockPWMPin)
+
+        import robot.components.line_tracking.robotdyn as lts
+        import robot.devices.line_navigator as ln
+        import robot.devices.obstacle_break as ob
+        import robot.motion.driver as dvr
+
+        self._max_speed_mps = dvr.MAX_SPEED_mps
+        self._line_sensor_pull_up = lts.IS_PULL_UP
+        self._line_sensor_pins = (ln.PIN_LEFT_LINE_SENSOR,
+                                  ln.PIN_RIGHT_LINE_SENSOR)
+
+        # (forward pin, backward pin) of each motor, as wired by the Driver.
+        self._motor_pins = ((dvr._LEFT_MOTOR_NEG_PIN, dvr._LEFT_MOTOR_POS_PIN),
+                            (dvr._RIGHT_MOTOR_POS_PIN,
+                             dvr._RIGHT_MOTOR_NEG_PIN))
+
+        # Maps the TRIG pin of each ultrasonic sensor to its ECHO pin and to
+        # its (x offset, heading offset) on the robot.
+        self._sonars = {
+            ob._ULTRASONIC_SENSOR_FRONT_TRIG_PIN:
+                (ob._ULTRASONIC_SENSOR_FRONT_ECHO_PIN, _FRONT_SONAR_X_m, 0.),
+            ob._ULTRASONIC_SENSOR_REAR_TRIG_PIN:
+                (ob._ULTRASONIC_SENSOR_REAR_ECHO_PIN, _REAR_SONAR_X_m,
+                 math.pi),
+        }
+        mock_gpio.add_output_callback(self._on_gpio_output)
+        multiprocessing.util.register_after_fork(self, Simulator._after_fork)
+
+        self._update_line_sensors()
+
+    def _after_fork(self):
+        # Echoes in flight in the parent when forking never end in the child.
+        for echo_pin, _, _ in self._sonars.values():
+            mock_gpio.set_input(echo_pin, False)
+
+    @property
+    def pose(self):
+        """tuple: Current (x, y, heading) of the robot, in meters and
+        radians.
+        """
+        return self._pose[0], self._pose[1], self._pose[2]
+
+    def _to_world(self, x_m, y_m):
+        x, y, heading = self.pose
+        cos, sin = math.cos(heading), math.sin(heading)
+        return x + x_m * cos - y_m * sin, y + x_m * sin + y_m * cos
+
+    def _on_gpio_output(self, pin, level):
+        """Answers the ping of an ultrasonic sensor at the falling edge of its
+        trigger pulse. Runs in the process reading the sensor.
+        """
+        sonar = self._sonars.get(pin)
+        if sonar is None or level:
+            return
+
+        echo_pin, x_m, heading_offset = sonar
+        x, y = self._to_world(x_m, 0.)
+        distance_m = self._world.ray_distance(x, y,
+                                              self._pose[2] + heading_offset,
+                                              _SONAR_RANGE_m)
+        if distance_m is None:
+            # Nothing in range: no echo.
+            return
+
+        distance_m += self._rng.gauss(0., self._noise_cm) / 100
+        threading.Thread(target=self._echo,
+                         args=(echo_pin, 2 * distance_m / _SPEED_OF_SOUND_mps),
+                         daemon=True).start()
+
+    @staticmethod
+    def _echo(echo_pin, duration_s):
+        time.sleep(_ECHO_DELAY_s)
+        mock_gpio.set_input(echo_pin, True)
+
+        # Sleeping overshoots by a fraction of a millisecond, that is several
+        # centimeters: sleep for most of the echo, then spin.
+        end_s = time.perf_counter() + duration_s
+        time.sleep(max(duration_s - _ECHO_SPIN_s, 0.))
+        while time.perf_counter() < end_s:
+            pass
+        mock_gpio.set_input(echo_pin, False)
+
+    def _update_line_sensors(self):
+        for pin, y_m in zip(self._line_sensor_pins,
+                            (_LINE_SENSOR_Y_m, -_LINE_SENSOR_Y_m)):
+            # The output of the sensors is high over black floor.
+            high = self._world.is_black(*self._to_world(_LINE_SENSOR_X_m, y_m))
+            mock_pin = Device.pin_factory.pin(pin)
+            if high:
+                mock_pin.drive_high()
+            else:
+                mock_pin.drive_low()
+
+    def _motor_values(self):
+        values = []
+        for forward_pin, backward_pin in self._motor_pins:
+            values.append(Device.pin_factory.pin(forward_pin).state
+                          - Device.pin_factory.pin(backward_pin).state)
+        return values
+
+    def _step(self, dt_s):
+        # First-order response of the motors to the PWM values.
+        gain = 1 - math.exp(-dt_s / _MOTOR_TIME_CONSTANT_s)
+        for idx, value in enumerate(self._motor_values()):
+            target_mps = value * self._max_speed_mps
+            self._wheel_speeds_mps[idx] += \
+                gain * (target_mps - self._wheel_speeds_mps[idx])
+
+        left_mps, right_mps = self._wheel_speeds_mps
+        speed_mps = (left_mps + right_mps) / 2
+        turn_radps = (right_mps - left_mps) / _WHEEL_BASE_m
+
+        x, y, heading = self.pose
+        heading += turn_radps * dt_s
+        new_x = x + speed_mps * math.cos(heading) * dt_s
+        new_y = y + speed_mps * math.sin(heading) * dt_s
+
+        if self._world.clearance(new_x, new_y) < _RADIUS_m:
+            # Bumped into an obstacle: the robot does not move forward.
+            if not self._colliding:
+                self._num_collisions += 1
+                _logger.warning('Collision at ({:.2f}, {:.2f})'.format(x, y))
+            self._colliding = True
+            self._wheel_speeds_mps = [0., 0.]
+            new_x, new_y = x, y
+        else:
+            self._colliding = False
+
+        self._distance_m += math.hypot(new_x - x, new_y - y)
+        self._pose[0], self._pose[1], self._pose[2] = new_x, new_y, heading
+        self._count_laps()
+        self._update_line_sensors()
+
+    def _count_laps(self):
+        x, y, _ = self.pose
+        center_x, center_y = self._world.lap_center
+        angle = math.atan2(y - center_y, x - center_x)
+        if self._lap_angle is not None:
+            delta = (angle - self._lap_angle + math.pi) % (2 * math.pi) \
+                - math.pi
+            self._lap_turns += delta / (2 * math.pi)
+            if abs(self._lap_turns) >= len(self._laps) + 1:
+                self._laps.append(time.monotonic())
+        self._lap_angle = angle
+
+    def _run(self):
+        last_s = time.monotonic()
+        while not self._stop_event.wait(self._STEP_s):
+            now_s = time.monotonic()
+            self._step(now_s - last_s)
+            last_s = now_s
+
+    def start(self):
+        self._start_s = time.monotonic()
+        self._thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        mock_gpio.remove_output_callback(self._on_gpio_output)
+
+    @property
+    def wheel_speeds_mps(self):
+        """tuple: Current (left, right) ground speed of the wheels, in m/s.
+        """
+        return tuple(self._wheel_speeds_mps)
+
+    @property
+    def stats(self):
+        """dict: Distance travelled, in meters, number of collisions, and
+        times of the completed laps, in seconds.
+        """
+        lap_times_s = []
+        last_s = self._start_s
+        for lap_s in self._laps:
+            lap_times_s.append(lap_s - last_s)
+            last_s = lap_s
+
+        return {
+            'distance_m': self._distance_m,
+            'num_collisions': self._num_collisions,
+            'lap_times_s': lap_times_s,
+        }
+
+    def front_gap_m(self):
+        """float: Distance from the front bumper to the nearest obstacle
+        straight ahead, or None if nothing is within range.
+        """
+        x, y = self._to_world(_RADIUS_m, 0.)
+        return self._world.ray_distance(x, y, self._pose[2], _SONAR_RANGE_m)
+
+
+def _cpu_s():
+    return sum(resource.getrusage(who).ru_utime
+               + resource.getrusage(who).ru_stime
+               for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+
+def _print_results(simulator, elapsed_s, cpu_s):
+    stats = simulator.stats
+    print('Simulated {:.1f} s, travelled {:.2f} m, {} collisions'.format(
+        elapsed_s, stats['distance_m'], stats['num_collisions']))
+    print('CPU use: {:.1f}% of a core, simulator included'.format(
+        100 * cpu_s / elapsed_s))
+    if stats['lap_times_s']:
+        print('Lap times: {}'.format(', '.join(
+            '{:.2f} s'.format(lap_s) for lap_s in stats['lap_times_s'])))
+
+
+def run_lap(duration_s, distance_m=0.1, proportional=False):
+    """Follows the oval track with the LineNavigator and the ObstacleBreak.
+    """
+    world, pose = oval_world()
+    simulator = Simulator(world=world, pose=pose)
+
+    import robot.devices.led_status as ls
+    import robot.devices.line_navigator as ln
+    import robot.devices.obstacle_break as ob
+    import robot.motion.driver as dvr
+
+    driver = dvr.Driver()
+    obstacle_break = ob.ObstacleBreak(driver=driver, distance_m=distance_m)
+    status_led = ls.StatusLed()
+    line_navigator = ln.LineNavigator(driver=driver,
+                                      status_led=status_led,
+                                      black_track=True,
+                                      event_driven=not proportional,
+                                      proportional=proportional)
+    navigator_thread = threading.Thread(target=line_navigator.run,
+                                        name='LineNavigator',
+                                        daemon=True)
+
+    cpu_start_s = _cpu_s()
+    start_s = time.monotonic()
+    simulator.start()
+    obstacle_break.run()
+    navigator_thread.start()
+    try:
+        time.sleep(duration_s)
+    finally:
+        line_navigator.close()
+        navigator_thread.join()
+        status_led.close()
+        obstacle_break.close()
+        driver.close()
+        simulator.close()
+
+    _print_results(simulator=simulator,
+                   elapsed_s=time.monotonic() - start_s,
+                   cpu_s=_cpu_s() - cpu_start_s)
+
+
+def run_stop(turbo=False, distance_m=0.1, time_to_collision_s=None,
+             adaptive_sampling=False):
+    """Drives straight into an obstacle, relying on the ObstacleBreak to stop.
+    """
+    world, pose = wall_world()
+    simulator = Simulator(world=world, pose=pose)
+
+    import robot.devices.obstacle_break as ob
+    import robot.motion.driver as dvr
+
+    driver = dvr.Driver()
+    obstacle_break = ob.ObstacleBreak(driver=driver,
+                                      distance_m=distance_m,
+                                      time_to_collision_s=time_to_collision_s,
+                                      adaptive_sampling=adaptive_sampling)
+
+    cpu_start_s = _cpu_s()
+    start_s = time.monotonic()
+    simulator.start()
+    obstacle_break.run()
+    try:
+        driver.set_commands({dvr.COMMAND_FORWARD: True,
+                             dvr.COMMAND_TURBO: turbo})
+
+        # Wait until the robot comes to a halt.
+        time.sleep(0.5)
+        while max(abs(speed_mps)
+                  for speed_mps in simulator.wheel_speeds_mps) > 1e-3:
+            time.sleep(0.05)
+    finally:
+        gap_m = simulator.front_gap_m()
+        driver.stop()
+        obstacle_break.close()
+        driver.close()
+        simulator.close()
+
+    _print_results(simulator=simulator,
+                   elapsed_s=time.monotonic() - start_s,
+                   cpu_s=_cpu_s() - cpu_start_s)
+    print('Stopped {:.1f} cm from the obstacle, threshold {:.1f} cm'.format(
+        100 * gap_m, 100 * distance_m))
+
+
+def _main():
+    parser = argparse.ArgumentParser(
+        description='Run the control code of the robot in a simulated world.')
+    parser.add_argument('scenario',
+                        choices=['lap', 'stop'],
+                        help='Follow the line on an oval track (lap) or drive '
+                             'into an obstacle (stop).')
+    parser.add_argument('--duration-s',
+                        type=float,
+                        default=30.,
+                        help='Duration of the lap scenario, in seconds.')
+    parser.add_argument('--proportional',
+                        action='store_true',
+                        help='Steer proportionally in the lap scenario.')
+    parser.add_argument('--turbo',
+                        action='store_true',
+                        help='Drive at turbo speed in the stop scenario.')
+    parser.add_argument('--time-to-collision-s',
+                        type=float,
+                        help='Enable predictive braking in the stop scenario.')
+    parser.add_argument('--adaptive-sampling',
+                        action='store_true',
+                        help='Adapt the sampling rate of the distance sensors '
+                             'to the motion in the stop scenario.')
+    args = parser.parse_args()
+
+    if args.scenario == 'lap':
+        run_lap(duration_s=args.duration_s, proportional=args.proportional)
+    else:
+        run_stop(turbo=args.turbo,
+                 time_to_collision_s=args.time_to_collision_s,
+                 adaptive_sampling=args.adaptive_sampling)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    _main()
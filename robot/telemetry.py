@@ -0,0 +1,522 @@
+"""Telemetry stream from the robot to the remote.
+
+The robot periodically samples its state (commands, safety flags, motor
+values, line state and distances) and sends it to the remote in fixed-layout
+binary frames, on a port separate from the control traffic.
+
+A frame is sent only if some field changed since the previous one, and at
+most at the configured rate, so that telemetry never competes with the
+commands. A full frame is also sent every _KEYFRAME_INTERVAL_s even if
+nothing changed, so that a remote started later gets the state anyway.
+
+Frame layout (little endian, 25 bytes):
+    magic       uint8   Always _MAGIC.
+    version     uint8   Telemetry version.
+    changed     uint8   Bitmask of the CHANGED_* fields which changed since
+                        the previous frame.
+    robot_id    uint8   Id of the robot in its fleet, or NO_ROBOT_ID.
+    sequence    uint32  Incremented by the robot at every frame.
+    time_ms     uint32  Time of the sample since the publisher started, in ms.
+    acked       uint32  Sequence number of the latest state change received
+                        from the remote, acknowledging it.
+    commands    uint8   Bitmask of the driver commands.
+    safety      uint8   Bitmask of the safety flags.
+    line_state  uint8   Value of the line navigator state, or UNKNOWN_LINE.
+    left        int8    Left motor value, in percent.
+    right       int8    Right motor value, in percent.
+    front_cm    uint16  Front distance, in cm, or UNKNOWN_DISTANCE.
+    rear_cm     uint16  Rear distance, in cm, or UNKNOWN_DISTANCE.
+
+The publisher does not need to know the remote in advance: it sends to
+whoever the robot is receiving the commands from. In line-tracking mode,
+where no remote drives the robot, it sends to the host given at start-up.
+When a remote drives a fleet, the display shows a line per robot.
+"""
+import collections
+import logging
+import math
+import select
+import struct
+import sys
+import threading
+import time
+
+import robot.network as network
+
+_logger = logging.getLogger(__name__)
+
+VERSION = 2
+
+_MAGIC = 0xC7
+_FRAME = struct.Struct('<BBBBIIIBBBbbHH')
+
+FRAME_SIZE = _FRAME.size
+
+_UINT32_MODULO = 1 << 32
+
+UNKNOWN_LINE = 0xFF
+UNKNOWN_DISTANCE = 0xFFFF
+NO_ROBOT_ID = 0
+
+# Offset of the robot id in a frame, to tell the robots apart without
+# decoding the frames.
+_ROBOT_ID_OFFSET = 3
+
+# Bits of the "changed" bitmask.
+CHANGED_COMMANDS = 1 << 0
+CHANGED_SAFETY = 1 << 1
+CHANGED_LINE_STATE = 1 << 2
+CHANGED_MOTORS = 1 << 3
+CHANGED_DISTANCES = 1 << 4
+CHANGED_ACKED = 1 << 5
+
+_ALL_CHANGED = CHANGED_COMMANDS | CHANGED_SAFETY | CHANGED_LINE_STATE \
+    | CHANGED_MOTORS | CHANGED_DISTANCES | CHANGED_ACKED
+
+# Slices of the sampled fields covered by each "changed" bit: the
+# acknowledged sequence number, then the fields following it.
+_FIELD_GROUPS = [
+    (CHANGED_ACKED, slice(0, 1)),
+    (CHANGED_COMMANDS, slice(1, 2)),
+    (CHANGED_SAFETY, slice(2, 3)),
+    (CHANGED_LINE_STATE, slice(3, 4)),
+    (CHANGED_MOTORS, slice(4, 6)),
+    (CHANGED_DISTANCES, slice(6, 8)),
+]
+
+# Names of the values of LineNavigator._State, which the remote cannot import.
+_LINE_STATE_NAMES = {
+    0: 'LEFT',
+    1: 'RIGHT',
+    2: 'BOTH',
+    3: 'NONE',
+    UNKNOWN_LINE: '-',
+}
+
+# Command and safety bits, in display order.
+_COMMAND_NAMES = [(1 << 0, 'F'), (1 << 1, 'B'), (1 << 2, 'L'),
+                  (1 << 3, 'R'), (1 << 4, 'T')]
+_SAFETY_NAMES = [(1 << 0, 'S'), (1 << 1, 'F'), (1 << 2, 'B'),
+                 (1 << 3, 'f'), (1 << 4, 'b')]
+
+Telemetry = collections.namedtuple('Telemetry',
+                                   ['changed',
+                                    'robot_id',
+                                    'sequence',
+                                    'time_ms',
+                                    'acked',
+                                    'commands',
+                                    'safety',
+                                    'line_state',
+                                    'left',
+                                    'right',
+                                    'front_cm',
+                                    'rear_cm'])
+
+
+def encode(telemetry):
+    """Packs a telemetry frame into bytes.
+
+    Args:
+        telemetry (:obj:`Telemetry`): The frame to pack.
+
+    Returns:
+        bytes: The packed frame.
+    """
+    return _FRAME.pack(_MAGIC,
+                       VERSION,
+                       telemetry.changed,
+                       telemetry.robot_id,
+                       telemetry.sequence % _UINT32_MODULO,
+                       telemetry.time_ms % _UINT32_MODULO,
+                       telemetry.acked % _UINT32_MODULO,
+                       telemetry.commands,
+                       telemetry.safety,
+                       telemetry.line_state,
+                       telemetry.left,
+                       telemetry.right,
+                       telemetry.front_cm,
+                       telemetry.rear_cm)
+
+
+def decode(data):
+    """Unpacks a telemetry frame.
+
+    Args:
+        data (bytes): The received data.
+
+    Returns:
+        :obj:`Telemetry`: The unpacked frame, or None if the data is not a
+            valid frame of this version.
+    """
+    if len(data) != FRAME_SIZE:
+        return None
+
+    magic, version, *fields = _FRAME.unpack(data)
+    if magic != _MAGIC or version != VERSION:
+        return None
+
+    return Telemetry(*fields)
+
+
+def _distance_to_field(distance_cm):
+    if math.isnan(distance_cm):
+        return UNKNOWN_DISTANCE
+    return min(int(round(distance_cm)), UNKNOWN_DISTANCE - 1)
+
+
+def _motor_to_field(value):
+    return int(round(100 * value))
+
+
+class TelemetryPublisher:
+    """Samples the state of the robot and sends it to the remote.
+
+    The publisher runs as a task of an asyncio event loop, usually the one of
+    the RemoteReceiver, through serve(), or in a dedicated thread, through
+    start(), when no event loop runs, like in line-tracking mode.
+
+    Attributes:
+        _driver (:obj:`Driver`): Driver of the motors.
+        _remote_ip (callable): Returns the IP address of the remote, or None
+            while unknown.
+        _line_navigator (:obj:`LineNavigator`, optional): Navigator whose
+            state to publish.
+        _obstacle_break (:obj:`ObstacleBreak`, optional): Obstacle break
+            whose distances to publish.
+        _robot_id (int): Id of the robot in its fleet, or NO_ROBOT_ID.
+        _acked_sequence (callable, optional): Returns the sequence number of
+            the latest state change received from the remote.
+    """
+
+    _DEFAULT_RATE_HZ = 10.
+
+    # A frame is sent at least this often, even if nothing changed.
+    _KEYFRAME_INTERVAL_s = 1.
+
+    def __init__(self,
+                 driver,
+                 remote_ip,
+                 line_navigator=None,
+                 obstacle_break=None,
+                 rate_hz=_DEFAULT_RATE_HZ,
+                 robot_id=NO_ROBOT_ID,
+                 acked_sequence=None):
+        if rate_hz <= 0:
+            raise ValueError('Rate must be positive. '
+                             'Provided is {}'.format(rate_hz))
+
+        self._driver = driver
+        self._remote_ip = remote_ip
+        self._line_navigator = line_navigator
+        self._obstacle_break = obstacle_break
+        self._interval_s = 1 / rate_hz
+        self._robot_id = robot_id
+        self._acked_sequence = acked_sequence
+
+        # Client to the current remote, replaced if the remote changes.
+        self._client = None
+        self._client_ip = None
+
+        self._start_s = time.monotonic()
+        self._sequence = 0
+        self._last_fields = None
+        self._last_send_s = None
+        self._num_sent = 0
+        self._num_dropped = 0
+
+        # Set by start().
+        self._stop_event = None
+        self._thread = None
+
+        _logger.debug('{} initialized'.format(self.__class__.__name__))
+
+    def _sample(self):
+        """Returns the current fields of the frame, from the acknowledged
+        sequence number on.
+        """
+        acked = 0
+        if self._acked_sequence is not None:
+            acked = self._acked_sequence()
+
+        line_state = UNKNOWN_LINE
+        if self._line_navigator is not None:
+            line_state = self._line_navigator.state.value
+
+        front_cm = rear_cm = UNKNOWN_DISTANCE
+        if self._obstacle_break is not None:
+            front_cm, rear_cm = (_distance_to_field(distance_cm)
+                                 for distance_cm in
+                                 self._obstacle_break.distances_cm)
+
+        left, right = self._driver.motor_values
+        return (acked,
+                self._driver.command_mask,
+                self._driver.safety_flags.mask,
+                line_state,
+                _motor_to_field(left),
+                _motor_to_field(right),
+                front_cm,
+                rear_cm)
+
+    def _changed(self, fields):
+        if self._last_fields is None:
+            return _ALL_CHANGED
+
+        changed = 0
+        for bit, group in _FIELD_GROUPS:
+            if fields[group] != self._last_fields[group]:
+                changed |= bit
+        return changed
+
+    def _send(self, data):
+        remote_ip = self._remote_ip()
+        if remote_ip is None:
+            return False
+
+        if remote_ip != self._client_ip:
+            if self._client is not None:
+                self._client.close()
+            self._client = network.UDPClient(ip=remote_ip,
+                                             port=network.TELEMETRY_PORT)
+            # Never block the event loop: better drop a frame.
+            self._client.socket.setblocking(False)
+            self._client_ip = remote_ip
+            _logger.info('Sending telemetry to {}'.format(remote_ip))
+
+        try:
+            sent = self._client.send(data)
+        except OSError:
+            # Full buffer or unreachable remote: the next frame will do.
+            sent = False
+
+        if not sent:
+            # Including while the remote cannot be resolved yet.
+            self._num_dropped += 1
+        return sent
+
+    def publish(self):
+        """Samples the state and sends a frame, if anything changed or the
+        keyframe is due.
+        """
+        now_s = time.monotonic()
+        fields = self._sample()
+        changed = self._changed(fields)
+        if not changed and self._last_send_s is not None \
+                and now_s - self._last_send_s < self._KEYFRAME_INTERVAL_s:
+            return
+
+        self._sequence += 1
+        data = encode(Telemetry(
+            changed,
+            self._robot_id,
+            self._sequence,
+            int(1000 * (now_s - self._start_s)),
+            *fields))
+        if self._send(data):
+            self._last_fields = fields
+            self._last_send_s = now_s
+            self._num_sent += 1
+
+    async def serve(self):
+        """Publishes at the configured rate until cancelled.
+        """
+        # Imported here, as the display on remote's side does not need it.
+        import asyncio
+
+        _logger.debug('{} started'.format(self.__class__.__name__))
+        try:
+            while True:
+                self.publish()
+                await asyncio.sleep(self._interval_s)
+        finally:
+            self.close()
+
+    def _run(self):
+        _logger.debug('{} started'.format(self.__class__.__name__))
+        while True:
+            self.publish()
+            if self._stop_event.wait(self._interval_s):
+                return
+
+    def start(self):
+        """Publishes at the configured rate from a dedicated thread, until
+        close() is called.
+        """
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='TelemetryPublisher',
+                                        daemon=True)
+        self._thread.start()
+
+    def close(self):
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+            self._client_ip = None
+        _logger.debug('{} stopped, sent {} frames, dropped {}'.format(
+            self.__class__.__name__, self._num_sent, self._num_dropped))
+
+
+def format_telemetry(telemetry):
+    """Formats a telemetry frame into a single line of text.
+
+    Args:
+        telemetry (:obj:`Telemetry`): The frame to format.
+
+    Returns:
+        str: The line.
+    """
+    def _bits(mask, names):
+        return ''.join(name if mask & bit else '.' for bit, name in names)
+
+    def _distance(distance_cm):
+        if distance_cm == UNKNOWN_DISTANCE:
+            return '  ---'
+        return '{:5d}'.format(distance_cm)
+
+    prefix = ''
+    if telemetry.robot_id != NO_ROBOT_ID:
+        prefix = 'robot {:3d} | ack {:10d} | '.format(telemetry.robot_id,
+                                                      telemetry.acked)
+    return prefix + 'cmd {} | safety {} | line {:<5} | ' \
+        'motors {:+4d}% {:+4d}% | front {} cm | rear {} cm'.format(
+               _bits(telemetry.commands, _COMMAND_NAMES),
+               _bits(telemetry.safety, _SAFETY_NAMES),
+               _LINE_STATE_NAMES.get(telemetry.line_state, '?'),
+               telemetry.left,
+               telemetry.right,
+               _distance(telemetry.front_cm),
+               _distance(telemetry.rear_cm))
+
+
+class _RobotView:
+    """State of the display of a single robot.
+    """
+
+    def __init__(self):
+        self.sequence = None
+        self.num_stale_frames = 0
+        self.line = ''
+
+
+class TelemetryDisplay:
+    """Receives the telemetry on remote's side and shows it, in a dedicated
+    thread, on a terminal line per robot.
+
+    Only the newest frame of each robot in a burst is decoded, and the lines
+    are redrawn only if the state changed.
+    """
+
+    # How often to check whether the display must stop, in seconds.
+    _POLL_INTERVAL_s = 0.2
+
+    # After this many consecutive stale frames, the robot is assumed to have
+    # restarted its sequence.
+    _MAX_STALE_FRAMES = 3
+
+    def __init__(self, output=sys.stdout):
+        self._output = output
+        self._server = network.UDPServer(ip='', port=network.TELEMETRY_PORT)
+        self._server.socket.setblocking(False)
+
+        self._robots = {}
+        self._num_lines = 0
+        self._num_frames = 0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='TelemetryDisplay',
+                                        daemon=True)
+
+    def _show(self, data):
+        """Updates the line of the robot which sent the frame.
+
+        Returns:
+            bool: True if the line changed.
+        """
+        telemetry = decode(data)
+        if telemetry is None:
+            return False
+
+        robot = self._robots.get(telemetry.robot_id)
+        if robot is None:
+            robot = _RobotView()
+            self._robots[telemetry.robot_id] = robot
+
+        difference = None
+        if robot.sequence is not None:
+            difference = (telemetry.sequence - robot.sequence) \
+                % _UINT32_MODULO
+            if not 0 < difference < _UINT32_MODULO // 2:
+                robot.num_stale_frames += 1
+                if robot.num_stale_frames <= self._MAX_STALE_FRAMES:
+                    return False
+                difference = None
+
+        # Unless the previous frame was received, its changes are unknown.
+        redraw = difference != 1 or telemetry.changed
+        robot.sequence = telemetry.sequence
+        robot.num_stale_frames = 0
+        self._num_frames += 1
+        if redraw:
+            robot.line = format_telemetry(telemetry)
+        return bool(redraw)
+
+    def _draw(self):
+        lines = [self._robots[robot_id].line
+                 for robot_id in sorted(self._robots)]
+        if len(lines) == 1:
+            self._output.write('\r' + lines[0])
+        else:
+            # Back to the first line, then rewrite all of them, clearing
+            # what is left of the previous content.
+            if self._num_lines > 1:
+                self._output.write('\x1b[{}A'.format(self._num_lines - 1))
+            self._output.write('\r' + '\n'.join('\x1b[K' + line
+                                                 for line in lines))
+        self._num_lines = len(lines)
+        self._output.flush()
+
+    def _show_batch(self, datagrams):
+        # Newest first, skipping the older frames of the robots already seen.
+        seen = set()
+        redraw = False
+        for data in reversed(datagrams):
+            if len(data) <= _ROBOT_ID_OFFSET:
+                continue
+            robot_id = data[_ROBOT_ID_OFFSET]
+            if robot_id in seen:
+                continue
+            seen.add(robot_id)
+            redraw = self._show(data) or redraw
+
+        if redraw:
+            self._draw()
+
+    def _run(self):
+        socket = self._server.socket
+        while not self._stop_event.is_set():
+            readable, _, _ = select.select([socket], [], [],
+                                           self._POLL_INTERVAL_s)
+            if not readable:
+                continue
+
+            datagrams = self._server.receive_batch(block=False)
+            if datagrams:
+                self._show_batch(datagrams)
+
+    def start(self):
+        self._thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._server.close()
+        _logger.debug('{} stopped, received {} frames'.format(
+            self.__class__.__name__, self._num_frames))
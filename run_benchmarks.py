@@ -0,0 +1,101 @@
+import argparse
+import json
+import logging
+import os
+import sys
+
+import robot.benchmarks as benchmarks
+
+# Baseline committed next to this script, measured on the development machine.
+_DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'benchmark_baseline.json')
+
+logging.basicConfig(level=logging.WARNING,
+                    style='{',
+                    format='[{processName}][{name}][{levelname}] {message}')
+
+
+def _format(name, stats):
+    line = '{:<24} n={:<6} p50={:9.1f} us  p99={:9.1f} us  max={:9.1f} us  ' \
+           'cpu={:6.3f} s'.format(name,
+                                  stats['n'],
+                                  1e6 * stats['p50_s'],
+                                  1e6 * stats['p99_s'],
+                                  1e6 * stats['max_s'],
+                                  stats['cpu_s'])
+    if 'calls_per_s' in stats:
+        line += '  {:.0f} calls/s'.format(stats['calls_per_s'])
+    if 'pings_per_s' in stats:
+        line += '  pings/s ' + ' '.join(
+            '{}={:.1f}'.format(state, pings_per_s)
+            for state, pings_per_s in stats['pings_per_s'].items())
+    if 'close_p50_s' in stats:
+        line += '  close p50={:.1f} ms'.format(1e3 * stats['close_p50_s'])
+    if 'hardware_modules' in stats:
+        line += '  hardware modules: {}'.format(
+            ', '.join(stats['hardware_modules']) or 'none')
+    if 'unicast_p50_s' in stats:
+        line += '  unicast p50={:.1f} us  foreign writes={}'.format(
+            1e6 * stats['unicast_p50_s'], stats['foreign_writes'])
+    return line
+
+
+def _main():
+    parser = argparse.ArgumentParser(
+        description='Measure the latency of the control loops on mock pins '
+                    'and compare it with a baseline.')
+    parser.add_argument('names',
+                        nargs='*',
+                        help='Benchmarks to run, among {}. All of them if '
+                             'not set.'.format(
+                                 ', '.join(benchmarks.BENCHMARKS)))
+    parser.add_argument('-b', '--baseline',
+                        default=_DEFAULT_BASELINE,
+                        help='Baseline file (default: the one next to this '
+                             'script).')
+    parser.add_argument('-u', '--update-baseline',
+                        action='store_true',
+                        help='If set, store the results in the baseline '
+                             'instead of comparing them, creating the file '
+                             'if needed.')
+    parser.add_argument('-t', '--tolerance',
+                        type=float,
+                        default=0.5,
+                        help='Allowed relative regression with respect to '
+                             'the baseline (default: %(default)s).')
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in benchmarks.BENCHMARKS:
+            parser.error('Unknown benchmark: {}'.format(name))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    elif not args.update_baseline:
+        parser.error('No baseline at {}: run with --update-baseline to '
+                     'create it'.format(args.baseline))
+
+    results = {}
+    for name in args.names or benchmarks.BENCHMARKS:
+        results[name] = benchmarks.BENCHMARKS[name]()
+        print(_format(name, results[name]))
+
+    if args.update_baseline:
+        # The benchmarks which did not run keep their baseline.
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('Baseline saved to {}'.format(args.baseline))
+        return
+
+    regressions = benchmarks.compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print('REGRESSION {}'.format(regression))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    _main()
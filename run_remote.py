@@ -1,6 +1,8 @@
+import argparse
 import logging
 
 import robot.devices.remote.remote_sender as rs
+import robot.network as network
 
 logging.basicConfig(level=logging.DEBUG,
                     style='{',
@@ -8,7 +10,46 @@ logging.basicConfig(level=logging.DEBUG,
 
 
 def _main():
-    rs.RemoteSender().run()
+    parser = argparse.ArgumentParser(description='Start the remote.')
+    parser.add_argument('--heartbeat-hz',
+                        type=float,
+                        default=10.,
+                        help='Rate at which the state of the controls is '
+                             're-sent when it does not change.')
+    parser.add_argument('-t',
+                        '--telemetry',
+                        action='store_true',
+                        help='If set, shows the telemetry sent by the robot.')
+    parser.add_argument('-r',
+                        '--robot',
+                        metavar='HOST[:PORT]',
+                        default='{}:{}'.format(network.RASPBERRYPI_HOSTNAME,
+                                               network.PORT),
+                        help='Address of the robot (default: %(default)s). '
+                             'In fleet mode, only the port is used.')
+    parser.add_argument('-f',
+                        '--fleet',
+                        action='store_true',
+                        help='If set, controls a fleet of robots over '
+                             'multicast.')
+    parser.add_argument('--interface',
+                        metavar='IP',
+                        help='In fleet mode, IP address of the network '
+                             'interface to send from.')
+    args = parser.parse_args()
+
+    try:
+        ip, port = network.parse_address(args.robot,
+                                         default_port=network.PORT)
+    except ValueError as e:
+        parser.error(str(e))
+
+    rs.RemoteSender(heartbeat_hz=args.heartbeat_hz,
+                    show_telemetry=args.telemetry,
+                    ip=ip,
+                    port=port,
+                    fleet=args.fleet,
+                    interface_ip=args.interface).run()
 
 
 if __name__ == '__main__':
@@ -1,6 +1,8 @@
 import argparse
 import logging
 
+import robot.motion.driver
+import robot.network
 import robot.robot
 
 logging.basicConfig(level=logging.DEBUG,
@@ -15,13 +17,115 @@ def _main():
                         '--auto',
                         action='store_true',
                         help='If set, starts the robot in line-tracking mode.')
+    parser.add_argument('-r',
+                        '--record',
+                        metavar='PATH',
+                        help='If set, records sensors and commands to this '
+                             'file, for later replay.')
+    parser.add_argument('-i',
+                        '--instrument',
+                        metavar='TARGET',
+                        help='If set, measures the control loops and '
+                             'periodically dumps the statistics to this file, '
+                             'or to this local UDP port if in the form '
+                             'udp:PORT.')
+    parser.add_argument('--realtime',
+                        action='store_true',
+                        help='If set, pins the control loops to CPU cores '
+                             'with real-time priority. Requires root '
+                             'privileges.')
+    parser.add_argument('--robot-id',
+                        type=int,
+                        help='If set, the robot joins the fleet controlled '
+                             'by a remote in fleet mode, with this id '
+                             '(1-255).')
+    parser.add_argument('-g',
+                        '--group',
+                        type=int,
+                        action='append',
+                        default=[],
+                        help='Group (1-8) of the robot in the fleet. Can be '
+                             'repeated.')
+    parser.add_argument('-l',
+                        '--listen',
+                        metavar='HOST[:PORT]',
+                        default=':{}'.format(robot.network.PORT),
+                        help='Interface and port to receive the commands '
+                             'on. All the interfaces if HOST is empty '
+                             '(default: %(default)s).')
+    parser.add_argument('-t',
+                        '--telemetry',
+                        metavar='HOST',
+                        help='In line-tracking mode, sends the telemetry to '
+                             'the remote on this host.')
+    parser.add_argument('--max-speed',
+                        metavar='MPS',
+                        type=float,
+                        default=robot.motion.driver.MAX_SPEED_mps,
+                        help='Ground speed of the buggy with the motors at '
+                             'full power, in m/s, to predict collisions. '
+                             'Calibrate it by timing the buggy over a known '
+                             'distance (default: %(default)s).')
+    parser.add_argument('--time-to-collision',
+                        metavar='S',
+                        type=float,
+                        default=robot.robot.DEFAULT_TIME_TO_COLLISION_s,
+                        help='Stops the motion towards an obstacle which '
+                             'would be reached within this time, in seconds. '
+                             '0 disables it (default: %(default)s).')
+    steering = parser.add_mutually_exclusive_group()
+    steering.add_argument('-e',
+                          '--event-driven',
+                          action='store_true',
+                          help='In line-tracking mode, reacts to the events '
+                               'of the line sensors instead of polling them.')
+    steering.add_argument('-p',
+                          '--proportional',
+                          action='store_true',
+                          help='In line-tracking mode, steers continuously '
+                               'instead of stopping to turn.')
     args = parser.parse_args()
 
+    if args.max_speed <= 0:
+        parser.error('Maximum speed must be positive')
+
+    # The predictive stop is off if 0.
+    time_to_collision_s = args.time_to_collision or None
+
+    try:
+        listen_ip, listen_port = robot.network.parse_address(
+            args.listen, default_port=robot.network.PORT)
+    except ValueError as e:
+        parser.error(str(e))
+
+    groups = 0
+    for group in args.group:
+        if not 1 <= group <= 8:
+            parser.error('Groups go from 1 to 8. Provided is {}'.format(group))
+        groups |= 1 << (group - 1)
+
     if args.auto:
-        robot.robot.run(autopilot=True)
+        robot.robot.run(autopilot=True,
+                        record_path=args.record,
+                        instrument_target=args.instrument,
+                        realtime=args.realtime,
+                        telemetry_ip=args.telemetry,
+                        max_speed_mps=args.max_speed,
+                        time_to_collision_s=time_to_collision_s,
+                        event_driven=args.event_driven,
+                        proportional=args.proportional)
 
     else:
-        robot.robot.run(autopilot=False)
+        robot.robot.run(autopilot=False,
+                        record_path=args.record,
+                        instrument_target=args.instrument,
+                        realtime=args.realtime,
+                        robot_id=args.robot_id,
+                        groups=groups,
+                        listen_ip=listen_ip,
+                        listen_port=listen_port,
+                        max_speed_mps=args.max_speed,
+                        time_to_collision_s=time_to_collision_s)
 
 
 if __name__ == '__main__':
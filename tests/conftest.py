@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+import robot.hardware as hardware
+import robot.mock_gpio as mock_gpio
+
+_SPEED_OF_SOUND_mps = 343.26
+
+
+@pytest.fixture
+def mock_hardware():
+    """Runs the test on the mock pins of robot.hardware.
+    """
+    backend_name = hardware.backend_name()
+    hardware.use_backend('mock')
+    yield
+    hardware.use_backend(backend_name)
+
+
+class Echoes:
+    """Answers the pings of the ultrasonic sensors on the mock pins, like
+    the simulator does, with echoes timed from a given distance.
+
+    Attributes:
+        num_pings (dict): Maps each TRIG pin to the number of pings.
+    """
+
+    # Delay between the end of the trigger pulse and the start of the echo.
+    _DELAY_s = 2e-3
+
+    # The end of the echo is timed by spinning for this long, in seconds.
+    _SPIN_s = 1e-3
+
+    def __init__(self):
+        self.num_pings = {}
+        self._echoes = {}
+
+    def set_distance(self, trig_pin, echo_pin, distance_cm):
+        """Answers the pings on a TRIG pin with an echo on an ECHO pin.
+
+        Args:
+            trig_pin (int): The TRIG pin.
+            echo_pin (int): The ECHO pin.
+            distance_cm (float): Distance to answer with, in cm. No echo if
+                None.
+        """
+        self._echoes.setdefault(trig_pin, {})[echo_pin] = distance_cm
+
+    def _on_output(self, pin, level):
+        if level or pin not in self._echoes:
+            return
+
+        self.num_pings[pin] = self.num_pings.get(pin, 0) + 1
+        for echo_pin, distance_cm in self._echoes[pin].items():
+            if distance_cm is None:
+                continue
+            threading.Thread(
+                target=self._echo,
+                args=(echo_pin, 2 * distance_cm / 100 / _SPEED_OF_SOUND_mps),
+                daemon=True).start()
+
+    def _echo(self, echo_pin, duration_s):
+        time.sleep(self._DELAY_s)
+        mock_gpio.set_input(echo_pin, True)
+        end_s = time.perf_counter() + duration_s
+        time.sleep(max(duration_s - self._SPIN_s, 0.))
+        while time.perf_counter() < end_s:
+            pass
+        mock_gpio.set_input(echo_pin, False)
+
+
+@pytest.fixture
+def echoes(mock_hardware):
+    """Answers the pings of the ultrasonic sensors, see Echoes.
+    """
+    echoes = Echoes()
+    mock_gpio.add_output_callback(echoes._on_output)
+    yield echoes
+    mock_gpio.remove_output_callback(echoes._on_output)
+    mock_gpio.cleanup()
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+import robot.motion.driver as dvr
+import robot.motion.safety as safety
+import robot.recording as recording
+
+
+@pytest.fixture
+def driver(mock_hardware):
+    driver = dvr.Driver()
+    yield driver
+    driver.close()
+
+
+def test_commands_move_motors(driver):
+    driver.set_commands({dvr.COMMAND_FORWARD: 1, dvr.COMMAND_TURBO: 1})
+    assert driver.motor_values == (1., 1.)
+
+    driver.set_command(dvr.COMMAND_TURBO, 0)
+    assert driver.motor_values == (0.5, 0.5)
+
+    driver.stop()
+    assert driver.motor_values == (0., 0.)
+    assert driver.command_mask == 0
+
+
+def test_unrecognized_command_ignores_whole_batch(driver):
+    driver.set_command(dvr.COMMAND_FORWARD, 1)
+    driver.set_commands({dvr.COMMAND_BACKWARD: 1, dvr.COMMAND_FORWARD: 0,
+                         42: 1})
+    assert driver.command_mask == 1 << dvr.COMMAND_FORWARD
+    assert driver.motor_values == (0.5, 0.5)
+
+
+def test_unchanged_motor_values_not_written(driver):
+    driver.set_command(dvr.COMMAND_FORWARD, 1)
+    num_skipped_writes = driver.num_skipped_writes
+
+    # Turbo without a direction keeps the motors still, as they already are.
+    driver.set_commands({dvr.COMMAND_FORWARD: 0, dvr.COMMAND_TURBO: 1})
+    driver.set_command(dvr.COMMAND_TURBO, 0)
+    assert driver.motor_values == (0., 0.)
+    assert driver.num_skipped_writes == num_skipped_writes + 1
+
+
+def test_safety_flags_stop_forward_motion(driver):
+    driver.set_command(dvr.COMMAND_FORWARD, 1)
+    driver.safety_flags.set(safety.STOP_FORWARD)
+    driver.apply_safety_flags()
+    assert driver.motor_values == (0., 0.)
+
+    # Backward motion is still allowed.
+    driver.set_commands({dvr.COMMAND_FORWARD: 0, dvr.COMMAND_BACKWARD: 1})
+    assert driver.motor_values == (-0.5, -0.5)
+
+    driver.safety_stop_event.set()
+    driver.apply_safety_flags()
+    assert driver.motor_values == (0., 0.)
+
+
+def test_safety_flags_applied_without_commands(driver):
+    driver.set_command(dvr.COMMAND_FORWARD, 1)
+    driver.safety_flags.set(safety.PREDICTED_STOP_FORWARD)
+
+    # The driver notices the change on its own within a few milliseconds.
+    deadline_s = time.monotonic() + 0.5
+    while driver.motor_values != (0., 0.) and time.monotonic() < deadline_s:
+        time.sleep(1e-3)
+    assert driver.motor_values == (0., 0.)
+
+
+def test_invalid_max_speed(mock_hardware):
+    with pytest.raises(ValueError):
+        dvr.Driver(max_speed_mps=0.)
+
+
+def test_stops_with_reason_recorded(mock_hardware, tmp_path):
+    path = str(tmp_path / 'drive.rec')
+    recorder = recording.Recorder(path)
+    driver = dvr.Driver(recorder=recorder)
+    driver.set_command(dvr.COMMAND_FORWARD, 1)
+    driver.stop(reason=recording.STOP_LINK_LOST)
+    driver.close()
+    recorder.close()
+
+    kinds = [(record.kind, record.source)
+             for record in recording.read_records(path)]
+    assert kinds == [(recording.KIND_MOTORS, 0),
+                     (recording.KIND_STOP, recording.STOP_LINK_LOST),
+                     (recording.KIND_MOTORS, 0)]
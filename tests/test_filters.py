@@ -0,0 +1,64 @@
+import pytest
+
+import robot.sensor.filters as filters
+
+
+def test_out_of_range_samples_rejected():
+    for distance_filter in (filters.MedianFilter(),
+                            filters.AlphaBetaFilter()):
+        assert distance_filter.update(0.5, 0.) is None
+        assert distance_filter.update(1000., 0.) is None
+        assert distance_filter.estimate_cm is None
+
+
+def test_median_ignores_spikes():
+    median_filter = filters.MedianFilter(window_size=3)
+    outputs = [median_filter.update(distance_cm, 0.)
+               for distance_cm in (10., 11., 80., 12., 13.)]
+    assert outputs == [10., 11., 11., 12., 13.]
+
+
+def test_median_invalid_window():
+    with pytest.raises(ValueError):
+        filters.MedianFilter(window_size=0)
+
+
+def test_outliers_rejected_until_scene_changes():
+    median_filter = filters.MedianFilter(window_size=3, max_jump_cm=10.,
+                                         max_outliers=2)
+    assert median_filter.update(50., 0.) == 50.
+
+    # Too far from the estimate.
+    assert median_filter.update(20., 0.) is None
+    assert median_filter.update(20., 0.) is None
+
+    # A third one in a row: the estimate is reset to the new scene.
+    assert median_filter.update(20., 0.) == 20.
+    assert median_filter.estimate_cm == 20.
+
+
+def test_alpha_beta_tracks_approach():
+    alpha_beta_filter = filters.AlphaBetaFilter(alpha=0.5, beta=0.1)
+    interval_s = 0.05
+    rate_cmps = -20.
+    distance_cm = 100.
+    for idx in range(200):
+        distance_cm = 100. + rate_cmps * idx * interval_s
+        estimate_cm = alpha_beta_filter.update(distance_cm, idx * interval_s)
+        if distance_cm < filters.MIN_DISTANCE_cm + 10:
+            break
+
+    assert alpha_beta_filter.rate_cmps == pytest.approx(rate_cmps, rel=1e-3)
+    assert estimate_cm == pytest.approx(distance_cm, abs=0.1)
+
+
+def test_alpha_beta_reset_clears_rate():
+    alpha_beta_filter = filters.AlphaBetaFilter(max_jump_cm=10.,
+                                                max_outliers=0)
+    alpha_beta_filter.update(100., 0.)
+    alpha_beta_filter.update(98., 0.1)
+    assert alpha_beta_filter.rate_cmps != 0.
+
+    # With no outliers allowed, a jump resets the filter right away.
+    assert alpha_beta_filter.update(30., 0.2) == 30.
+    assert alpha_beta_filter.rate_cmps == 0.
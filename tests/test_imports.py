@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_HARDWARE_MODULES = ('RPi', 'gpiozero', 'pynput')
+
+
+@pytest.mark.parametrize('module', ['run_remote', 'run_robot'])
+def test_import_loads_no_hardware_library(module):
+    # A fresh interpreter, so that no other test has loaded the libraries.
+    code = 'import sys, {}; print(" ".join(sorted(sys.modules)))'.format(
+        module)
+    output = subprocess.run([sys.executable, '-c', code],
+                            cwd=_ROOT,
+                            stdout=subprocess.PIPE,
+                            check=True,
+                            universal_newlines=True).stdout
+    loaded = {name.partition('.')[0] for name in output.split()}
+    assert loaded.isdisjoint(_HARDWARE_MODULES)
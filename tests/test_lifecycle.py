@@ -0,0 +1,123 @@
+import threading
+import time
+
+import pytest
+
+import robot.lifecycle as lifecycle
+
+
+class _Device:
+    """Device logging when it is built, stopped and closed.
+    """
+
+    def __init__(self, name, events, close_delay_s=0., **required):
+        self.name = name
+        self.required = required
+        self._events = events
+        self._close_delay_s = close_delay_s
+        self._events.append(('build', name))
+
+    def stop(self):
+        self._events.append(('stop', self.name))
+
+    def close(self):
+        time.sleep(self._close_delay_s)
+        self._events.append(('close', self.name))
+
+
+def _factory(name, events, **kwargs):
+    return lambda **required: _Device(name, events, **kwargs, **required)
+
+
+def test_start_builds_requirements_first():
+    events = []
+    devices_lifecycle = lifecycle.Lifecycle()
+    devices_lifecycle.add('driver', _factory('driver', events))
+    devices_lifecycle.add('navigator', _factory('navigator', events),
+                          requires=['driver'])
+    devices = devices_lifecycle.start()
+
+    assert events == [('build', 'driver'), ('build', 'navigator')]
+    assert devices['navigator'].required == {'driver': devices['driver']}
+    assert devices_lifecycle.close()
+
+
+def test_independent_devices_built_in_parallel():
+    barrier = threading.Barrier(2, timeout=1.)
+
+    def build():
+        # Both builds must be running for the barrier to pass.
+        barrier.wait()
+        return object()
+
+    devices_lifecycle = lifecycle.Lifecycle()
+    devices_lifecycle.add('left', build)
+    devices_lifecycle.add('right', build)
+    assert len(devices_lifecycle.start()) == 2
+
+
+def test_invalid_declarations():
+    devices_lifecycle = lifecycle.Lifecycle()
+    devices_lifecycle.add('driver', object)
+    with pytest.raises(ValueError):
+        devices_lifecycle.add('driver', object)
+    with pytest.raises(ValueError):
+        devices_lifecycle.add('navigator', object, requires=['sensor'])
+
+
+def test_failed_start_closes_built_devices():
+    events = []
+
+    def fail(driver):
+        raise RuntimeError('No such pin')
+
+    devices_lifecycle = lifecycle.Lifecycle()
+    devices_lifecycle.add('driver', _factory('driver', events))
+    devices_lifecycle.add('navigator', fail, requires=['driver'])
+    with pytest.raises(RuntimeError):
+        devices_lifecycle.start()
+
+    assert ('close', 'driver') in events
+
+
+def test_close_stops_then_closes_dependents_first():
+    events = []
+    devices_lifecycle = lifecycle.Lifecycle()
+    devices_lifecycle.add('driver', _factory('driver', events),
+                          stop=_Device.stop)
+    devices_lifecycle.add('navigator',
+                          _factory('navigator', events, close_delay_s=0.05),
+                          requires=['driver'])
+    devices_lifecycle.start()
+    del events[:]
+
+    assert devices_lifecycle.close()
+    assert events == [('stop', 'driver'),
+                      ('close', 'navigator'),
+                      ('close', 'driver')]
+
+
+def test_close_with_custom_close():
+    closed = []
+    devices_lifecycle = lifecycle.Lifecycle()
+    devices_lifecycle.add('device', object, close=closed.append)
+    device = devices_lifecycle.start()['device']
+    assert devices_lifecycle.close()
+    assert closed == [device]
+
+
+def test_close_timeout_leaves_slow_devices_behind():
+    events = []
+    devices_lifecycle = lifecycle.Lifecycle(close_timeout_s=0.05)
+    devices_lifecycle.add('driver', _factory('driver', events))
+    devices_lifecycle.add('navigator',
+                          _factory('navigator', events, close_delay_s=0.5),
+                          requires=['driver'])
+    devices_lifecycle.start()
+
+    start_s = time.monotonic()
+    assert not devices_lifecycle.close()
+    assert time.monotonic() - start_s < 0.3
+
+    # The driver waits for the navigator, which did not close in time.
+    assert ('close', 'driver') not in events
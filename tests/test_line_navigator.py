@@ -0,0 +1,150 @@
+import threading
+import time
+
+import pytest
+
+import robot.devices.led_status as ls
+import robot.devices.line_navigator as ln
+import robot.hardware as hardware
+import robot.motion.driver as dvr
+import robot.motion.pid as pid
+
+# The sensors are pulled up, and active, that is low, off the black track.
+_OFF_TRACK = False
+_ON_TRACK = True
+
+_FORWARD = 1 << dvr.COMMAND_FORWARD
+_LEFT = 1 << dvr.COMMAND_LEFT
+
+
+@pytest.fixture
+def devices(mock_hardware):
+    driver = dvr.Driver()
+    status_led = ls.StatusLed()
+    yield driver, status_led
+    status_led.close()
+    driver.close()
+
+
+def _line_pins():
+    """Returns the mock pins of the left and right line sensors, after
+    putting both sensors off the track.
+    """
+    pin_factory = hardware.gpiozero().Device.pin_factory
+    pins = (pin_factory.pin(ln.PIN_LEFT_LINE_SENSOR),
+            pin_factory.pin(ln.PIN_RIGHT_LINE_SENSOR))
+    for pin in pins:
+        pin.drive_low()
+    return pins
+
+
+def _drive(pin, on_track):
+    if on_track:
+        pin.drive_high()
+    else:
+        pin.drive_low()
+
+
+def _wait_for(condition, timeout_s=1.):
+    deadline_s = time.monotonic() + timeout_s
+    while not condition():
+        if time.monotonic() > deadline_s:
+            return False
+        time.sleep(1e-3)
+    return True
+
+
+def test_event_driven_follows_line(devices):
+    driver, status_led = devices
+    line_navigator = ln.LineNavigator(driver=driver,
+                                      status_led=status_led,
+                                      event_driven=True)
+    left_pin, _ = _line_pins()
+
+    # The sensors smooth their readings: let them settle first.
+    assert _wait_for(lambda: line_navigator._sensor_left.is_active
+                     and line_navigator._sensor_right.is_active)
+    navigator_thread = threading.Thread(target=line_navigator.run)
+    navigator_thread.start()
+    try:
+        assert _wait_for(lambda: driver.command_mask == _FORWARD)
+
+        _drive(left_pin, _ON_TRACK)
+        assert _wait_for(lambda: driver.command_mask == _LEFT)
+        assert line_navigator.state == ln.LineNavigator._State.LEFT_ON_TRACK
+
+        _drive(left_pin, _OFF_TRACK)
+        assert _wait_for(lambda: driver.command_mask == _FORWARD)
+
+    finally:
+        line_navigator.close()
+        navigator_thread.join()
+
+    # Only the changes of the line were dispatched: no polling.
+    assert line_navigator.dispatch_stats == {'transitions': 3,
+                                             'reasserts': 0,
+                                             'skipped': 0}
+
+
+def test_commands_sent_on_transitions_only(devices):
+    driver, status_led = devices
+    line_navigator = ln.LineNavigator(driver=driver, status_led=status_led)
+    num_skipped_writes = driver.num_skipped_writes
+
+    # Off the track, then the left sensor on the black track for a while.
+    line_navigator.step(left_active=True, right_active=True)
+    for _ in range(10):
+        line_navigator.step(left_active=False, right_active=True)
+    assert driver.command_mask == _LEFT
+    assert line_navigator.dispatch_stats == {'transitions': 2,
+                                             'reasserts': 0,
+                                             'skipped': 9}
+
+    # The repeated readings did not even reach the driver.
+    assert driver.num_skipped_writes == num_skipped_writes
+    line_navigator.close()
+
+
+def test_commands_reasserted_at_interval(devices):
+    driver, status_led = devices
+    line_navigator = ln.LineNavigator(driver=driver,
+                                      status_led=status_led,
+                                      reassert_interval_s=0.01)
+    line_navigator.step(left_active=True, right_active=True)
+    line_navigator.step(left_active=True, right_active=True)
+    time.sleep(0.01)
+    line_navigator.step(left_active=True, right_active=True)
+    assert line_navigator.dispatch_stats == {'transitions': 1,
+                                             'reasserts': 1,
+                                             'skipped': 1}
+    line_navigator.close()
+
+
+def test_proportional_steering_sharpens_turns(devices):
+    driver, status_led = devices
+    line_navigator = ln.LineNavigator(driver=driver,
+                                      status_led=status_led,
+                                      proportional=True)
+    controller = pid.PidController(kp=line_navigator._STEERING_KP,
+                                   ki=line_navigator._STEERING_KI,
+                                   output_limit=1.)
+    states = ln.LineNavigator._State
+
+    # The longer the line stays under the left sensor, the sharper the turn
+    # to the left.
+    turns = []
+    for timestamp_s in (0., 0.5, 1.):
+        line_navigator._steer(controller, states.LEFT_ON_TRACK, timestamp_s)
+        left, right = driver.motor_values
+        turns.append(right - left)
+    assert 0 < turns[0] < turns[1] < turns[2]
+
+    # Back on the line, straight ahead.
+    line_navigator._steer(controller, states.NONE_ON_TRACK, 1.5)
+    left, right = driver.motor_values
+    assert left == pytest.approx(right)
+    assert left > 0
+
+    line_navigator._steer(controller, states.BOTH_ON_TRACK, 2.)
+    assert driver.motor_values == (0., 0.)
+    line_navigator.close()
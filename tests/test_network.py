@@ -0,0 +1,117 @@
+import socket
+
+import pytest
+
+import robot.network as network
+
+
+class _Clock:
+    """Replaces the time module of the network module, to control the
+    monotonic clock.
+    """
+
+    def __init__(self):
+        self.now_s = 0.
+
+    def monotonic(self):
+        return self.now_s
+
+
+class _Resolver:
+    """Replaces socket.gethostbyname, failing until given an address.
+    """
+
+    def __init__(self):
+        self.address = None
+        self.num_lookups = 0
+
+    def __call__(self, host):
+        self.num_lookups += 1
+        if self.address is None:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name not known')
+        return self.address
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(network, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def resolver(monkeypatch):
+    resolver = _Resolver()
+    monkeypatch.setattr(network.socket, 'gethostbyname', resolver)
+    return resolver
+
+
+@pytest.fixture
+def server():
+    server = network.UDPServer('127.0.0.1', 0)
+    server.socket.settimeout(1.)
+    yield server
+    server.close()
+
+
+def test_parse_address():
+    assert network.parse_address('robot:1234', default_port=1) \
+        == ('robot', 1234)
+    assert network.parse_address('robot', default_port=1) == ('robot', 1)
+    assert network.parse_address(':1234', default_port=1) == ('', 1234)
+    with pytest.raises(ValueError):
+        network.parse_address('robot:port', default_port=1)
+
+
+def test_endpoint_resolves_once(clock, resolver):
+    resolver.address = '10.0.0.1'
+    endpoint = network.Endpoint('robot.local', 1234, refresh_interval_s=30.)
+    assert endpoint.resolve() == ('10.0.0.1', 1234)
+    assert endpoint.resolve() == ('10.0.0.1', 1234)
+    assert resolver.num_lookups == 1
+
+    # Refreshed after the interval, keeping the address if the lookup fails.
+    clock.now_s += 30.
+    resolver.address = None
+    assert endpoint.resolve() == ('10.0.0.1', 1234)
+    assert resolver.num_lookups == 2
+
+
+def test_endpoint_never_looks_up_ips(resolver):
+    endpoint = network.Endpoint('127.0.0.1', 1234)
+    assert endpoint.resolve() == ('127.0.0.1', 1234)
+    assert not endpoint.expired
+    assert resolver.num_lookups == 0
+
+
+def test_endpoint_backs_off_failed_lookups(clock, resolver):
+    endpoint = network.Endpoint('robot.local', 1234, refresh_interval_s=30.)
+    num_lookups = []
+    for _ in range(100):
+        with pytest.raises(socket.gaierror):
+            endpoint.resolve()
+        num_lookups.append(resolver.num_lookups)
+        clock.now_s += 0.5
+
+    # Retried 1, 2, 4, 8 and 16 s after each failure, then every 30 s.
+    assert resolver.num_lookups == 6
+    assert num_lookups[:4] == [1, 1, 2, 2]
+
+
+def test_client_sends_once_resolved(clock, resolver, server):
+    _, port = server.socket.getsockname()
+    client = network.UDPClient('robot.local', port)
+    assert client.address is None
+
+    # Dropped while the hostname cannot be resolved, without blocking on a
+    # lookup at every send.
+    assert not client.send(b'lost')
+    assert not client.send(b'lost')
+    assert resolver.num_lookups == 1
+
+    resolver.address = '127.0.0.1'
+    clock.now_s += 1.
+    assert client.send(b'hello')
+    assert client.address == ('127.0.0.1', port)
+    assert next(server.receive()) == b'hello'
+    client.close()
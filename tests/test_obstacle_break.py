@@ -0,0 +1,68 @@
+import robot.devices.obstacle_break as ob
+import robot.motion.driver as dvr
+import robot.motion.safety as safety
+
+
+def test_motion_pace():
+    motion_state = dvr.MotionState()
+    front_pace = ob._motion_pace(motion_state, direction=1)
+    rear_pace = ob._motion_pace(motion_state, direction=-1)
+    assert front_pace() == rear_pace() == ob._PACE_STILL
+
+    motion_state.set(0.5, 0.5)
+    assert front_pace() == ob._PACE_TOWARDS
+    assert rear_pace() == ob._PACE_AWAY
+
+    motion_state.set(-1., -0.5)
+    assert front_pace() == ob._PACE_AWAY
+    assert rear_pace() == ob._PACE_TOWARDS
+
+    # Turning on the spot: both sides may get closer to an obstacle.
+    motion_state.set(-0.5, 0.5)
+    assert front_pace() == rear_pace() == ob._PACE_TOWARDS
+
+
+def test_collision_predicted_from_sample_times():
+    safety_flags = safety.SafetyFlags()
+    predictor = ob._CollisionPredictor(
+        safety_flags=safety_flags,
+        flag=safety.PREDICTED_STOP_FORWARD,
+        motion_state=dvr.MotionState(),
+        direction=1,
+        time_to_collision_s=0.3)
+
+    # An obstacle approaching at 1 m/s, measured every 50 ms. The samples
+    # are processed all at once: only their own times count.
+    for idx in range(20):
+        distance_cm = 100. - 5. * idx
+        predictor(distance_cm, timestamp_s=1000. + 0.05 * idx)
+        if safety_flags.mask:
+            break
+
+    # Predicted about 0.3 s ahead, given the lag of the rate estimate.
+    assert safety_flags.mask == safety.PREDICTED_STOP_FORWARD
+    assert 15. <= distance_cm <= 40.
+
+    # The obstacle stops approaching: the prediction is cleared.
+    for idx in range(20, 40):
+        predictor(distance_cm, timestamp_s=1000. + 0.05 * idx)
+    assert safety_flags.mask == 0
+
+
+def test_collision_predicted_from_commanded_speed():
+    safety_flags = safety.SafetyFlags()
+    motion_state = dvr.MotionState(max_speed_mps=1.)
+    predictor = ob._CollisionPredictor(
+        safety_flags=safety_flags,
+        flag=safety.PREDICTED_STOP_BACKWARD,
+        motion_state=motion_state,
+        direction=-1,
+        time_to_collision_s=0.3)
+
+    predictor(20., timestamp_s=0.)
+    assert safety_flags.mask == 0
+
+    # Backing up at 0.75 m/s, 20 cm away from the obstacle behind.
+    motion_state.set(-0.75, -0.75)
+    predictor(20., timestamp_s=0.05)
+    assert safety_flags.mask == safety.PREDICTED_STOP_BACKWARD
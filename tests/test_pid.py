@@ -0,0 +1,50 @@
+import pytest
+
+import robot.motion.pid as pid
+
+
+def test_proportional_term():
+    controller = pid.PidController(kp=0.5)
+    assert controller.update(2., timestamp_s=0.) == 1.
+    assert controller.update(-1., timestamp_s=1.) == -0.5
+
+
+def test_integral_term_grows_with_time():
+    controller = pid.PidController(kp=0., ki=2.)
+
+    # The first error gives no interval yet.
+    assert controller.update(1., timestamp_s=0.) == 0.
+    assert controller.update(1., timestamp_s=0.5) == pytest.approx(1.)
+    assert controller.update(1., timestamp_s=1.5) == pytest.approx(3.)
+
+    controller.reset_integral()
+    assert controller.update(1., timestamp_s=2.) == pytest.approx(1.)
+
+
+def test_derivative_term():
+    controller = pid.PidController(kp=0., kd=0.1)
+    controller.update(0., timestamp_s=0.)
+    assert controller.update(1., timestamp_s=0.5) == pytest.approx(0.2)
+
+    # No interval, no derivative.
+    assert controller.update(2., timestamp_s=0.5) == 0.
+
+
+def test_clamped_output_does_not_wind_up():
+    controller = pid.PidController(kp=0., ki=1., output_limit=1.)
+    for timestamp_s in range(10):
+        output = controller.update(1., timestamp_s=float(timestamp_s))
+    assert output == 1.
+
+    # The integral stopped at the limit: the output reacts at once when the
+    # error changes sign.
+    assert controller.update(-1., timestamp_s=10.) == pytest.approx(0.)
+    assert controller.update(-1., timestamp_s=12.) == -1.
+
+
+def test_reset_forgets_history():
+    controller = pid.PidController(kp=1., ki=1., kd=1.)
+    controller.update(1., timestamp_s=0.)
+    controller.update(1., timestamp_s=1.)
+    controller.reset()
+    assert controller.update(1., timestamp_s=5.) == 1.
@@ -0,0 +1,79 @@
+import robot.devices.remote.protocol as protocol
+
+
+def test_encode_decode():
+    frame = protocol.Frame(flags=protocol.FLAG_SNAPSHOT,
+                           session=1234,
+                           sequence=56789,
+                           commands=protocol.FORWARD | protocol.TURBO)
+    data = protocol.encode(frame)
+    assert len(data) == protocol.FRAME_SIZE
+    assert protocol.decode(data) == frame
+
+
+def test_encode_wraps_sequence():
+    frame = protocol.Frame(flags=0, session=0, sequence=(1 << 32) + 3,
+                           commands=0)
+    assert protocol.decode(protocol.encode(frame)).sequence == 3
+
+
+def test_decode_rejects_invalid_data():
+    data = protocol.encode(protocol.Frame(flags=0, session=0, sequence=0,
+                                          commands=0))
+
+    # Legacy single-byte frame, wrong magic, wrong version.
+    assert protocol.decode(b'\x01') is None
+    assert protocol.decode(b'\x00' + data[1:]) is None
+    assert protocol.decode(data[:1] + b'\x09' + data[2:]) is None
+
+
+def test_is_newer():
+    assert protocol.is_newer(2, 1)
+    assert not protocol.is_newer(1, 1)
+    assert not protocol.is_newer(1, 2)
+
+    # Wrap-around of the counter.
+    assert protocol.is_newer(0, (1 << 32) - 1)
+    assert not protocol.is_newer((1 << 32) - 1, 0)
+
+
+def test_encode_decode_fleet():
+    frame = protocol.Frame(flags=0,
+                           session=1,
+                           sequence=2,
+                           commands=protocol.LEFT,
+                           target=protocol.ALL_ROBOTS,
+                           groups=0b101)
+    data = protocol.encode(frame)
+    assert len(data) == protocol.FLEET_FRAME_SIZE
+    assert protocol.decode(data) == frame
+
+
+def test_is_addressed_to():
+    def fleet_frame(target, groups=protocol.ALL_GROUPS):
+        return protocol.encode(protocol.Frame(flags=0, session=0, sequence=0,
+                                              commands=0, target=target,
+                                              groups=groups))
+
+    assert protocol.is_addressed_to(fleet_frame(3), robot_id=3, groups=0)
+    assert not protocol.is_addressed_to(fleet_frame(4), robot_id=3, groups=0)
+    assert protocol.is_addressed_to(fleet_frame(protocol.ALL_ROBOTS),
+                                    robot_id=3, groups=0)
+    assert protocol.is_addressed_to(
+        fleet_frame(protocol.ALL_ROBOTS, groups=0b10),
+        robot_id=3, groups=0b11)
+    assert not protocol.is_addressed_to(
+        fleet_frame(protocol.ALL_ROBOTS, groups=0b100),
+        robot_id=3, groups=0b11)
+
+    # Frames which are not fleet frames address every robot.
+    single_frame = protocol.encode(protocol.Frame(flags=0, session=0,
+                                                  sequence=0, commands=0))
+    assert protocol.is_addressed_to(single_frame, robot_id=3, groups=0)
+
+
+def test_peek_sequence():
+    frame = protocol.Frame(flags=0, session=77, sequence=88, commands=0,
+                           target=5)
+    assert protocol.peek_sequence(protocol.encode(frame)) == (77, 88)
+    assert protocol.peek_sequence(b'\x01') is None
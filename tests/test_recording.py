@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+import robot.recording as recording
+
+
+def test_records_round_trip(tmp_path):
+    path = str(tmp_path / 'drive.rec')
+    recorder = recording.Recorder(path)
+    recorder.record(recording.KIND_ULTRASONIC, source=2, x=12.5)
+    recorder.record(recording.KIND_MOTORS, x=0.5, y=-0.5)
+    recorder.record(recording.KIND_STOP, source=recording.STOP_SHUTDOWN)
+    recorder.close()
+
+    records = recording.read_records(path)
+    assert [record.kind for record in records] == [
+        recording.KIND_ULTRASONIC,
+        recording.KIND_MOTORS,
+        recording.KIND_STOP,
+    ]
+    assert records[0].source == 2
+    assert records[0].x == 12.5
+    assert (records[1].x, records[1].y) == (0.5, -0.5)
+    assert records[2].source == recording.STOP_SHUTDOWN
+
+
+def test_records_buffered_until_flush(tmp_path):
+    path = str(tmp_path / 'drive.rec')
+    recorder = recording.Recorder(path)
+    recorder.record(recording.KIND_LINE, value=3)
+    assert recording.read_records(path) == []
+
+    recorder.flush()
+    assert [record.value for record in recording.read_records(path)] == [3]
+    recorder.close()
+
+    # Closed recorders ignore the records.
+    recorder.record(recording.KIND_LINE, value=4)
+    assert len(recording.read_records(path)) == 1
+
+
+def test_append_to_existing_recording(tmp_path):
+    path = str(tmp_path / 'drive.rec')
+    for value in range(2):
+        recorder = recording.Recorder(path)
+        recorder.record(recording.KIND_REMOTE, value=value)
+        recorder.close()
+
+    records = recording.read_records(path)
+    assert [record.value for record in records] == [0, 1]
+
+
+def test_truncated_record_ignored(tmp_path):
+    path = str(tmp_path / 'drive.rec')
+    recorder = recording.Recorder(path)
+    recorder.record(recording.KIND_REMOTE, value=1)
+    recorder.record(recording.KIND_REMOTE, value=2)
+    recorder.close()
+
+    os.truncate(path, os.path.getsize(path) - 1)
+    assert [record.value for record in recording.read_records(path)] == [1]
+
+
+def test_not_a_recording(tmp_path):
+    path = tmp_path / 'drive.rec'
+    path.write_bytes(b'not a recording at all')
+    with pytest.raises(ValueError):
+        recording.read_records(str(path))
+    with pytest.raises(ValueError):
+        recording.Recorder(str(path))
+
+
+def test_recording_filter(tmp_path):
+    class _Halving:
+        def update(self, distance_cm, timestamp_s):
+            return distance_cm / 2
+
+    path = str(tmp_path / 'drive.rec')
+    recorder = recording.Recorder(path)
+    recording_filter = recording.RecordingFilter(recorder, source=1,
+                                                 distance_filter=_Halving())
+    assert recording_filter.update(30., 0.) == 15.
+    recorder.close()
+
+    # The raw sample is recorded.
+    record, = recording.read_records(path)
+    assert (record.kind, record.source, record.x) == (
+        recording.KIND_ULTRASONIC, 1, 30.)
+
+
+def test_recording_filter_keeps_sample_time(tmp_path):
+    path = str(tmp_path / 'drive.rec')
+    recorder = recording.Recorder(path)
+    recording_filter = recording.RecordingFilter(recorder, source=0)
+    recording_filter.update(30., 12.345678912)
+    recorder.close()
+
+    record, = recording.read_records(path)
+    assert record.timestamp_ns == 12345678912
@@ -0,0 +1,117 @@
+import asyncio
+import select
+
+import pytest
+
+import robot.devices.led_status as ls
+import robot.devices.remote.protocol as protocol
+import robot.devices.remote.remote_receiver as rr
+import robot.motion.driver as dvr
+import robot.network as network
+import robot.recording as recording
+
+
+class _Recorder:
+    """Keeps the recorded commands.
+    """
+
+    def __init__(self):
+        self.commands = []
+
+    def record(self, kind, value=0, **kwargs):
+        if kind == recording.KIND_REMOTE:
+            self.commands.append(value)
+
+
+@pytest.fixture
+def receiver(mock_hardware, monkeypatch):
+    driver = dvr.Driver()
+    status_led = ls.StatusLed()
+    receiver = rr.RemoteReceiver(driver=driver,
+                                 status_led=status_led,
+                                 recorder=_Recorder(),
+                                 ip='127.0.0.1',
+                                 port=0)
+
+    # Count the packets re-arming the watchdog.
+    receiver.num_packets = 0
+
+    def _packet_received(heartbeat=True):
+        receiver.num_packets += 1
+
+    monkeypatch.setattr(receiver._watchdog, 'packet_received',
+                        _packet_received)
+
+    # Served by hand rather than by serve().
+    loop = asyncio.new_event_loop()
+    receiver._shutdown = loop.create_future()
+    yield receiver
+    receiver.close()
+    loop.close()
+    status_led.close()
+    driver.close()
+
+
+@pytest.fixture
+def client(receiver):
+    _, port = receiver._server.socket.getsockname()
+    client = network.UDPClient(ip='127.0.0.1', port=port)
+    yield client
+    client.close()
+
+
+def _deliver(receiver, client, *datagrams):
+    """Sends the datagrams and lets the receiver read them as one batch.
+    """
+    for data in datagrams:
+        client.send(data)
+    readable, _, _ = select.select([receiver._server.socket], [], [], 1.)
+    assert readable
+    receiver._on_readable()
+
+
+def _frame(session, sequence, commands):
+    return protocol.encode(protocol.Frame(flags=0,
+                                          session=session,
+                                          sequence=sequence,
+                                          commands=commands))
+
+
+def test_receiver_applies_newest_frame(receiver, client):
+    _deliver(receiver, client,
+             _frame(session=1, sequence=1, commands=protocol.BACKWARD),
+             _frame(session=1, sequence=2, commands=protocol.FORWARD))
+    assert receiver._driver.command_mask == 1 << dvr.COMMAND_FORWARD
+    assert receiver._recorder.commands == [protocol.FORWARD]
+    assert receiver.num_packets == 1
+    assert receiver._status == ls.Status.READING_REMOTE
+
+
+def test_receiver_ignores_rejected_frames(receiver, client):
+    _deliver(receiver, client,
+             _frame(session=1, sequence=2, commands=protocol.FORWARD))
+
+    # Late, replaced and invalid frames neither re-arm the watchdog nor reach
+    # the motors.
+    _deliver(receiver, client,
+             _frame(session=2, sequence=1, commands=0))
+    _deliver(receiver, client,
+             _frame(session=1, sequence=3, commands=protocol.BACKWARD),
+             _frame(session=2, sequence=1, commands=protocol.LEFT),
+             b'garbage', b'?')
+    assert receiver._driver.command_mask == 0
+    assert receiver._recorder.commands == [protocol.FORWARD, 0]
+    assert receiver.num_packets == 2
+
+    # Once the link is lost, the status is only set back by an accepted
+    # frame.
+    receiver._on_timeout()
+    _deliver(receiver, client, b'garbage')
+    assert receiver.num_packets == 2
+    assert receiver._status == ls.Status.WAITING_FOR_REMOTE
+
+    # Any sender can take over the lost link.
+    _deliver(receiver, client,
+             _frame(session=1, sequence=1, commands=protocol.LEFT))
+    assert receiver.num_packets == 3
+    assert receiver._status == ls.Status.READING_REMOTE
@@ -0,0 +1,133 @@
+import enum
+import errno
+import time
+
+import pytest
+
+import robot.devices.remote.protocol as protocol
+import robot.devices.remote.remote_sender as remote_sender
+import robot.hardware as hardware
+import robot.network as network
+
+
+class _Key(enum.Enum):
+    """The special keys of pynput's keyboard used by the remote.
+    """
+    up = 'up'
+    down = 'down'
+    left = 'left'
+    right = 'right'
+    shift = 'shift'
+    esc = 'esc'
+    f1 = 'f1'
+    f2 = 'f2'
+    f3 = 'f3'
+    f4 = 'f4'
+    f5 = 'f5'
+    f6 = 'f6'
+    f7 = 'f7'
+    f8 = 'f8'
+
+
+class _KeyCode(str):
+
+    @classmethod
+    def from_char(cls, char):
+        return cls(char)
+
+
+class _Keyboard:
+    """The parts of pynput's keyboard the remote needs to be built. The
+    listener is not provided: the tests call the key handlers directly.
+    """
+    Key = _Key
+    KeyCode = _KeyCode
+
+
+class _KeyboardBackend(hardware.Backend):
+
+    def keyboard(self):
+        return _Keyboard
+
+
+@pytest.fixture
+def keyboard_backend():
+    backend_name = hardware.backend_name()
+    hardware.register_backend('test-keyboard', _KeyboardBackend())
+    hardware.use_backend('test-keyboard')
+    yield
+    hardware.use_backend(backend_name)
+
+
+@pytest.fixture
+def server():
+    server = network.UDPServer('127.0.0.1', 0)
+    server.socket.settimeout(1.)
+    yield server
+    server.close()
+
+
+class _FailingClient:
+    """Client whose sends fail as if the network were down.
+    """
+
+    def __init__(self):
+        self.num_sends = 0
+
+    def send(self, data):
+        self.num_sends += 1
+        raise OSError(errno.ENETUNREACH, 'Network is unreachable')
+
+    def close(self):
+        pass
+
+
+def _receive_frame(server):
+    return protocol.decode(next(server.receive()))
+
+
+def test_sender_sends_commands(keyboard_backend, server):
+    _, port = server.socket.getsockname()
+    sender = remote_sender.RemoteSender(ip='127.0.0.1', port=port)
+
+    sender._on_press(_Key.up)
+    assert _receive_frame(server).commands == protocol.FORWARD
+
+    # Auto-repeat does not change the state.
+    sender._on_press(_Key.up)
+    sender._on_release(_Key.up)
+    frame = _receive_frame(server)
+    assert frame.commands == 0
+    assert frame.sequence == 2
+
+
+def test_sender_survives_failed_sends(keyboard_backend, server, caplog):
+    _, port = server.socket.getsockname()
+    sender = remote_sender.RemoteSender(heartbeat_hz=100., ip='127.0.0.1',
+                                        port=port)
+    client = sender._client
+    failing_client = _FailingClient()
+    sender._client = failing_client
+
+    sender._heartbeat_thread.start()
+    try:
+        # Neither the key handlers nor the heartbeat thread give up.
+        sender._on_press(_Key.up)
+        sender._on_release(_Key.up)
+        time.sleep(0.1)
+        assert sender._heartbeat_thread.is_alive()
+        assert failing_client.num_sends > 2
+        warnings = [record for record in caplog.records
+                    if record.name == remote_sender.__name__]
+        assert len(warnings) == 1
+
+        # Once the network is back, the heartbeats carry the full state.
+        sender._on_press(_Key.left)
+        sender._client = client
+        frame = _receive_frame(server)
+        assert frame.commands == protocol.LEFT
+        assert frame.flags == protocol.FLAG_SNAPSHOT
+    finally:
+        sender._stop_event.set()
+        sender._heartbeat_thread.join()
+        client.close()
@@ -0,0 +1,56 @@
+import time
+
+import robot.devices.obstacle_break as ob
+import robot.motion.driver as dvr
+import robot.recording as recording
+import robot.replay as replay
+import robot.robot as rbt
+
+
+def _record_drive(path):
+    """Records the robot driving forward towards an obstacle which gets
+    within the time to collision, then moves away.
+    """
+    recorder = recording.Recorder(path)
+    driver = dvr.Driver(recorder=recorder)
+    obstacle_break = ob.ObstacleBreak(
+        driver=driver,
+        distance_m=0.1,
+        adaptive_sampling=True,
+        time_to_collision_s=rbt.DEFAULT_TIME_TO_COLLISION_s,
+        recorder=recorder)
+    front_sensor, _ = obstacle_break.sensors
+
+    recorder.record(recording.KIND_REMOTE, value=1 << dvr.COMMAND_FORWARD)
+    driver.set_command_mask(1 << dvr.COMMAND_FORWARD)
+
+    timestamp_s = time.monotonic()
+    distances_cm = [100., 90., 80., 70., 60., 50., 40., 30., 20., 20., 20.,
+                    30., 40., 50., 60., 70., 80.]
+    for distance_cm in distances_cm:
+        timestamp_s += 0.1
+        front_sensor.feed(distance_cm, timestamp_s=timestamp_s)
+        driver.apply_safety_flags()
+
+    obstacle_break.close()
+    driver.close()
+    recorder.close()
+
+
+def test_replay_reproduces_predictive_stop(mock_hardware, tmp_path):
+    path = str(tmp_path / 'drive.rec')
+    _record_drive(path)
+    records = recording.read_records(path)
+
+    # The predictive stop fired, and no distance got within the threshold.
+    recorded = [(record.x, record.y) for record in records
+                if record.kind == recording.KIND_MOTORS]
+    assert recorded == [(0.5, 0.5), (0., 0.), (0.5, 0.5)]
+
+    # With the defaults of the robot, replay gives the same motor values.
+    assert replay.compare(records, replay.replay(records))
+
+    # The comparison fails if the predictive stop is not replayed.
+    assert not replay.compare(records,
+                              replay.replay(records,
+                                            time_to_collision_s=None))
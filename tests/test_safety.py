@@ -0,0 +1,53 @@
+import threading
+
+import robot.motion.safety as safety
+
+
+def test_set_and_clear_flags():
+    flags = safety.SafetyFlags()
+    assert flags.mask == 0
+
+    flags.set(safety.STOP_FORWARD | safety.PREDICTED_STOP_FORWARD)
+    assert flags.is_set(safety.ANY_STOP_FORWARD)
+    assert not flags.is_set(safety.ANY_STOP_BACKWARD)
+
+    flags.clear(safety.STOP_FORWARD)
+    assert flags.mask == safety.PREDICTED_STOP_FORWARD
+
+
+def test_sequence_counts_changes_only():
+    flags = safety.SafetyFlags()
+    flags.set(safety.STOP)
+    assert flags.sequence == 1
+
+    # No change.
+    flags.set(safety.STOP)
+    flags.clear(safety.STOP_BACKWARD)
+    assert flags.sequence == 1
+
+    flags.clear(safety.STOP)
+    assert flags.sequence == 2
+
+
+def test_event_view():
+    flags = safety.SafetyFlags()
+    event = flags.as_event(safety.STOP_BACKWARD)
+    assert not event.is_set()
+
+    event.set()
+    assert flags.mask == safety.STOP_BACKWARD
+    assert event.is_set()
+
+    flags.clear(safety.STOP_BACKWARD)
+    assert not event.is_set()
+
+
+def test_event_wait():
+    flags = safety.SafetyFlags()
+    event = flags.as_event(safety.STOP)
+    assert not event.wait(0.01)
+
+    timer = threading.Timer(0.01, flags.set, args=(safety.STOP,))
+    timer.start()
+    assert event.wait(1.)
+    timer.join()
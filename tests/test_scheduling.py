@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+import robot.scheduling as scheduling
+
+
+def test_invalid_period():
+    with pytest.raises(ValueError):
+        scheduling.FixedRate(period_s=0., name='test')
+
+
+def test_rate_does_not_drift():
+    period_s = 0.05
+    rate = scheduling.FixedRate(period_s=period_s, name='test')
+    rate.start()
+    start_s = time.monotonic()
+    for _ in range(10):
+        # Work taking a fraction of the period.
+        time.sleep(period_s / 10)
+        assert not rate.wait()
+
+    elapsed_s = time.monotonic() - start_s
+    assert 10 * period_s <= elapsed_s < 10.5 * period_s
+    assert rate.stats == {'periods': 10, 'overruns': 0}
+
+
+def test_overruns_counted_and_skipped():
+    period_s = 0.01
+    rate = scheduling.FixedRate(period_s=period_s, name='test')
+    rate.start()
+    time.sleep(3.5 * period_s)
+    rate.wait()
+    assert rate.stats == {'periods': 1, 'overruns': 1}
+
+    # The missed deadlines are not caught up with: the next wait lasts
+    # about a period.
+    start_s = time.monotonic()
+    rate.wait()
+    assert time.monotonic() - start_s > period_s / 2
+    assert rate.stats == {'periods': 2, 'overruns': 1}
+
+
+def test_stop_event_interrupts_wait():
+    stop_event = threading.Event()
+    rate = scheduling.FixedRate(period_s=10., name='test',
+                                stop_event=stop_event)
+    rate.start()
+    threading.Timer(0.01, stop_event.set).start()
+
+    start_s = time.monotonic()
+    assert rate.wait()
+    assert time.monotonic() - start_s < 1.
+
+
+def test_start_replaces_stop_event():
+    stop_event = threading.Event()
+    rate = scheduling.FixedRate(period_s=0.01, name='test',
+                                stop_event=threading.Event())
+    rate.start(stop_event=stop_event)
+    stop_event.set()
+    assert rate.wait()
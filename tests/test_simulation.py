@@ -0,0 +1,100 @@
+import math
+
+import pytest
+
+import robot.simulation as simulation
+
+
+def test_box_ray_distance():
+    box = simulation.Box(1., -0.5, 2., 0.5)
+    assert box.ray_distance(0., 0., 1., 0.) == pytest.approx(1.)
+    assert box.ray_distance(0., 0., -1., 0.) is None
+    assert box.ray_distance(0., 1., 1., 0.) is None
+
+    # Diagonal ray, entering from the bottom side.
+    dx = dy = math.sqrt(0.5)
+    assert box.ray_distance(1., -1., dx, dy) == pytest.approx(math.sqrt(0.5))
+
+    # From inside, the box is right there.
+    assert box.ray_distance(1.5, 0., 1., 0.) == 0.
+
+
+def test_box_distance():
+    box = simulation.Box(1., -0.5, 2., 0.5)
+    assert box.distance(1.5, 0.) == 0.
+    assert box.distance(0., 0.) == pytest.approx(1.)
+    assert box.distance(3., 1.5) == pytest.approx(math.sqrt(2.))
+
+
+def test_world_has_walls():
+    world = simulation.World(width_px=20, height_px=10, resolution_m=0.1,
+                             black_pixels=bytearray(200))
+    assert world.ray_distance(0.5, 0.5, 0., max_range_m=4.) \
+        == pytest.approx(1.5)
+    assert world.ray_distance(0.5, 0.5, math.pi / 2, max_range_m=4.) \
+        == pytest.approx(0.5)
+    assert world.ray_distance(0.5, 0.5, 0., max_range_m=1.) is None
+    assert world.clearance(0.5, 0.2) == pytest.approx(0.2)
+
+
+def test_oval_world_starts_on_track():
+    world, (x, y, heading) = simulation.oval_world()
+    assert world.is_black(x, y)
+    assert not world.is_black(x, y + 0.05)
+    assert heading == 0.
+
+
+def test_load_pgm_world(tmp_path):
+    path = tmp_path / 'floor.pgm'
+    path.write_bytes(b'P5\n# Floor\n3 2\n255\n'
+                     + bytes([0, 255, 255,
+                              255, 255, 10]))
+    world = simulation.load_pgm_world(str(path), resolution_m=0.1)
+    assert (world.width_m, world.height_m) == pytest.approx((0.3, 0.2))
+    assert world.is_black(0.05, 0.05)
+    assert not world.is_black(0.15, 0.05)
+    assert world.is_black(0.25, 0.15)
+
+    path.write_bytes(b'P2\n1 1\n255\n0')
+    with pytest.raises(ValueError):
+        simulation.load_pgm_world(str(path), resolution_m=0.1)
+
+
+@pytest.fixture
+def simulator(mock_hardware):
+    world, pose = simulation.wall_world(distance_m=0.5)
+    simulator = simulation.Simulator(world=world, pose=pose, noise_cm=0.)
+    yield simulator
+    simulator.close()
+
+
+def test_simulator_drives_into_obstacle(simulator):
+    import robot.motion.driver as dvr
+
+    driver = dvr.Driver()
+    try:
+        assert simulator.front_gap_m() == pytest.approx(0.5)
+
+        driver.set_command(dvr.COMMAND_FORWARD, True)
+        for _ in range(100):
+            simulator._step(0.01)
+        x, y, heading = simulator.pose
+        assert x > 0.6
+        assert (y, heading) == (0.5, 0.)
+        assert simulator.front_gap_m() < 0.4
+
+        # Keep going until the bumper hits the obstacle.
+        for _ in range(500):
+            simulator._step(0.01)
+        assert simulator._num_collisions >= 1
+        assert simulator.wheel_speeds_mps == (0., 0.)
+        assert simulator.front_gap_m() < 0.05
+
+        # Turning on the spot.
+        driver.set_commands({dvr.COMMAND_FORWARD: False,
+                             dvr.COMMAND_LEFT: True})
+        for _ in range(10):
+            simulator._step(0.01)
+        assert simulator.pose[2] > 0.
+    finally:
+        driver.close()
@@ -0,0 +1,126 @@
+import select
+import socket
+
+import pytest
+
+import robot.motion.safety as safety
+import robot.network as network
+import robot.telemetry as telemetry
+
+
+class _Driver:
+    """Provides the state of the driver sampled by the publisher.
+    """
+
+    def __init__(self):
+        self.motor_values = (0., 0.)
+        self.command_mask = 0
+        self.safety_flags = safety.SafetyFlags()
+
+
+def _telemetry(**kwargs):
+    fields = dict(changed=telemetry.CHANGED_COMMANDS,
+                  robot_id=3,
+                  sequence=1,
+                  time_ms=100,
+                  acked=7,
+                  commands=1,
+                  safety=0,
+                  line_state=telemetry.UNKNOWN_LINE,
+                  left=50,
+                  right=-50,
+                  front_cm=20,
+                  rear_cm=telemetry.UNKNOWN_DISTANCE)
+    fields.update(kwargs)
+    return telemetry.Telemetry(**fields)
+
+
+def test_encode_decode():
+    frame = _telemetry()
+    data = telemetry.encode(frame)
+    assert len(data) == telemetry.FRAME_SIZE
+    assert telemetry.decode(data) == frame
+
+    # The counters wrap around.
+    frame = _telemetry(sequence=1 << 32, time_ms=(1 << 32) + 5)
+    decoded = telemetry.decode(telemetry.encode(frame))
+    assert (decoded.sequence, decoded.time_ms) == (0, 5)
+
+
+def test_decode_rejects_invalid_frames():
+    data = telemetry.encode(_telemetry())
+    assert telemetry.decode(data[:-1]) is None
+    assert telemetry.decode(b'\x00' + data[1:]) is None
+    assert telemetry.decode(data[:1] + b'\x00' + data[2:]) is None
+
+
+def test_fields():
+    assert telemetry._distance_to_field(float('nan')) \
+        == telemetry.UNKNOWN_DISTANCE
+    assert telemetry._distance_to_field(12.6) == 13
+    assert telemetry._distance_to_field(1e6) \
+        == telemetry.UNKNOWN_DISTANCE - 1
+    assert telemetry._motor_to_field(-0.505) == -50
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = network.UDPServer('127.0.0.1', 0)
+    _, port = server.socket.getsockname()
+    monkeypatch.setattr(network, 'TELEMETRY_PORT', port)
+    yield server
+    server.close()
+
+
+def _receive(server):
+    readable, _, _ = select.select([server.socket], [], [], 1.)
+    assert readable
+    data, = server.receive_batch(block=False)
+    return telemetry.decode(bytes(data))
+
+
+def test_publisher_sends_changes(server):
+    driver = _Driver()
+    publisher = telemetry.TelemetryPublisher(driver=driver,
+                                             remote_ip=lambda: '127.0.0.1',
+                                             robot_id=2)
+    try:
+        publisher.publish()
+        frame = _receive(server)
+        assert frame.changed == telemetry._ALL_CHANGED
+        assert frame.robot_id == 2
+        assert frame.line_state == telemetry.UNKNOWN_LINE
+
+        # Nothing changed, and the keyframe is not due.
+        publisher.publish()
+        readable, _, _ = select.select([server.socket], [], [], 0.05)
+        assert not readable
+
+        driver.motor_values = (0.5, 0.5)
+        publisher.publish()
+        frame = _receive(server)
+        assert frame.changed == telemetry.CHANGED_MOTORS
+        assert (frame.left, frame.right) == (50, 50)
+        assert frame.sequence == 2
+    finally:
+        publisher.close()
+
+
+def test_publisher_backs_off_unresolved_host(monkeypatch):
+    lookups = []
+
+    def _gethostbyname(host):
+        lookups.append(host)
+        raise socket.gaierror(socket.EAI_NONAME, 'Name not known')
+
+    monkeypatch.setattr(network.socket, 'gethostbyname', _gethostbyname)
+    publisher = telemetry.TelemetryPublisher(driver=_Driver(),
+                                             remote_ip=lambda: 'remote.lan')
+    try:
+        # The frames are dropped without looking the host up every time.
+        for _ in range(20):
+            publisher.publish()
+        assert lookups == ['remote.lan']
+        assert publisher._num_dropped == 20
+    finally:
+        publisher.close()
@@ -0,0 +1,188 @@
+import threading
+import time
+
+import pytest
+
+import robot.mock_gpio as mock_gpio
+import robot.sensor.ultrasonic as ultrasonic
+
+# (TRIG pin, ECHO pin) of the test sensors.
+_FRONT_PINS = (11, 7)
+_LEFT_PINS = (11, 9)
+_REAR_PINS = (25, 8)
+
+_MEASURE_INTERVAL_s = 20e-3
+
+# The echoes are timed across Python threads: on a loaded machine, they come
+# out up to several centimeters long.
+_TOLERANCE_cm = 15.
+
+
+def _sensor(pins, name, **kwargs):
+    trig_pin, echo_pin = pins
+    return ultrasonic.UltrasonicSensor(trig_pin=trig_pin,
+                                       echo_pin=echo_pin,
+                                       pulse_s=10e-6,
+                                       measure_interval_s=_MEASURE_INTERVAL_s,
+                                       name=name,
+                                       **kwargs)
+
+
+def _read(readings, num_readings):
+    """Returns the first readings of a read() generator.
+    """
+    stop_event = threading.Event()
+    results = []
+    for reading in readings(stop_event):
+        results.append(reading)
+        if len(results) == num_readings:
+            stop_event.set()
+    return results
+
+
+def test_array_groups_sensors_by_trig_pin(echoes):
+    sensors = [_sensor(_FRONT_PINS, 'Front'),
+               _sensor(_LEFT_PINS, 'Left'),
+               _sensor(_REAR_PINS, 'Rear')]
+    sensor_array = ultrasonic.UltrasonicArray(sensors)
+
+    # One time slot per TRIG pin, sharing the measure interval.
+    assert sensor_array._groups == [sensors[:2], sensors[2:]]
+    assert sensor_array._slot_s == pytest.approx(
+        sensors[0]._measure_interval_s / 2)
+
+
+def test_array_times_echoes_of_all_sensors(echoes):
+    distances_cm = {_FRONT_PINS: 50., _LEFT_PINS: 80., _REAR_PINS: 30.}
+    for pins, distance_cm in distances_cm.items():
+        echoes.set_distance(*pins, distance_cm)
+
+    sensors = {pins: _sensor(pins, name=str(pins))
+               for pins in distances_cm}
+    sensor_array = ultrasonic.UltrasonicArray(list(sensors.values()))
+    echoes.num_pings.clear()
+    readings = _read(sensor_array.read, num_readings=30)
+
+    measured_cm = {}
+    for sensor, distance_cm in readings:
+        measured_cm.setdefault(sensor, []).append(distance_cm)
+    for pins, sensor in sensors.items():
+        assert len(measured_cm[sensor]) >= 8
+        assert sorted(measured_cm[sensor])[len(measured_cm[sensor]) // 2] \
+            == pytest.approx(distances_cm[pins], abs=_TOLERANCE_cm)
+
+    # The sensors sharing a TRIG pin are fired by the same pulse, and the
+    # groups take turns.
+    assert abs(echoes.num_pings[_FRONT_PINS[0]]
+               - echoes.num_pings[_REAR_PINS[0]]) <= 1
+
+    # The edge detection is removed when reading stops.
+    assert not mock_gpio._edge_callbacks
+    sensor_array.close()
+
+
+def test_array_skips_lost_echoes(echoes):
+    echoes.set_distance(*_FRONT_PINS, 50.)
+    echoes.set_distance(*_REAR_PINS, None)
+    front_sensor = _sensor(_FRONT_PINS, 'Front')
+    rear_sensor = _sensor(_REAR_PINS, 'Rear')
+    sensor_array = ultrasonic.UltrasonicArray([front_sensor, rear_sensor])
+
+    readings = _read(sensor_array.read, num_readings=5)
+    assert {sensor for sensor, _ in readings} == {front_sensor}
+    sensor_array.close()
+
+
+def test_array_calls_range_callbacks(echoes):
+    echoes.set_distance(*_FRONT_PINS, 5.)
+    in_range = threading.Event()
+    sensor = _sensor(_FRONT_PINS, 'Front',
+                     distance_threshold_m=0.1,
+                     when_in_range=lambda distance_cm: in_range.set())
+    sensor_array = ultrasonic.UltrasonicArray([sensor])
+
+    _read(sensor_array.read, num_readings=3)
+    assert in_range.wait(1.)
+    sensor_array.close()
+
+
+def test_array_requires_sensors():
+    with pytest.raises(ValueError):
+        ultrasonic.UltrasonicArray([])
+
+
+@pytest.mark.parametrize('edge_timing', [False, True])
+def test_sensor_times_echo(echoes, edge_timing):
+    echoes.set_distance(*_FRONT_PINS, 60.)
+    sensor = _sensor(_FRONT_PINS, 'Front', edge_timing=edge_timing)
+
+    readings = _read(sensor.read, num_readings=9)
+    assert sorted(readings)[4] == pytest.approx(60., abs=_TOLERANCE_cm)
+    sensor.close()
+
+
+@pytest.mark.parametrize('edge_timing', [False, True])
+def test_sensor_keeps_measuring_after_lost_echo(echoes, edge_timing):
+    echoes.set_distance(*_FRONT_PINS, None)
+    sensor = _sensor(_FRONT_PINS, 'Front', edge_timing=edge_timing,
+                     max_range_m=1.)
+    threading.Timer(0.1, echoes.set_distance,
+                    args=(*_FRONT_PINS, 40.)).start()
+
+    # A lost echo costs about one echo timeout, not a stall.
+    start_s = time.monotonic()
+    readings = _read(sensor.read, num_readings=5)
+    assert time.monotonic() - start_s < 1.
+    assert sorted(readings)[2] == pytest.approx(40., abs=_TOLERANCE_cm)
+    assert echoes.num_pings[_FRONT_PINS[0]] >= 8
+    sensor.close()
+
+
+def test_edge_timing_runs_callbacks_in_dispatcher(echoes):
+    echoes.set_distance(*_FRONT_PINS, 5.)
+    callback_threads = []
+    in_range = threading.Event()
+
+    def when_in_range(distance_cm):
+        callback_threads.append(threading.current_thread())
+        in_range.set()
+
+    sensor = _sensor(_FRONT_PINS, 'Front', edge_timing=True,
+                     distance_threshold_m=0.1, when_in_range=when_in_range)
+    _read(sensor.read, num_readings=3)
+    assert in_range.wait(1.)
+    assert callback_threads[0] is not threading.current_thread()
+    assert not mock_gpio._edge_callbacks
+    sensor.close()
+
+
+def test_pace_skips_intervals(echoes):
+    pace = [3]
+    sensor = _sensor(_FRONT_PINS, 'Front', pace=lambda: pace[0])
+
+    # The first measurement is always due.
+    due = [sensor._due() for _ in range(7)]
+    assert due == [True, False, False, True, False, False, True]
+
+    # A faster pace applies within an interval.
+    pace[0] = 10
+    assert not any(sensor._due() for _ in range(5))
+    pace[0] = 1
+    assert sensor._due()
+    sensor.close()
+
+
+def test_paced_sensor_pings_less_often(echoes):
+    echoes.set_distance(*_FRONT_PINS, 30.)
+    sensor = _sensor(_FRONT_PINS, 'Front', edge_timing=True, pace=lambda: 3)
+    echoes.num_pings.clear()
+
+    start_s = time.monotonic()
+    _read(sensor.read, num_readings=4)
+    elapsed_s = time.monotonic() - start_s
+
+    # Three measure intervals between the measurements, whose echoes are
+    # rarely lost.
+    assert 4 <= echoes.num_pings[_FRONT_PINS[0]] <= 5
+    assert elapsed_s >= 9 * sensor._measure_interval_s
+    sensor.close()
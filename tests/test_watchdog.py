@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+import robot.devices.remote.watchdog as watchdog
+
+
+class _Clock:
+    """Replaces the time module of the watchdog, to control the monotonic
+    clock.
+    """
+
+    def __init__(self):
+        self.now_s = 0.
+
+    def monotonic(self):
+        return self.now_s
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(watchdog, 'time', clock)
+    return clock
+
+
+def _receive_packets(link_watchdog, clock, interval_s, num_packets,
+                     heartbeat=True):
+    for _ in range(num_packets):
+        clock.now_s += interval_s
+        link_watchdog.packet_received(heartbeat=heartbeat)
+
+
+def test_timeout_starts_at_upper_bound(clock):
+    link_watchdog = watchdog.LinkWatchdog(on_timeout=lambda: None,
+                                          min_timeout_s=0.2,
+                                          max_timeout_s=1.)
+    assert link_watchdog.timeout_s == 1.
+
+    # The first packet gives no interval yet.
+    link_watchdog.packet_received()
+    assert link_watchdog.timeout_s == 1.
+
+
+def test_timeout_adapts_within_bounds(clock):
+    link_watchdog = watchdog.LinkWatchdog(on_timeout=lambda: None,
+                                          min_timeout_s=0.2,
+                                          max_timeout_s=1.)
+
+    # A steady, fast heartbeat hits the lower bound.
+    _receive_packets(link_watchdog, clock, interval_s=0.01, num_packets=100)
+    assert link_watchdog.timeout_s == 0.2
+
+    # A slow heartbeat hits the upper bound.
+    _receive_packets(link_watchdog, clock, interval_s=0.5, num_packets=100)
+    assert link_watchdog.timeout_s == 1.
+
+    # In between, three intervals plus the jitter.
+    _receive_packets(link_watchdog, clock, interval_s=0.1, num_packets=100)
+    assert 0.3 <= link_watchdog.timeout_s < 0.35
+
+
+def test_packets_without_heartbeat_reset_timeout(clock):
+    link_watchdog = watchdog.LinkWatchdog(on_timeout=lambda: None,
+                                          min_timeout_s=0.2,
+                                          max_timeout_s=1.)
+    _receive_packets(link_watchdog, clock, interval_s=0.01, num_packets=100)
+    assert link_watchdog.timeout_s == 0.2
+
+    _receive_packets(link_watchdog, clock, interval_s=0.01, num_packets=10,
+                     heartbeat=False)
+    assert link_watchdog.timeout_s == 1.
+
+
+def test_loss_rate():
+    link_watchdog = watchdog.LinkWatchdog(on_timeout=lambda: None)
+    for sequence in range(0, 2000, 2):
+        link_watchdog.sequence_received(sequence)
+
+    # Every other packet lost.
+    assert link_watchdog.link_quality['loss_rate'] == pytest.approx(0.5)
+
+
+def test_loss_rate_across_wrap_around():
+    link_watchdog = watchdog.LinkWatchdog(on_timeout=lambda: None)
+    link_watchdog.sequence_received((1 << 32) - 1)
+    link_watchdog.sequence_received(0)
+    assert link_watchdog.link_quality['loss_rate'] == 0.
+
+
+def test_fires_once_when_link_breaks():
+    timeouts = []
+    link_watchdog = watchdog.LinkWatchdog(
+        on_timeout=lambda: timeouts.append(True),
+        min_timeout_s=0.02,
+        max_timeout_s=0.05)
+
+    async def receive_then_stop():
+        task = asyncio.ensure_future(link_watchdog.run())
+        for _ in range(10):
+            link_watchdog.packet_received()
+            await asyncio.sleep(0.01)
+        assert not timeouts
+
+        # The watchdog fires once, then waits for the next packet.
+        await asyncio.sleep(0.2)
+        task.cancel()
+
+    asyncio.run(receive_then_stop())
+    assert len(timeouts) == 1
+    assert link_watchdog.link_quality['num_timeouts'] == 1
+
+
+def test_loss_rate_ignores_late_and_duplicated_packets():
+    link_watchdog = watchdog.LinkWatchdog(on_timeout=lambda: None)
+    for sequence in range(1000):
+        link_watchdog.sequence_received(sequence)
+        link_watchdog.sequence_received(sequence)
+        link_watchdog.sequence_received(sequence - 5)
+    assert link_watchdog.link_quality['loss_rate'] == 0.
+
+    # A new sender restarts the count.
+    link_watchdog.sequence_received(None)
+    link_watchdog.sequence_received(10)
+    assert link_watchdog.link_quality['loss_rate'] == 0.